@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'vacation.metrics.MetricsMiddleware',  # first, so its timing covers the rest
+    'vacation.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +80,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # File-backed test database: the in-memory one is shared-cache and fails
+        # concurrent writers with "table is locked", which the concurrency tests need
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Stand-in read replica for trying DATABASE_REPLICAS locally: a second SQLite file kept
+    # in step with `manage.py sync_replica` (create it with `manage.py migrate --database replica`)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+    },
 }
 
+DATABASE_ROUTERS = ['vacation.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -122,3 +136,92 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Vacation approval workflow
+
+# Workflow system integration (vacation/integration.py)
+WORKFLOW_TOKEN_URL = 'http://127.0.0.1:8000/api/token/'
+WORKFLOW_USERNAME = 'admin'
+WORKFLOW_PASSWORD = '123456'
+WORKFLOW_CREATE_URL = 'https://example/url'
+WORKFLOW_RELATED_KEY = '123456'
+WORKFLOW_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+WORKFLOW_POOL_SIZE = 16
+WORKFLOW_RETRIES = 3
+WORKFLOW_TOKEN_REFRESH_MARGIN = 60  # refresh this many seconds before the JWT expires
+
+APPROVAL_RESULTS_URL = 'http://external.api/approval_results'
+
+# Shared secret for the approval_callback webhook. When set, the poller only
+# runs every APPROVAL_POLL_RECONCILE_INTERVAL seconds as a fallback.
+APPROVAL_CALLBACK_SECRET = ''
+
+# Poller tuning (vacation/poller.py); intervals are in seconds
+APPROVAL_POLL_CONCURRENCY = 8
+APPROVAL_POLL_BATCH_SIZE = 1  # > 1 only if the upstream accepts ?ticket_ids=a,b,c
+APPROVAL_POLL_TIMEOUT = (3.05, 10)  # (connect, read)
+APPROVAL_POLL_MIN_INTERVAL = 60
+APPROVAL_POLL_MAX_INTERVAL = 3600
+APPROVAL_POLL_RECONCILE_INTERVAL = 1800
+
+# Workflow ticket outbox (vacation/outbox.py); delays are in seconds
+WORKFLOW_OUTBOX_WORKERS = 4
+WORKFLOW_OUTBOX_BATCH_SIZE = 20
+WORKFLOW_OUTBOX_MAX_ATTEMPTS = 8
+WORKFLOW_OUTBOX_LEASE = 300
+WORKFLOW_OUTBOX_RETRY_DELAY = 30
+WORKFLOW_OUTBOX_MAX_RETRY_DELAY = 3600
+
+# Yearly quota rollover (manage.py rollover_quotas): (min workyear, min cmbyear, days),
+# in years of service after the rollover; the first matching rule wins, otherwise 0 days
+QUOTA_ENTITLEMENT_RULES = [
+    (20, 0, 15),
+    (10, 0, 10),
+    (1, 0, 5),
+]
+
+# Working-day calendar (vacation/workdays.py): seconds before a process reloads a
+# year from SpecialHoliday; changes made in the same process apply immediately
+WORKDAY_CALENDAR_TTL = 300
+
+# Optional per-team staffing limit checked on submit: at most max_off members
+# on pending or approved leave on the same day, e.g.
+# {'运维组': {'members': ['张三', '李四', '王五'], 'max_off': 1}}
+LEAVE_STAFFING_TEAMS = {}
+
+# Per-user quota / leave history cache (vacation/usercache.py). locmem is per process:
+# with several web workers, or with poll_approvals / import_quotas / rollover_quotas
+# running as separate processes, point USER_CACHE_ALIAS at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) so their invalidations are seen
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 300
+
+# Approver pending-queue stream (vacation/pubsub.py, views.pending_stream / pending_poll).
+# In-process: publishes from other processes (e.g. manage.py poll_approvals) aren't seen.
+PENDING_STREAM_HEARTBEAT = 15  # seconds between SSE keepalive comments
+PENDING_STREAM_MAX_DURATION = 300  # seconds before a stream ends and the browser reconnects
+PENDING_STREAM_RETRY_MS = 3000
+PENDING_STREAM_HISTORY = 1000  # messages kept for Last-Event-ID / ?after= replay
+PENDING_STREAM_QUEUE_SIZE = 1000  # per-client backlog before it is sent a reset
+PENDING_STREAM_LONG_POLL_TIMEOUT = 25
+
+# Request / background-task metrics served at /metrics (vacation/metrics.py). The
+# fraction of requests whose latency, SQL and size are recorded: 0 turns it off,
+# request counts are always kept. Numbers are per process.
+METRICS_SAMPLE_RATE = 1.0
+
+# Read replicas (vacation/routers.py): DATABASES aliases the read-only views may query,
+# e.g. ['replica']; writes and everything else use 'default'. A replica is skipped while
+# its heartbeat is more than REPLICA_MAX_LAG_SECONDS old or its copy of the version stamps
+# of the tables a view reads is behind the primary's, and for REPLICA_STICKY_SECONDS after
+# a client's own write (cookie).
+DATABASE_REPLICAS = []
+REPLICA_MAX_LAG_SECONDS = 10
+REPLICA_CHECK_INTERVAL = 1  # seconds between heartbeat writes / replica checks, per process
+REPLICA_STICKY_SECONDS = 10
@@ -17,6 +17,43 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from vacation import async_views, views
+
+# Read endpoints served by both paths: vacation/<name> (sync views, WSGI or ASGI) and
+# vacation/async/<name> (async ORM, for asgi.py)
+READ_VIEWS = [
+    'get_vacation_list',
+    'vacation_quota_list',
+    'get_approve_vacation_list',
+    'get_user_vacation_info',
+    'get_user_holiday_info',
+    'team_calendar',
+]
+# Sync only
+VIEWS = [
+    'submit_vacation',
+    'revoke_vacation',
+    'delete_vacation',
+    'approve_vacation',
+    'batch_approve_vacation',
+    'create_vacation_times',
+    'import_vacation_times',
+    'update_vacation_times',
+    'delete_vacation_times',
+    'approval_callback',
+    'leave_usage_report',
+    'working_days',
+    'get_changes',
+    'user_cache_stats',
+    'quota_balance',
+]
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics),
+    *(path(f'vacation/{name}', getattr(views, name)) for name in READ_VIEWS + VIEWS),
+    *(path(f'vacation/async/{name}', getattr(async_views, name)) for name in READ_VIEWS),
+    # Long-lived async endpoints for approvers; serve through asgi.py
+    path('vacation/pending/stream', views.pending_stream),
+    path('vacation/pending/poll', views.pending_poll),
 ]
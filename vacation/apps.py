@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class VacationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vacation'
+
+    def ready(self):
+        # Registers the SpecialHoliday signals that invalidate the working-day calendar
+        from . import workdays  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_hook
+        connection_created.connect(install_query_hook, dispatch_uid='vacation.metrics.install_query_hook')
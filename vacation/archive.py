@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import HolidayEvent, HolidayEventArchive, LeaveDay, LeaveDayArchive
+from .usercache import user_cache
+from .versions import stamps
+
+# 同意 / 拒绝 / 撤销: no longer changed by anything but an admin delete
+CLOSED_STATUSES = (2, 3, 4)
+ARCHIVE_CHUNK_SIZE = 1000
+
+
+def copy_rows(queryset, target):
+    """Copy every row of ``queryset`` into ``target`` (same columns) with one ``INSERT ... SELECT``."""
+    fields = target._meta.concrete_fields
+    select, params = queryset.values_list(*[field.attname for field in fields]).query.sql_with_params()
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f'INSERT INTO {connection.ops.quote_name(target._meta.db_table)} ({columns}) {select}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def hot_years():
+    # Archived events all ended before this year, so queries within it never need the archive
+    return timezone.localdate().year
+
+
+class EventArchiver:
+    """Moves closed events whose leave ended before ``before_year`` into holiday_events_archive.
+
+    Chunks of ``chunk_size`` events are moved (together with their LeaveDay rows) in one
+    transaction each: copy, then delete from the hot tables. A run that stops part way keeps
+    every finished chunk, and the next run carries on from there, since archived events are no
+    longer candidates. The change log isn't written: the rows didn't change, and changes_since()
+    still finds them in the archive.
+    """
+
+    def __init__(self, before_year=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+        self.before_year = before_year if before_year is not None else hot_years()
+        if self.before_year > hot_years():
+            raise ValueError(f'Only past years can be archived, not {self.before_year}')
+        self.chunk_size = chunk_size
+
+    def candidates(self):
+        cutoff = date(self.before_year, 1, 1)
+        return HolidayEvent.objects.filter(
+            holidayevents_ispermit__in=CLOSED_STATUSES,
+            holidayevents_addtime__lt=timezone.make_aware(datetime(self.before_year, 1, 1)),
+        ).exclude(leave_days__leaveday_date__gte=cutoff)
+
+    def archive_chunk(self):
+        """Move the next chunk; returns the number of events moved (0 when done)."""
+        with transaction.atomic():
+            chunk = list(self.candidates().order_by('holidayevents_id')
+                         .values_list('holidayevents_id', 'holidayevents_hname')[:self.chunk_size])
+            if not chunk:
+                return 0
+            ids = [pk for pk, _ in chunk]
+            events = HolidayEvent.objects.filter(pk__in=ids)
+            copy_rows(events, HolidayEventArchive)
+            copy_rows(LeaveDay.objects.filter(leaveday_event__in=ids), LeaveDayArchive)
+            # Cascades to LeaveDay, ApprovalSchedule and WorkflowOutbox
+            events.delete()
+            # The default (hot-only) lists lose these rows
+            user_cache.invalidate(*{user for _, user in chunk})
+            stamps.bump('events')
+        return len(ids)
+
+    def run(self, max_chunks=None):
+        """Archive chunk by chunk until nothing is left (or ``max_chunks``); returns the number moved."""
+        moved = chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            count = self.archive_chunk()
+            if not count:
+                break
+            moved += count
+            chunks += 1
+        return moved
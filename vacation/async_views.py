@@ -0,0 +1,178 @@
+"""Async versions of the read endpoints in views.py, for the ASGI path (main/asgi.py).
+
+Same parameters, responses and conditional-GET headers as the sync views; the rows come from
+the async ORM and the user cache / version stamps through the async cache API. Like the sync
+views, include_archived= / year= add the archive tables to the event lists.
+"""
+from datetime import date
+from functools import wraps
+
+from django.http import HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .archive import hot_years
+from .models import HolidayEvent, HolidayTimes, LeaveDay, LeaveDayArchive
+from . import codec
+from .pagination import amerge, amerge_rows, amerged_keyset_page, astream_list, parse_limit
+from .routers import replica_reads
+from .usercache import user_cache
+from .versions import etag_for, last_modified_for, stamps
+from .views import MAX_CALENDAR_DAYS, STATUS_BAD_REQUEST, archive_scope, event_querysets, json_response
+
+
+# csrf_exempt and require_http_methods only learn to wrap async views in Django 5.0; these are
+# GET-only, so CSRF doesn't apply and the method check is done here
+
+def aconditional(*tables):
+    # Async counterpart of views.conditional()
+    def decorator(view):
+        view = replica_reads(*tables)(view)
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return HttpResponseNotAllowed(['GET'])
+            current = await stamps.afor_request(request, *tables)
+            etag = quote_etag(etag_for(request, current))
+            last_modified = last_modified_for(current)
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            response.headers.setdefault('ETag', etag)
+            patch_vary_headers(response, ['Accept'])
+            return response
+        return wrapper
+    return decorator
+
+
+def all_rows(querysets, time_field, id_field):
+    order = (f'-{time_field}', f'-{id_field}')
+    return amerge_rows(time_field, id_field, *(queryset.order_by(*order).values() for queryset in querysets))
+
+
+async def list_response(request, querysets, key, time_field, id_field):
+    # ``querysets``: the same query on one or more tables (hot + archive), merged newest first
+    limit = request.GET.get('limit')
+    after = request.GET.get('after')
+    try:
+        fmt = codec.negotiate(request)
+        columns = codec.parse_fields(request, querysets[0].model)
+        if limit is not None or after is not None:
+            rows, next_cursor = await amerged_keyset_page(querysets, time_field, id_field, parse_limit(limit),
+                                                          after, columns)
+            return json_response({key: codec.shape(fmt, rows, columns), 'next_cursor': next_cursor}, fmt=fmt)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    if fmt.streams():
+        return astream_list(fmt, key, querysets, time_field, id_field, columns)
+    # MessagePack is built in one go
+    rows = [row async for row in all_rows(querysets, time_field, id_field)]
+    return json_response({key: codec.shape(fmt, rows, columns)}, fmt=fmt)
+
+
+async def cached_list_response(request, username, querysets, key, time_field, id_field, scope=''):
+    if request.GET.get('after'):
+        return await list_response(request, querysets, key, time_field, id_field)
+    limit = request.GET.get('limit')
+    try:
+        fmt = codec.negotiate(request)
+        columns = codec.parse_fields(request, querysets[0].model)
+        limit = parse_limit(limit) if limit is not None else None
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+
+    async def load():
+        if limit is None:
+            return {key: [row async for row in all_rows(querysets, time_field, id_field)]}
+        rows, next_cursor = await amerged_keyset_page(querysets, time_field, id_field, limit)
+        return {key: rows, 'next_cursor': next_cursor}
+
+    data = dict(await user_cache.aget_or_load(username, f'{key}:{limit or "all"}{scope}', load))
+    data[key] = codec.shape(fmt, data[key], columns)
+    return json_response(data, fmt=fmt)
+
+
+@aconditional('events')
+async def get_vacation_list(request):
+    try:
+        querysets = event_querysets(request)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    return await list_response(request, querysets, 'vacation_list', 'holidayevents_addtime', 'holidayevents_id')
+
+
+@aconditional('quotas')
+async def vacation_quota_list(request):
+    return await list_response(request, [HolidayTimes.objects.all()], 'vacation_quota',
+                               'holidaytimes_addtime', 'holidaytimes_id')
+
+
+@aconditional('events')
+async def get_approve_vacation_list(request):
+    # Pending events are never archived
+    return await list_response(request, [HolidayEvent.objects.filter(holidayevents_ispermit=1)], 'vacation_list',
+                               'holidayevents_addtime', 'holidayevents_id')
+
+
+@aconditional('events')
+async def get_user_vacation_info(request):
+    username = request.GET.get('username')
+    if not username:
+        return json_response({'error': 'Missing username parameter'}, status=STATUS_BAD_REQUEST)
+    try:
+        vacation_info = event_querysets(request, holidayevents_hname=username)
+        include_archived, year = archive_scope(request)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    scope = (':archived' if include_archived else '') + (f':{year}' if year else '')
+    return await cached_list_response(request, username, vacation_info, 'vacation_info',
+                                      'holidayevents_addtime', 'holidayevents_id', scope)
+
+
+@aconditional('quotas')
+async def get_user_holiday_info(request):
+    username = request.GET.get('opname')
+    if not username:
+        return json_response({'error': 'Missing opname parameter'}, status=STATUS_BAD_REQUEST)
+    holiday_info = [HolidayTimes.objects.filter(holidaytimes_opname=username)]
+    return await cached_list_response(request, username, holiday_info, 'holiday_info',
+                                      'holidaytimes_addtime', 'holidaytimes_id')
+
+
+@aconditional('events')
+async def team_calendar(request):
+    try:
+        start = date.fromisoformat(request.GET.get('start', ''))
+        end = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        return json_response({'error': 'start and end must be YYYY-MM-DD'}, status=STATUS_BAD_REQUEST)
+    if end < start or (end - start).days > MAX_CALENDAR_DAYS:
+        return json_response({'error': f'Date range must be 0-{MAX_CALENDAR_DAYS} days'}, status=STATUS_BAD_REQUEST)
+
+    statuses = [2] if request.GET.get('include_pending') == '0' else [1, 2]
+    users = [u for u in request.GET.get('users', '').split(',') if u]
+    # Ranges reaching into archived (past) years also read leave_day_archive
+    sources = [LeaveDay, LeaveDayArchive] if start.year < hot_years() else [LeaveDay]
+    parts = []
+    for source in sources:
+        leave_days = source.objects.filter(
+            leaveday_date__range=(start, end),
+            leaveday_event__holidayevents_ispermit__in=statuses,
+        )
+        if users:
+            leave_days = leave_days.filter(leaveday_user__in=users)
+        parts.append(leave_days.order_by('leaveday_date', 'leaveday_user').values_list(
+            'leaveday_date', 'leaveday_user', 'leaveday_event_id',
+            'leaveday_event__holidayevents_htype', 'leaveday_event__holidayevents_ispermit',
+        ))
+
+    calendar = {}
+    async for day, user, event_id, htype, ispermit in amerge(*parts, key=lambda row: row[:2]):
+        calendar.setdefault(day.isoformat(), []).append(
+            {'username': user, 'vacation_id': event_id, 'leave_type': htype, 'ispermit': ispermit}
+        )
+    return json_response({'start': start.isoformat(), 'end': end.isoformat(), 'calendar': calendar})
@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ChangeConsumer, ChangeLog, ChangeLogCompaction, HolidayEvent, HolidayEventArchive, HolidayTimes
+
+# Archived events keep their id, so entries logged before archive_events moved them still resolve
+TABLE_MODELS = {
+    ChangeLog.TABLE_EVENT: (HolidayEvent, HolidayEventArchive),
+    ChangeLog.TABLE_QUOTA: (HolidayTimes,),
+}
+COMPACT_CHUNK_SIZE = 10000
+
+
+class ChangesCompacted(Exception):
+    pass
+
+
+# Writers call these inside the transaction that changes the rows, so a change is logged
+# exactly when it commits.
+
+def log_keys(table, keys, op=ChangeLog.OP_UPSERT):
+    now = timezone.now()
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(change_table=table, change_key=key, change_op=op, change_at=now) for key in keys])
+
+
+def log_rows(table, queryset, op=ChangeLog.OP_UPSERT):
+    """Log every row of ``queryset`` with one ``INSERT ... SELECT``, without fetching the ids."""
+    select, params = queryset.values_list('pk').query.sql_with_params()
+    c = {name: connection.ops.quote_name(ChangeLog._meta.get_field(name).column)
+         for name in ('change_table', 'change_op', 'change_at', 'change_key')}
+    sql = (f'INSERT INTO {connection.ops.quote_name(ChangeLog._meta.db_table)} '
+           f'({c["change_table"]}, {c["change_op"]}, {c["change_at"]}, {c["change_key"]}) '
+           f'SELECT %s, %s, %s, changed.* FROM ({select}) changed')
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table, op, now, *params])
+
+
+def horizon():
+    # Entries up to here have been compacted away
+    return ChangeLogCompaction.objects.aggregate(seq=Max('compaction_seq'))['seq'] or 0
+
+
+def changes_since(since, limit):
+    """Up to ``limit`` log entries after ``since``, as upsert records carrying the current row or deletes.
+
+    Several entries for the same row in one page collapse into the last one, so applying the
+    records in order always leaves a mirror in the same state as the tables.
+    """
+    if since < horizon():
+        raise ChangesCompacted(f'Changes up to {horizon()} have been compacted; resync from the full lists')
+    entries = list(ChangeLog.objects.filter(change_seq__gt=since).order_by('change_seq')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest[(entry.change_table, entry.change_key)] = entry
+    rows = {}
+    for table, models in TABLE_MODELS.items():
+        keys = [key for t, key in latest if t == table]
+        for model in models:
+            if keys:
+                pk = model._meta.pk.name
+                rows.setdefault(table, {}).update(
+                    (row[pk], row) for row in model.objects.filter(pk__in=keys).values())
+                keys = [key for key in keys if key not in rows[table]]
+
+    records = []
+    for entry in sorted(latest.values(), key=lambda e: e.change_seq):
+        record = {'seq': entry.change_seq, 'table': entry.change_table, 'id': entry.change_key}
+        data = rows.get(entry.change_table, {}).get(entry.change_key)
+        if entry.change_op == ChangeLog.OP_UPSERT and data is not None:
+            record.update(op=ChangeLog.OP_UPSERT, data=data)
+        else:
+            # Deleted since, possibly in a later entry not on this page
+            record['op'] = ChangeLog.OP_DELETE
+        records.append(record)
+    return {
+        'changes': records,
+        'next_since': entries[-1].change_seq if entries else since,
+        'has_more': has_more,
+    }
+
+
+def record_consumer(name, since):
+    # A consumer asking for changes after ``since`` has applied everything up to it
+    ChangeConsumer.objects.bulk_create(
+        [ChangeConsumer(consumer_name=name, consumer_seq=since, consumer_seen_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['consumer_name'],
+        update_fields=['consumer_seq', 'consumer_seen_at'],
+    )
+
+
+class Compaction:
+    """Deletes log entries every known consumer has passed.
+
+    Consumers not seen for ``stale_days`` are ignored (they get a 410 and resync if they come
+    back). The newest entry is always kept, because SQLite reuses the rowid of a deleted tail.
+    """
+
+    def __init__(self, stale_days=None, chunk_size=COMPACT_CHUNK_SIZE):
+        self.stale_days = stale_days
+        self.chunk_size = chunk_size
+
+    def consumers(self):
+        consumers = ChangeConsumer.objects.all()
+        if self.stale_days is not None:
+            consumers = consumers.filter(consumer_seen_at__gte=timezone.now() - timedelta(days=self.stale_days))
+        return consumers
+
+    def target(self):
+        """The seq everything up to which can be deleted, or None if there is nothing to do."""
+        low = self.consumers().aggregate(seq=Min('consumer_seq'))['seq']
+        last = ChangeLog.objects.aggregate(seq=Max('change_seq'))['seq']
+        if low is None or last is None:
+            return None
+        target = min(low, last - 1)
+        return target if target > horizon() else None
+
+    def run(self):
+        target = self.target()
+        if target is None:
+            return None, 0
+        # Record the horizon before deleting anything, so a crash part way through still
+        # sends clients behind it to a full resync instead of silently skipping entries
+        compaction = ChangeLogCompaction.objects.create(
+            compaction_seq=target, compaction_deleted=0, compaction_at=timezone.now())
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                seqs = list(ChangeLog.objects.filter(change_seq__lte=target).order_by('change_seq')
+                            .values_list('change_seq', flat=True)[:self.chunk_size])
+                if not seqs:
+                    break
+                deleted += ChangeLog.objects.filter(change_seq__gte=seqs[0], change_seq__lte=seqs[-1]).delete()[0]
+        compaction.compaction_deleted = deleted
+        compaction.save(update_fields=['compaction_deleted'])
+        return target, deleted
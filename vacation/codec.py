@@ -0,0 +1,124 @@
+"""Response / request body encoding.
+
+orjson when it is installed, else the standard library, with the same output either way
+(datetimes as DjangoJSONEncoder writes them). List endpoints also speak a columnar format,
+``{"columns": [...], "rows": [[...], ...]}`` in place of each list of row dicts, as JSON or (with
+msgpack installed) MessagePack; clients ask for it with ``Accept`` or ``?format=``.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def default(value):
+    # datetime / date / Decimal / UUID, as DjangoJSONEncoder writes them
+    return encoder.default(value)
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data):
+        return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+
+    def loads(body):
+        # orjson.JSONDecodeError is a json.JSONDecodeError
+        return orjson.loads(body)
+else:
+    def dumps(data):
+        return encoder.encode(data).encode()
+
+    def loads(body):
+        return json.loads(body)
+
+
+class Format:
+    def __init__(self, name, content_type, columnar, encode):
+        self.name = name
+        self.content_type = content_type
+        self.columnar = columnar
+        self.encode = encode
+
+    def streams(self):
+        # The full-list JSON formats are written row by row; MessagePack needs the row count up front
+        return self.encode is dumps
+
+
+def msgpack_dumps(data):
+    return msgpack.packb(data, default=default, use_bin_type=True)
+
+
+JSON = Format('json', 'application/json', False, dumps)
+COLUMNAR = Format('columnar', 'application/vnd.vacation.columnar+json', True, dumps)
+FORMATS = [JSON, COLUMNAR]
+if msgpack is not None:
+    FORMATS.append(Format('msgpack', 'application/vnd.vacation.columnar+msgpack', True, msgpack_dumps))
+
+
+def negotiate(request):
+    """The Format asked for by ``?format=`` or else ``Accept``; JSON when nothing else matches."""
+    name = request.GET.get('format')
+    if name:
+        for fmt in FORMATS:
+            if fmt.name == name:
+                return fmt
+        raise ValueError(f'Unknown format: {name} (one of {", ".join(fmt.name for fmt in FORMATS)})')
+    accept = request.headers.get('Accept', '')
+    for fmt in FORMATS[1:]:
+        if fmt.content_type in accept:
+            return fmt
+    return JSON
+
+
+def parse_fields(request, model):
+    """The columns named in ``?fields=a,b`` (all of ``model``'s when absent); raises ValueError."""
+    names = [field.attname for field in model._meta.concrete_fields]
+    fields = [name for name in request.GET.get('fields', '').split(',') if name]
+    unknown = [name for name in fields if name not in names]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields or names
+
+
+def shape(fmt, rows, columns):
+    """``rows`` (values() dicts, possibly with extra keys) as ``fmt`` lays out a list."""
+    if fmt.columnar:
+        return {'columns': columns, 'rows': [[row[column] for column in columns] for row in rows]}
+    return [row if len(row) == len(columns) else {column: row[column] for column in columns} for row in rows]
+
+
+def list_opening(fmt, key, columns):
+    opening = b'{"columns": ' + dumps(columns) + b', "rows": [' if fmt.columnar else b'['
+    return b'{' + dumps(key) + b': ' + opening
+
+
+def list_closing(fmt):
+    return b']}}' if fmt.columnar else b']}'
+
+
+def encode_row(fmt, row, columns):
+    if fmt.columnar:
+        return dumps([row[column] for column in columns])
+    return dumps(row if len(row) == len(columns) else {column: row[column] for column in columns})
+
+
+def iter_list(fmt, key, rows, columns):
+    """Chunks of ``{key: <list>}`` in a streaming ``fmt``, without holding ``rows`` in memory."""
+    yield list_opening(fmt, key, columns)
+    first = True
+    for row in rows:
+        yield encode_row(fmt, row, columns) if first else b',' + encode_row(fmt, row, columns)
+        first = False
+    yield list_closing(fmt)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db.models import Count
+
+from .models import LeaveDay
+
+# Pending and approved requests occupy their days; rejected and revoked ones don't
+ACTIVE_STATUSES = (1, 2)
+
+
+def active_leave_days(dates):
+    return LeaveDay.objects.filter(leaveday_date__in=dates, leaveday_event__holidayevents_ispermit__in=ACTIVE_STATUSES)
+
+
+def overlapping_dates(username, dates):
+    """Dates in ``dates`` the user already has pending or approved leave on (one index lookup)."""
+    days = active_leave_days(dates).filter(leaveday_user=username)
+    return sorted(set(days.values_list('leaveday_date', flat=True)))
+
+
+def user_teams(username):
+    # LEAVE_STAFFING_TEAMS = {'运维组': {'members': ['张三', '李四', ...], 'max_off': 2}, ...}
+    teams = getattr(settings, 'LEAVE_STAFFING_TEAMS', {})
+    return [(name, team) for name, team in teams.items() if username in team.get('members', ())]
+
+
+def overstaffed_dates(username, dates):
+    """``{team: [dates]}`` where adding ``username`` would put more than ``max_off`` teammates on leave.
+
+    One GROUP BY query per team the user belongs to (normally just one).
+    """
+    full = {}
+    for name, team in user_teams(username):
+        others = [member for member in team['members'] if member != username]
+        counts = (active_leave_days(dates).filter(leaveday_user__in=others)
+                  .values('leaveday_date').annotate(off=Count('leaveday_user', distinct=True))
+                  .filter(off__gte=team['max_off']).values_list('leaveday_date', flat=True))
+        days = sorted(counts)
+        if days:
+            full[name] = days
+    return full
@@ -0,0 +1,269 @@
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import Counter
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import httpx_request_hook, httpx_response_hook, requests_hook
+
+try:
+    import httpx
+except ImportError:  # Optional: without it AsyncWorkflowClient runs the requests session in threads
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowError(Exception):
+    pass
+
+
+def workflow_setting(name, default):
+    return getattr(settings, f'WORKFLOW_{name}', default)
+
+
+def jwt_expiry(token):
+    # Reads "exp" from the JWT payload without verifying it; None if the token is not a JWT
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenCache:
+    """Caches a service token until shortly before its JWT expiry.
+
+    Inside the refresh margin one caller refreshes while the others keep using the still-valid
+    token; once it has expired, callers block on the same lock, so the token endpoint sees a
+    single request either way.
+    """
+
+    def __init__(self, fetch, refresh_margin=60, default_ttl=300, counters=None):
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.counters = counters if counters is not None else Counter()
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0
+
+    def get(self):
+        now = time.time()
+        token, expires_at = self.token, self.expires_at
+        if token and now < expires_at - self.refresh_margin:
+            return token
+        if token and now < expires_at:
+            # Refresh ahead: whoever gets the lock refreshes, everyone else keeps the current token
+            if self.lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception('Error refreshing service token')
+                finally:
+                    self.lock.release()
+            return self.token
+        with self.lock:
+            if not self.token or time.time() >= self.expires_at - self.refresh_margin:
+                self.refresh()
+            return self.token
+
+    def refresh(self):
+        token = self.fetch()
+        self.counters['token_refreshes'] += 1
+        self.token = token
+        self.expires_at = jwt_expiry(token) or time.time() + self.default_ttl
+
+    def invalidate(self):
+        with self.lock:
+            self.token = None
+            self.expires_at = 0
+
+
+class AsyncTokenCache(TokenCache):
+    """TokenCache for the event loop: same refresh-ahead rules, ``fetch`` is a coroutine function.
+
+    A refresh inside the margin runs as a background task while callers keep the current token;
+    after expiry callers wait on one asyncio.Lock, so there is still a single request in flight.
+    """
+
+    def __init__(self, fetch, refresh_margin=60, default_ttl=300, counters=None):
+        super().__init__(fetch, refresh_margin, default_ttl, counters)
+        self.lock = asyncio.Lock()
+        self.refresh_task = None
+
+    async def get(self):
+        now = time.time()
+        token, expires_at = self.token, self.expires_at
+        if token and now < expires_at - self.refresh_margin:
+            return token
+        if token and now < expires_at:
+            if not self.lock.locked() and (self.refresh_task is None or self.refresh_task.done()):
+                self.refresh_task = asyncio.create_task(self.refresh_ahead())
+            return self.token
+        async with self.lock:
+            if not self.token or time.time() >= self.expires_at - self.refresh_margin:
+                await self.refresh()
+            return self.token
+
+    async def refresh_ahead(self):
+        async with self.lock:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('Error refreshing service token')
+
+    async def refresh(self):
+        token = await self.fetch()
+        self.counters['token_refreshes'] += 1
+        self.token = token
+        self.expires_at = jwt_expiry(token) or time.time() + self.default_ttl
+
+    def invalidate(self):
+        self.token = None
+        self.expires_at = 0
+
+
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(pool_size=None, timeout=None, retries=None):
+    pool_size = pool_size or workflow_setting('POOL_SIZE', 16)
+    retry = Retry(
+        total=retries if retries is not None else workflow_setting('RETRIES', 3),
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        # Connection failures are retried for any method; status/read retries only for idempotent ones
+        allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = TimeoutSession(timeout or workflow_setting('TIMEOUT', (3.05, 10)))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.hooks['response'].append(requests_hook)
+    return session
+
+
+class WorkflowClient:
+    """Pooled HTTP session plus cached service token for the workflow system."""
+
+    def __init__(self, session=None):
+        self.counters = Counter()
+        self.session = session or build_session()
+        self.tokens = TokenCache(self.fetch_token, refresh_margin=workflow_setting('TOKEN_REFRESH_MARGIN', 60),
+                                 counters=self.counters)
+
+    def fetch_token(self):
+        response = self.session.post(
+            workflow_setting('TOKEN_URL', 'http://127.0.0.1:8000/api/token/'),
+            json={'username': workflow_setting('USERNAME', 'admin'), 'password': workflow_setting('PASSWORD', '123456')},
+        )
+        response.raise_for_status()
+        return response.json()['access']
+
+    def token(self):
+        return self.tokens.get()
+
+    def stats(self):
+        # urllib3 counts every connection it opens and every request it sends per pool
+        connections = requests_sent = 0
+        for adapter in set(self.session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return {
+            'token_refreshes': self.counters['token_refreshes'],
+            'connections_opened': connections,
+            'requests_sent': requests_sent,
+            'connections_reused': max(requests_sent - connections, 0),
+        }
+
+
+class ThreadedHTTP:
+    """The subset of httpx.AsyncClient we use, over a pooled requests session run in threads."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def request(self, method, url, **kwargs):
+        return await asyncio.to_thread(self.session.request, method, url, **kwargs)
+
+    async def aclose(self):
+        self.session.close()
+
+
+def build_async_http(pool_size=None, timeout=None, retries=None):
+    if httpx is None:
+        return ThreadedHTTP(build_session(pool_size, timeout, retries))
+    pool_size = pool_size or workflow_setting('POOL_SIZE', 16)
+    connect, read = timeout or workflow_setting('TIMEOUT', (3.05, 10))
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(read, connect=connect),
+        # httpx only retries failed connection attempts, which is what we allow for POSTs anyway
+        transport=httpx.AsyncHTTPTransport(retries=retries if retries is not None else workflow_setting('RETRIES', 3)),
+        event_hooks={'request': [httpx_request_hook], 'response': [httpx_response_hook]},
+    )
+
+
+class AsyncWorkflowClient:
+    """WorkflowClient for async views: httpx.AsyncClient (or ThreadedHTTP) plus an AsyncTokenCache."""
+
+    def __init__(self, http=None):
+        self.counters = Counter()
+        self.http = http or build_async_http()
+        self.tokens = AsyncTokenCache(self.fetch_token, refresh_margin=workflow_setting('TOKEN_REFRESH_MARGIN', 60),
+                                      counters=self.counters)
+
+    async def fetch_token(self):
+        response = await self.http.request(
+            'POST',
+            workflow_setting('TOKEN_URL', 'http://127.0.0.1:8000/api/token/'),
+            json={'username': workflow_setting('USERNAME', 'admin'), 'password': workflow_setting('PASSWORD', '123456')},
+        )
+        response.raise_for_status()
+        return response.json()['access']
+
+    async def token(self):
+        return await self.tokens.get()
+
+
+_client = None
+_client_lock = threading.Lock()
+# Async clients hold loop-bound connections and locks, so there is one per event loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WorkflowClient()
+    return _client
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncWorkflowClient()
+    return client
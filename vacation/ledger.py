@@ -0,0 +1,245 @@
+"""Append-only QuotaLedger next to the HolidayTimes counters.
+
+Every change to ``holidaytimes_days`` / ``haddays`` / ``reserved`` appends an entry with the same
+deltas in the same transaction (quota.py and the quota views), so the counters always equal the
+sum of the ledger. Balances are read from QuotaSnapshot plus the entries after it;
+snapshot_quota_ledger moves the snapshots forward and reconcile_quotas checks both against
+the leave history.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Max, Sum, Value, When
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from .changelog import log_rows
+from .models import ChangeLog, HolidayEvent, HolidayEventArchive, HolidayTimes, QuotaLedger, QuotaSnapshot
+from .usercache import user_cache
+from .versions import stamps
+
+# Only annual leave (年假) is deducted from HolidayTimes
+QUOTA_LEAVE_TYPE = '年假'
+# Entries younger than this are left for the next snapshot: an id handed out to a transaction
+# that commits later must not fall behind the snapshot's watermark
+SNAPSHOT_SETTLE_SECONDS = 60
+FIELDS = ('days', 'haddays', 'reserved')
+
+
+def entry(user, year, kind, days=0, haddays=0, reserved=0, event_id=None, now=None):
+    return QuotaLedger(ledger_user=user, ledger_year=year, ledger_kind=kind, ledger_days=days,
+                       ledger_haddays=haddays, ledger_reserved=reserved, ledger_event_id=event_id,
+                       ledger_at=now or timezone.now())
+
+
+def record(*entries):
+    entries = [e for e in entries if e.ledger_days or e.ledger_haddays or e.ledger_reserved]
+    if entries:
+        QuotaLedger.objects.bulk_create(entries)
+
+
+def counters(quota):
+    return (quota.holidaytimes_days, quota.holidaytimes_haddays, quota.holidaytimes_reserved)
+
+
+def record_change(before, after):
+    """Credit entries taking the HolidayTimes rows ``before`` to the rows ``after`` (lists; a row
+    only in ``after`` was created, one only in ``before`` deleted)."""
+    now = timezone.now()
+    old = {(quota.holidaytimes_opname, quota.holidaytimes_year): counters(quota) for quota in before}
+    new = {(quota.holidaytimes_opname, quota.holidaytimes_year): counters(quota) for quota in after}
+    record(*(entry(user, year, QuotaLedger.KIND_CREDIT,
+                   *(n - o for n, o in zip(new.get((user, year), (0, 0, 0)), old.get((user, year), (0, 0, 0)))),
+                   now=now)
+             for user, year in {**old, **new}))
+
+
+def credit_rows(queryset):
+    """Credit the whole balance of every HolidayTimes row in ``queryset`` (new rows) with one ``INSERT ... SELECT``."""
+    select, params = queryset.values_list(
+        'holidaytimes_opname', 'holidaytimes_year', 'holidaytimes_days', 'holidaytimes_haddays',
+        'holidaytimes_reserved').query.sql_with_params()
+    c = {field.name: connection.ops.quote_name(field.column) for field in QuotaLedger._meta.concrete_fields}
+    sql = (f'INSERT INTO {connection.ops.quote_name(QuotaLedger._meta.db_table)} '
+           f'({c["ledger_kind"]}, {c["ledger_at"]}, {c["ledger_user"]}, {c["ledger_year"]}, {c["ledger_days"]}, '
+           f'{c["ledger_haddays"]}, {c["ledger_reserved"]}) SELECT %s, %s, credited.* FROM ({select}) credited')
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [QuotaLedger.KIND_CREDIT, now, *params])
+
+
+# -- balances ----------------------------------------------------------------
+
+def ledger_sums(entries, *group_by):
+    return entries.values(*group_by).annotate(
+        days=Sum('ledger_days'), haddays=Sum('ledger_haddays'), reserved=Sum('ledger_reserved')).order_by()
+
+
+def balance(user, year):
+    """``{'days', 'haddays', 'reserved'}`` from the snapshot plus the entries after it (two indexed reads)."""
+    snapshot = QuotaSnapshot.objects.filter(snapshot_user=user, snapshot_year=year).first()
+    base = {field: getattr(snapshot, f'snapshot_{field}') if snapshot else 0 for field in FIELDS}
+    tail = QuotaLedger.objects.filter(ledger_user=user, ledger_year=year,
+                                      ledger_id__gt=snapshot.snapshot_ledger_id if snapshot else 0)
+    sums = tail.aggregate(days=Sum('ledger_days'), haddays=Sum('ledger_haddays'), reserved=Sum('ledger_reserved'))
+    return {field: base[field] + (sums[field] or 0) for field in FIELDS}
+
+
+def take_snapshots(settle_seconds=SNAPSHOT_SETTLE_SECONDS):
+    """Fold the entries since the last run into QuotaSnapshot (one grouped pass); returns ``(watermark, users)``."""
+    since = QuotaSnapshot.objects.aggregate(upto=Max('snapshot_ledger_id'))['upto'] or 0
+    settled = QuotaLedger.objects.filter(ledger_id__gt=since, ledger_at__lte=timezone.now() - timedelta(
+        seconds=settle_seconds))
+    upto = settled.aggregate(upto=Max('ledger_id'))['upto']
+    if upto is None:
+        return since, 0
+    now = timezone.now()
+    with transaction.atomic():
+        sums = {(row['ledger_user'], row['ledger_year']): row for row in ledger_sums(
+            QuotaLedger.objects.filter(ledger_id__gt=since, ledger_id__lte=upto), 'ledger_user', 'ledger_year')}
+        current = {(s.snapshot_user, s.snapshot_year): s for s in QuotaSnapshot.objects.filter(
+            snapshot_user__in={user for user, _ in sums})} if sums else {}
+        QuotaSnapshot.objects.bulk_create([QuotaSnapshot(
+            snapshot_user=user, snapshot_year=year, snapshot_ledger_id=upto, snapshot_at=now,
+            **{f'snapshot_{field}': (getattr(current[(user, year)], f'snapshot_{field}') if (user, year) in current
+                                     else 0) + row[field] for field in FIELDS},
+        ) for (user, year), row in sums.items()], update_conflicts=True,
+            unique_fields=['snapshot_user', 'snapshot_year'],
+            update_fields=[f'snapshot_{field}' for field in FIELDS] + ['snapshot_ledger_id', 'snapshot_at'])
+        # Users without new entries keep their older snapshot; nothing after it was theirs
+        QuotaSnapshot.objects.filter(snapshot_ledger_id__lt=upto).update(snapshot_ledger_id=upto)
+    return upto, len(sums)
+
+
+# -- reconciliation ------------------------------------------------------------
+
+def event_totals(users=None):
+    """``{(user, year): [pending days, approved days]}`` of annual leave, one GROUP BY per table.
+
+    Requests are charged to the year they were submitted in, like quota.quota_year().
+    """
+    totals = {}
+    for model in (HolidayEvent, HolidayEventArchive):
+        events = model.objects.filter(holidayevents_htype=QUOTA_LEAVE_TYPE, holidayevents_ispermit__in=(1, 2))
+        if users is not None:
+            events = events.filter(holidayevents_hname__in=users)
+        rows = events.values(user=F('holidayevents_hname'), year=ExtractYear('holidayevents_addtime')).annotate(
+            pending=Sum(Case(When(holidayevents_ispermit=1, then='holidayevents_usedDay'), default=Value(0))),
+            approved=Sum(Case(When(holidayevents_ispermit=2, then='holidayevents_usedDay'), default=Value(0))),
+        ).order_by()
+        for row in rows:
+            bucket = totals.setdefault((row['user'], row['year']), [0, 0])
+            bucket[0] += row['pending']
+            bucket[1] += row['approved']
+    return totals
+
+
+def open_ledger(quotas=None):
+    """Opening entries matching the counters of ``quotas`` (default: every HolidayTimes row),
+    for rows written without going through the ledger.
+
+    The entitlement is credited as ``days + approved`` so that reconciliation's expected balance
+    (credits minus approved leave) starts equal to the counters.
+    """
+    totals = event_totals()
+    now = timezone.now()
+    entries = []
+    for quota in (quotas if quotas is not None else HolidayTimes.objects.all()).iterator():
+        user, year = quota.holidaytimes_opname, quota.holidaytimes_year
+        approved = totals.get((user, year), [0, 0])[1]
+        for kind, days, haddays, reserved in (
+            (QuotaLedger.KIND_CREDIT, quota.holidaytimes_days + approved, quota.holidaytimes_haddays - approved, 0),
+            (QuotaLedger.KIND_DEBIT, -approved, approved, 0),
+            (QuotaLedger.KIND_RESERVE, 0, 0, quota.holidaytimes_reserved),
+        ):
+            if days or haddays or reserved:
+                entries.append(QuotaLedger(ledger_user=user, ledger_year=year, ledger_kind=kind, ledger_days=days,
+                                           ledger_haddays=haddays, ledger_reserved=reserved, ledger_at=now))
+    QuotaLedger.objects.bulk_create(entries, batch_size=1000)
+    return len(entries)
+
+
+class Drift:
+    def __init__(self, user, year, counters, ledger, expected):
+        self.user = user
+        self.year = year
+        self.counters = counters
+        self.ledger = ledger
+        self.expected = expected
+
+    def __str__(self):
+        def fmt(values):
+            return '/'.join(str(value) for value in values)
+        return (f'{self.user} {self.year}: days/haddays/reserved counters {fmt(self.counters)}, '
+                f'ledger {fmt(self.ledger)}, expected {fmt(self.expected)}')
+
+
+class Reconciliation:
+    """Recomputes every balance from the credits and the leave history and compares it with the
+    counters and the ledger.
+
+    Expected: ``days = credited - approved``, ``haddays = credited + approved``, ``reserved =
+    pending``, where credits are the ledger's credit entries and approved / pending days come
+    from one grouped pass over HolidayEvent (and the archive). fix() rechecks the drifting rows
+    under a row lock, sets the counters and appends adjust entries.
+    """
+
+    def __init__(self, year=None):
+        self.year = year
+
+    def drifts(self, users=None, quotas=None):
+        entries = QuotaLedger.objects.all()
+        if self.year is not None:
+            entries = entries.filter(ledger_year=self.year)
+        if users is not None:
+            entries = entries.filter(ledger_user__in=users)
+        ledger, credited = {}, {}
+        for row in ledger_sums(entries, 'ledger_user', 'ledger_year'):
+            ledger[(row['ledger_user'], row['ledger_year'])] = tuple(row[field] for field in FIELDS)
+        for row in ledger_sums(entries.filter(ledger_kind=QuotaLedger.KIND_CREDIT), 'ledger_user', 'ledger_year'):
+            credited[(row['ledger_user'], row['ledger_year'])] = row
+        totals = event_totals(users)
+
+        if quotas is None:
+            quotas = HolidayTimes.objects.all()
+            if self.year is not None:
+                quotas = quotas.filter(holidaytimes_year=self.year)
+        for quota in quotas:
+            key = (quota.holidaytimes_opname, quota.holidaytimes_year)
+            pending, approved = totals.get(key, (0, 0))
+            credit = credited.get(key, {'days': 0, 'haddays': 0})
+            expected = (credit['days'] - approved, credit['haddays'] + approved, pending)
+            found = (counters(quota), ledger.get(key, (0, 0, 0)))
+            if any(values != expected for values in found):
+                yield Drift(*key, found[0], found[1], expected)
+
+    def fix(self, drifts):
+        """Correct ``drifts`` (from drifts()); returns the ones still wrong under the lock, now fixed."""
+        users = {drift.user for drift in drifts}
+        keys = {(drift.user, drift.year) for drift in drifts}
+        if not keys:
+            return []
+        now = timezone.now()
+        with transaction.atomic():
+            # The same row lock reserve() / consume() take, so nothing moves while we look again
+            locked = HolidayTimes.objects.select_for_update().filter(holidaytimes_opname__in=users)
+            if self.year is not None:
+                locked = locked.filter(holidaytimes_year=self.year)
+            quotas = [quota for quota in locked if (quota.holidaytimes_opname, quota.holidaytimes_year) in keys]
+            fixed = list(self.drifts(users, quotas))
+            by_key = {(quota.holidaytimes_opname, quota.holidaytimes_year): quota for quota in quotas}
+            entries = []
+            for drift in fixed:
+                quota = by_key[(drift.user, drift.year)]
+                quota.holidaytimes_days, quota.holidaytimes_haddays, quota.holidaytimes_reserved = drift.expected
+                entries.append(entry(drift.user, drift.year, QuotaLedger.KIND_ADJUST,
+                                     *(e - l for e, l in zip(drift.expected, drift.ledger)), now=now))
+            changed = [by_key[(drift.user, drift.year)] for drift in fixed if drift.counters != drift.expected]
+            HolidayTimes.objects.bulk_update(changed, ['holidaytimes_days', 'holidaytimes_haddays',
+                                                       'holidaytimes_reserved'])
+            record(*entries)
+            if changed:
+                log_rows(ChangeLog.TABLE_QUOTA, HolidayTimes.objects.filter(pk__in=[q.pk for q in changed]))
+                user_cache.invalidate(*{quota.holidaytimes_opname for quota in changed})
+                stamps.bump('quotas')
+        return fixed
@@ -0,0 +1,455 @@
+"""Seeded load tests for the vacation API.
+
+seed() fills the tables with realistic data for users named ``lt000000``..., Workload builds a
+request for any endpoint from that data, and LoadRunner drives a mix of endpoints in-process
+(Django test client, full middleware stack) or over HTTP and reports throughput, latency
+percentiles and SQL queries per request. QUERY_BUDGETS are the per-endpoint query limits that
+tests.QueryBudgetTests enforce. Used by manage.py seed_load_data / load_test.
+"""
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import count
+
+import requests
+from django.conf import settings
+from django.test import Client
+from django.utils import timezone
+
+from .metrics import registry
+from .models import HolidayEvent, HolidayEventArchive, HolidayTimes, LeaveDay, QuotaLedger, QuotaSnapshot
+from .quota import quota_year
+from .rollover import entitlement_rules
+from . import ledger, usage
+
+USER_PREFIX = 'lt'
+
+# Relative weights
+LEAVE_TYPES = {'年假': 45, '病假': 30, '赡养老人假': 15, '陪产假': 5, '婚假': 5}
+LEAVE_LENGTHS = {1: 50, 2: 20, 3: 15, 5: 15}  # working days
+PAST_STATUSES = {2: 82, 3: 6, 4: 7, 1: 5}
+FUTURE_STATUSES = {1: 45, 2: 50, 4: 5}
+
+READ_ENDPOINTS = [
+    'get_vacation_list',
+    'vacation_quota_list',
+    'get_approve_vacation_list',
+    'get_user_vacation_info',
+    'get_user_holiday_info',
+    'team_calendar',
+    'leave_usage_report',
+    'working_days',
+    'get_changes',
+    'user_cache_stats',
+]
+WRITE_ENDPOINTS = [
+    'submit_vacation',
+    'revoke_vacation',
+    'approve_vacation',
+    'batch_approve_vacation',
+    'delete_vacation',
+    'create_vacation_times',
+    'update_vacation_times',
+    'import_vacation_times',
+    'approval_callback',
+]
+
+# Most SQL queries (savepoints included) one request may run with cold caches, for the requests
+# Workload builds. Reads include the version stamp lookup; writes leave room for the annual-leave
+# branch (quota UPDATE + change log + ledger) and the stamp UPDATEs.
+# Independent of the data size, so a query per row (N+1) goes over.
+QUERY_BUDGETS = {
+    'get_vacation_list': 2,
+    'vacation_quota_list': 2,
+    'get_approve_vacation_list': 2,
+    'get_user_vacation_info': 2,
+    'get_user_holiday_info': 2,
+    'team_calendar': 2,
+    'leave_usage_report': 3,
+    'working_days': 2,
+    'get_changes': 4,
+    'user_cache_stats': 0,
+    'submit_vacation': 11,
+    'revoke_vacation': 9,
+    'approve_vacation': 9,
+    'batch_approve_vacation': 14,
+    'delete_vacation': 15,
+    'create_vacation_times': 6,
+    'update_vacation_times': 6,
+    'import_vacation_times': 7,
+    'approval_callback': 13,
+}
+
+
+def weighted(rnd, weights):
+    return rnd.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def user_name(i):
+    return f'{USER_PREFIX}{i:06d}'
+
+
+def first_monday(year):
+    start = date(year, 1, 1)
+    return start + timedelta(days=(7 - start.weekday()) % 7)
+
+
+def entitlement(workyear, cmbyear, rules):
+    for min_workyear, min_cmbyear, days in rules:
+        if workyear >= min_workyear and cmbyear >= min_cmbyear:
+            return days
+    return 0
+
+
+def spread(rnd, events, users, cap):
+    # Heavy-tailed events per user (a few people take a lot of short leave), at most ``cap`` each
+    weights = [rnd.paretovariate(1.5) for _ in range(users)]
+    total = sum(weights)
+    counts = [min(int(events * w / total), cap) for w in weights]
+    short = events - sum(counts)
+    if short > users * cap - sum(counts):
+        raise ValueError(f'{events} events do not fit {users} users at one per week; seed more users')
+    i = 0
+    while short:
+        if counts[i % users] < cap:
+            counts[i % users] += 1
+            short -= 1
+        i += 1
+    return counts
+
+
+def seed(events, users, year=None, seed=0, batch_size=5000):
+    """Insert ``events`` HolidayEvent rows (and their LeaveDay rows) for ``users`` users, one
+    HolidayTimes row per user for ``year`` (with its opening ledger entries), and rebuild
+    LeaveUsage. Returns ``{table: rows}``.
+
+    Leave falls on Monday-Friday of ``year - 1`` and ``year``, at most one request per user and
+    week, so a user's requests never overlap. Past leave is mostly approved, future leave mostly
+    pending; annual leave is reflected in the users' used and reserved days.
+    """
+    rnd = random.Random(seed)
+    year = year or datetime.now().year
+    monday = first_monday(year - 1)
+    weeks = (date(year, 12, 31) - monday).days // 7 + 1
+    today, now = date.today(), timezone.now()
+    rules = entitlement_rules()
+
+    created = Counter()
+    batch, batch_days, quotas = [], [], []
+
+    def flush():
+        saved = HolidayEvent.objects.bulk_create(batch)
+        created['events'] += len(saved)
+        created['leave_days'] += len(LeaveDay.objects.bulk_create(
+            [day for event, days in zip(saved, batch_days) for day in LeaveDay.for_event(event, days)]))
+        batch.clear()
+        batch_days.clear()
+
+    for u, n in enumerate(spread(rnd, events, users, weeks)):
+        name = user_name(u)
+        used = reserved = 0
+        for week in sorted(rnd.sample(range(weeks), n)):
+            length = weighted(rnd, LEAVE_LENGTHS)
+            start = monday + timedelta(weeks=week, days=rnd.randint(0, 5 - length))
+            days = [start + timedelta(days=d) for d in range(length)]
+            htype = weighted(rnd, LEAVE_TYPES)
+            ispermit = weighted(rnd, PAST_STATUSES if start <= today else FUTURE_STATUSES)
+            addtime = now - timedelta(days=(today - start).days + rnd.randint(1, 30), seconds=rnd.randint(0, 86399))
+            event = HolidayEvent(
+                holidayevents_hname=name,
+                holidayevents_htype=htype,
+                holidayevents_day=','.join(day.isoformat() for day in days),
+                holidayevents_remark='load test',
+                holidayevents_ispermit=ispermit,
+                holidayevents_approval_user='审批人' if ispermit in (2, 3) else '',
+                holidayevents_approval_opinion='ok' if ispermit in (2, 3) else '',
+                holidayevents_permittime=addtime + timedelta(hours=rnd.randint(1, 72)) if ispermit in (2, 3) else None,
+                holidayevents_usedDay=length,
+                holidayevents_addtime=addtime,
+                runiuId=f'LT{u}-{week}',
+                taskId=f'LT{u}-{week}',
+            )
+            # 年假按提交年份扣减，和 submit_vacation 保持一致
+            if htype == '年假' and quota_year(event) == year:
+                used += length if ispermit == 2 else 0
+                reserved += length if ispermit == 1 else 0
+            batch.append(event)
+            batch_days.append(days)
+            if len(batch) >= batch_size:
+                flush()
+        workyear = rnd.randint(1, 25)
+        cmbyear = rnd.randint(0, workyear)
+        quotas.append(HolidayTimes(
+            holidaytimes_opname=name,
+            holidaytimes_year=year,
+            holidaytimes_days=max(entitlement(workyear, cmbyear, rules) - used, reserved),
+            holidaytimes_haddays=used,
+            holidaytimes_reserved=reserved,
+            holidaytimes_addtime=now - timedelta(days=rnd.randint(0, 365)),
+            holidaytimes_workyear=workyear,
+            holidaytimes_cmbyear=cmbyear,
+        ))
+    flush()
+    created['quotas'] = len(HolidayTimes.objects.bulk_create(quotas, batch_size=batch_size))
+    created['ledger'] = ledger.open_ledger(HolidayTimes.objects.filter(
+        holidaytimes_opname__startswith=USER_PREFIX, holidaytimes_year=year))
+    created['usage'] = usage.rebuild()
+    return dict(created)
+
+
+def clear():
+    """Delete everything seed() created, and rebuild LeaveUsage without it."""
+    deleted = HolidayEvent.objects.filter(holidayevents_hname__startswith=USER_PREFIX).delete()[0]
+    deleted += HolidayEventArchive.objects.filter(holidayevents_hname__startswith=USER_PREFIX).delete()[0]
+    deleted += HolidayTimes.objects.filter(holidaytimes_opname__startswith=USER_PREFIX).delete()[0]
+    deleted += QuotaLedger.objects.filter(ledger_user__startswith=USER_PREFIX).delete()[0]
+    deleted += QuotaSnapshot.objects.filter(snapshot_user__startswith=USER_PREFIX).delete()[0]
+    usage.rebuild()
+    return deleted
+
+
+class Workload:
+    """Builds a request ``(method, path, body, content_type, headers)`` for each endpoint from the seeded data.
+
+    Methods are named after the views. The write endpoints take pending events from a shared
+    pool, so each is decided, revoked or deleted once; they return None when it runs dry.
+    ``approval_callback`` is only built with the ``callback_secret`` the server uses.
+    """
+
+    def __init__(self, year=None, seed=0, callback_secret=''):
+        self.year = year or datetime.now().year
+        self.random = random.Random(seed)
+        self.callback_secret = callback_secret
+        self.users = list(HolidayTimes.objects.filter(
+            holidaytimes_opname__startswith=USER_PREFIX, holidaytimes_year=self.year,
+        ).order_by('holidaytimes_opname').values_list('holidaytimes_opname', 'holidaytimes_id'))
+        if not self.users:
+            raise ValueError('No seeded users; run manage.py seed_load_data first')
+        pending = list(HolidayEvent.objects.filter(
+            holidayevents_hname__startswith=USER_PREFIX, holidayevents_ispermit=1,
+        ).values_list('holidayevents_id', 'runiuId'))
+        self.random.shuffle(pending)
+        self.pending = deque(pending)
+        self.new_quotas = count()
+        self.lock = threading.Lock()
+
+    def user(self):
+        return self.random.choice(self.users)[0]
+
+    def take(self, n=1):
+        with self.lock:
+            return [self.pending.popleft() for _ in range(min(n, len(self.pending)))]
+
+    def json(self, path, data):
+        return 'POST', path, json.dumps(data, ensure_ascii=False).encode(), 'application/json', None
+
+    def get(self, path):
+        return 'GET', path, b'', 'application/octet-stream', None
+
+    # -- reads ----------------------------------------------------------------
+
+    def get_vacation_list(self):
+        return self.get('vacation/get_vacation_list?limit=50')
+
+    def vacation_quota_list(self):
+        return self.get('vacation/vacation_quota_list?limit=50')
+
+    def get_approve_vacation_list(self):
+        return self.get('vacation/get_approve_vacation_list?limit=50')
+
+    def get_user_vacation_info(self):
+        return self.get(f'vacation/get_user_vacation_info?username={self.user()}')
+
+    def get_user_holiday_info(self):
+        return self.get(f'vacation/get_user_holiday_info?opname={self.user()}')
+
+    def team_calendar(self):
+        start = date(self.year, self.random.randint(1, 12), 1)
+        users = ','.join({self.user() for _ in range(10)})
+        return self.get(f'vacation/team_calendar?start={start}&end={start + timedelta(days=30)}&users={users}')
+
+    def leave_usage_report(self):
+        if self.random.random() < 0.5:
+            return self.get(f'vacation/leave_usage_report?year={self.year}&group_by=htype,month')
+        return self.get(f'vacation/leave_usage_report?year={self.year}&username={self.user()}&group_by=month')
+
+    def working_days(self):
+        return self.get(f'vacation/working_days?start={self.year}-01-01&end={self.year}-12-31')
+
+    def get_changes(self):
+        return self.get('vacation/get_changes?since=0&limit=100')
+
+    def user_cache_stats(self):
+        return self.get('vacation/user_cache_stats')
+
+    # -- writes ---------------------------------------------------------------
+
+    def submit_vacation(self):
+        # Next year, so most submissions don't collide with seeded leave
+        day = first_monday(self.year + 1) + timedelta(weeks=self.random.randint(0, 50), days=self.random.randint(0, 4))
+        return self.json('vacation/submit_vacation', {'username': self.user(), 'leave_type': '病假',
+                                                      'leave_day': day.isoformat(), 'reason': 'load test'})
+
+    def revoke_vacation(self):
+        for event_id, _ in self.take():
+            return self.json('vacation/revoke_vacation', {'vacation_id': event_id})
+
+    def approve_vacation(self):
+        for event_id, _ in self.take():
+            return self.json('vacation/approve_vacation', {'id': event_id, 'ispermit': self.random.choice([2, 2, 3]),
+                                                           'approver': '审批人', 'opinion': 'load test'})
+
+    def batch_approve_vacation(self):
+        items = [{'id': event_id, 'ispermit': 2, 'opinion': 'ok'} for event_id, _ in self.take(20)]
+        if items:
+            return self.json('vacation/batch_approve_vacation', {'approver': '审批人', 'items': items})
+
+    def delete_vacation(self):
+        for event_id, _ in self.take():
+            return self.json('vacation/delete_vacation', {'vacation_id': event_id})
+
+    def create_vacation_times(self):
+        # Every (user, year) once: later years after all users had one
+        n = next(self.new_quotas)
+        username = self.users[n % len(self.users)][0]
+        return self.json('vacation/create_vacation_times', {
+            'username': username, 'year': self.year + 1 + n // len(self.users), 'days': 10, 'haddays': 0,
+            'workyear': 5, 'cmb_year': 3})
+
+    def update_vacation_times(self):
+        return self.json('vacation/update_vacation_times', {'id': self.random.choice(self.users)[1],
+                                                            'work_year': self.random.randint(1, 25)})
+
+    def import_vacation_times(self):
+        lines = ['username,year,days,haddays,workyear,cmb_year']
+        lines += [f'{self.user()},{self.year},{self.random.randint(5, 15)},0,5,3' for _ in range(20)]
+        return 'POST', 'vacation/import_vacation_times?format=csv', '\n'.join(lines).encode(), 'text/csv', None
+
+    def approval_callback(self):
+        if not self.callback_secret:
+            return None
+        for _, ticket_id in self.take():
+            body = json.dumps({'ticket_id': ticket_id, 'action_name': '同意', 'operator': '审批人',
+                               'message': 'load test'}, ensure_ascii=False).encode()
+            signature = 'sha256=' + hmac.new(self.callback_secret.encode(), body, hashlib.sha256).hexdigest()
+            return 'POST', 'vacation/approval_callback', body, 'application/json', {'X-Approval-Signature': signature}
+
+
+class InProcessTransport:
+    """Django's test client, one per thread: URL routing and every middleware, no sockets."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, method, path, body, content_type, headers=None):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        response = self.local.client.generic(method, '/' + path, body, content_type=content_type,
+                                             headers=headers)
+        size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+        return response.status_code, size
+
+    def metrics(self):
+        return registry.render()
+
+
+class HttpTransport:
+    """A pooled requests session per thread against a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+
+    def send(self, method, path, body, content_type, headers=None):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        response = self.local.session.request(method, f'{self.base_url}/{path}', data=body,
+                                              headers={'Content-Type': content_type, **(headers or {})})
+        return response.status_code, len(response.content)
+
+    def metrics(self):
+        return requests.get(f'{self.base_url}/metrics').text
+
+
+def view_queries(metrics_text):
+    """``{view: [sampled requests, queries]}`` from a /metrics scrape (needs METRICS_SAMPLE_RATE = 1)."""
+    found = {}
+    pattern = r'vacation_http_request_db_queries_(sum|count)\{view="vacation\.views\.(\w+)"\} (\S+)'
+    for kind, view, value in re.findall(pattern, metrics_text):
+        found.setdefault(view, [0, 0])[0 if kind == 'count' else 1] = float(value)
+    return found
+
+
+def percentile(ordered, q):
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else 0
+
+
+class LoadRunner:
+    def __init__(self, transport, workload):
+        self.transport = transport
+        self.workload = workload
+
+    def call(self, name):
+        request = getattr(self.workload, name)()
+        if request is None:
+            return name, None, 'skipped'
+        started = time.perf_counter()
+        try:
+            status, _ = self.transport.send(*request)
+        except Exception as e:
+            status = type(e).__name__
+        return name, time.perf_counter() - started, status
+
+    def run(self, names, requests_per_endpoint, workers=1):
+        """Send ``requests_per_endpoint`` requests to each endpoint in ``names``, shuffled, from
+        ``workers`` threads (1 runs inline). Returns ``(seconds, {endpoint: stats})``."""
+        jobs = [name for name in names for _ in range(requests_per_endpoint)]
+        self.workload.random.shuffle(jobs)
+        before = view_queries(self.transport.metrics())
+        started = time.perf_counter()
+        if workers == 1:
+            results = [self.call(name) for name in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self.call, jobs))
+        elapsed = time.perf_counter() - started
+        after = view_queries(self.transport.metrics())
+
+        latencies = {name: [] for name in names}
+        statuses = {name: Counter() for name in names}
+        for name, seconds, status in results:
+            statuses[name][status] += 1
+            if seconds is not None:
+                latencies[name].append(seconds)
+        report = {}
+        for name in names:
+            ordered = sorted(latencies[name])
+            sampled, queries = (a - b for a, b in zip(after.get(name, [0, 0]), before.get(name, [0, 0])))
+            report[name] = {
+                'requests': len(ordered),
+                'statuses': dict(statuses[name]),
+                'rps': len(ordered) / elapsed if elapsed else 0,
+                'p50': percentile(ordered, 0.50),
+                'p95': percentile(ordered, 0.95),
+                'p99': percentile(ordered, 0.99),
+                'queries': queries / sampled if sampled else None,
+                'budget': QUERY_BUDGETS.get(name),
+            }
+        return elapsed, report
+
+
+def load_test_settings(stub, callback_secret):
+    """override_settings() for an in-process run against ``stub`` (a WorkflowStub)."""
+    return {
+        **stub.settings(),
+        'APPROVAL_CALLBACK_SECRET': callback_secret,
+        'METRICS_SAMPLE_RATE': 1.0,
+        'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+    }
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vacation.archive import ARCHIVE_CHUNK_SIZE, EventArchiver
+
+
+class Command(BaseCommand):
+    help = ('Move closed (approved / rejected / revoked) events whose leave ended before --before-year into '
+            'holiday_events_archive, one transaction per chunk. Safe to stop and re-run: it resumes where it '
+            'stopped. Read endpoints include the archive with include_archived=1 or year=')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before-year', type=int, help='Archive events that ended before this year '
+                                                            '(default: the current year)')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE, help='Events per transaction')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks (spread a big backlog '
+                                                           'over several runs)')
+        parser.add_argument('--dry-run', action='store_true', help='Print how many events would move and exit')
+
+    def handle(self, *args, **options):
+        try:
+            archiver = EventArchiver(options['before_year'], options['chunk_size'])
+        except ValueError as e:
+            raise CommandError(e)
+        if options['dry_run']:
+            self.stdout.write(f'{archiver.candidates().count()} events before {archiver.before_year} would be archived')
+            return
+        moved = archiver.run(options['max_chunks'])
+        left = archiver.candidates().count()
+        self.stdout.write(f'{moved} events before {archiver.before_year} archived, {left} left')
@@ -0,0 +1,117 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+
+from vacation.models import HolidayEvent, HolidayTimes, LeaveDay
+
+USER_PREFIX = 'asgib'
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/second and latency of the sync read views under WSGI (one thread per worker) '
+            'with the async views under ASGI (one task per worker) at the same worker count. '
+            'Both go through the full handler stack in-process, no network. Seeds rows for users '
+            f'named {USER_PREFIX}NNNNN and deletes them afterwards; run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent threads (WSGI) / tasks (ASGI)')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per path')
+        parser.add_argument('--users', type=int, default=200, help='Users to seed')
+        parser.add_argument('--events', type=int, default=20, help='Vacation events per user')
+
+    def handle(self, *args, **options):
+        self.seed(options['users'], options['events'])
+        try:
+            paths = self.paths(options['users'], options['requests'])
+            # The test clients send Host: testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                results = [
+                    ('wsgi', self.run_wsgi(['/vacation/' + path for path in paths], options['workers'])),
+                    ('asgi', self.run_asgi(['/vacation/async/' + path for path in paths], options['workers'])),
+                ]
+        finally:
+            self.cleanup()
+        self.stdout.write(f"{len(paths)} requests, {options['workers']} workers")
+        for label, (latencies, wall) in results:
+            latencies.sort()
+            self.stdout.write(
+                f'  {label}: {len(latencies) / wall:8.1f} req/s, p50 {statistics.median(latencies) * 1000:.2f}ms, '
+                f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms')
+        self.stdout.write('Note: async ORM calls run on one shared thread (asgiref thread_sensitive), so the ASGI '
+                          'path wins on idle connections and concurrency, not on database throughput.')
+
+    def seed(self, users, events):
+        now = timezone.now()
+        start = date(now.year, 1, 1)
+        created = HolidayEvent.objects.bulk_create([HolidayEvent(
+            holidayevents_hname=f'{USER_PREFIX}{u:05d}', holidayevents_htype='病假',
+            holidayevents_day=(start + timedelta(days=e)).isoformat(), holidayevents_remark='bench',
+            holidayevents_ispermit=1 + e % 2, holidayevents_approval_user='', holidayevents_approval_opinion='',
+            holidayevents_usedDay=1, holidayevents_addtime=now - timedelta(minutes=e),
+        ) for u in range(users) for e in range(events)], batch_size=1000)
+        LeaveDay.objects.bulk_create([day for event in created for day in LeaveDay.for_event(event)],
+                                     batch_size=1000)
+        HolidayTimes.objects.bulk_create([HolidayTimes(
+            holidaytimes_opname=f'{USER_PREFIX}{u:05d}', holidaytimes_year=now.year, holidaytimes_days=10,
+            holidaytimes_haddays=0, holidaytimes_addtime=now, holidaytimes_workyear=5, holidaytimes_cmbyear=3,
+        ) for u in range(users)], batch_size=1000)
+        self.calendar_start = start
+
+    def cleanup(self):
+        HolidayEvent.objects.filter(holidayevents_hname__startswith=USER_PREFIX).delete()
+        HolidayTimes.objects.filter(holidaytimes_opname__startswith=USER_PREFIX).delete()
+
+    def paths(self, users, count):
+        # The polled mix: pages of the shared lists, per-user lists (user-cached) and the calendar
+        end = self.calendar_start + timedelta(days=30)
+        paths = []
+        for i in range(count):
+            user = f'{USER_PREFIX}{i % users:05d}'
+            paths.extend([
+                'get_approve_vacation_list?limit=50',
+                'vacation_quota_list?limit=50',
+                f'get_user_vacation_info?username={user}',
+                f'get_user_holiday_info?opname={user}',
+                f'team_calendar?start={self.calendar_start.isoformat()}&end={end.isoformat()}&users={user}',
+            ])
+        return paths
+
+    def run_wsgi(self, paths, workers):
+        def fetch(path):
+            started = time.perf_counter()
+            response = Client().get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)  # drain: the rows are read as the body is
+            assert response.status_code == 200, (path, response.status_code)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            latencies = list(pool.map(fetch, paths))
+        return latencies, time.perf_counter() - started
+
+    def run_asgi(self, paths, workers):
+        async def worker(client, queue, latencies):
+            # Workers share one iterator, so each path is fetched once
+            for path in queue:
+                started = time.perf_counter()
+                response = await client.get(path)
+                if response.streaming:
+                    [chunk async for chunk in response.streaming_content]  # drain
+                assert response.status_code == 200, (path, response.status_code)
+                latencies.append(time.perf_counter() - started)
+
+        async def run():
+            client, queue, latencies = AsyncClient(), iter(paths), []
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client, queue, latencies) for _ in range(workers)))
+            return latencies, time.perf_counter() - started
+
+        return asyncio.run(run())
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from vacation import views
+from vacation.models import HolidayEvent, HolidayTimes
+
+
+class Command(BaseCommand):
+    help = ('Compare bytes sent and CPU time for full responses vs 304s on the polled list endpoints. '
+            'Seeds inside a transaction that is rolled back, so the database is left unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending', type=int, default=2000, help='Pending vacation events to seed')
+        parser.add_argument('--quotas', type=int, default=5000, help='Quota rows to seed')
+        parser.add_argument('--requests', type=int, default=50, help='Polls per endpoint and mode')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['pending'], options['quotas'])
+            for name in ('get_approve_vacation_list', 'vacation_quota_list'):
+                self.bench(name, getattr(views, name), options['requests'])
+            transaction.set_rollback(True)
+
+    def seed(self, pending, quotas):
+        now = timezone.now()
+        HolidayEvent.objects.bulk_create([HolidayEvent(
+            holidayevents_hname=f'bench{i:05d}', holidayevents_htype='病假', holidayevents_day='2024-04-01',
+            holidayevents_remark='bench', holidayevents_ispermit=1, holidayevents_approval_user='',
+            holidayevents_approval_opinion='', holidayevents_usedDay=1, holidayevents_addtime=now,
+        ) for i in range(pending)], batch_size=1000)
+        HolidayTimes.objects.bulk_create([HolidayTimes(
+            holidaytimes_opname=f'bench{i:05d}', holidaytimes_year=now.year, holidaytimes_days=10,
+            holidaytimes_haddays=0, holidaytimes_addtime=now, holidaytimes_workyear=5, holidaytimes_cmbyear=3,
+        ) for i in range(quotas)], batch_size=1000)
+
+    def poll(self, view, count, **headers):
+        factory = RequestFactory()
+        sent = 0
+        cpu, wall = time.process_time(), time.perf_counter()
+        for _ in range(count):
+            response = view(factory.get('/', **headers))
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            sent += len(body)
+        return response, sent, time.process_time() - cpu, time.perf_counter() - wall
+
+    def bench(self, name, view, count):
+        response, full_bytes, full_cpu, full_wall = self.poll(view, count)
+        etag = response['ETag']
+        response, cond_bytes, cond_cpu, cond_wall = self.poll(view, count, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304, response.status_code
+        self.stdout.write(
+            f'{name}: {count} polls\n'
+            f'  full 200: {full_bytes / count / 1024:.1f} KiB/poll, {full_cpu / count * 1000:.2f}ms CPU, '
+            f'{full_wall / count * 1000:.2f}ms wall\n'
+            f'  304     : {cond_bytes / count / 1024:.1f} KiB/poll, {cond_cpu / count * 1000:.3f}ms CPU, '
+            f'{cond_wall / count * 1000:.3f}ms wall')
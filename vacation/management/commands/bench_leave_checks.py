@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from vacation.conflicts import active_leave_days, overlapping_dates, overstaffed_dates
+from vacation.models import HolidayEvent, LeaveDay
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the submit-time overlap and team staffing checks against a large seeded history. '
+            'Seeds inside a transaction that is rolled back, so the database is left unchanged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--team-size', type=int, default=20)
+        parser.add_argument('--checks', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = [f'bench{i:05d}' for i in range(options['users'])]
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed(rng, users, options['events'])
+            self.stdout.write(f"Seeded {options['events']} events / {LeaveDay.objects.count()} leave days "
+                              f'in {time.perf_counter() - started:.1f}s')
+
+            team = users[:options['team_size']]
+            teams = {'bench': {'members': team, 'max_off': 3}}
+            with override_settings(LEAVE_STAFFING_TEAMS=teams):
+                self.bench('overlap', lambda u, d: overlapping_dates(u, d), rng, users, options['checks'])
+                self.bench('staffing', lambda u, d: overstaffed_dates(u, d), rng, team, options['checks'])
+            plan = active_leave_days([date(2024, 3, 1)]).filter(leaveday_user=users[0]).explain()
+            self.stdout.write(f'overlap plan: {plan}')
+            transaction.set_rollback(True)
+
+    def seed(self, rng, users, count, chunk=5000):
+        start = date(2022, 1, 1)
+        now = timezone.now()
+        for offset in range(0, count, chunk):
+            events, days = [], []
+            for _ in range(min(chunk, count - offset)):
+                first = start + timedelta(days=rng.randrange(3 * 365))
+                dates = [first + timedelta(days=i) for i in range(rng.randint(1, 5))]
+                events.append(HolidayEvent(
+                    holidayevents_hname=rng.choice(users),
+                    holidayevents_htype=rng.choice(['年假', '病假', '婚假']),
+                    holidayevents_day=','.join(d.isoformat() for d in dates),
+                    holidayevents_remark='',
+                    holidayevents_ispermit=rng.choices([1, 2, 3, 4], [1, 6, 1, 1])[0],
+                    holidayevents_approval_user='',
+                    holidayevents_approval_opinion='',
+                    holidayevents_usedDay=len(dates),
+                    holidayevents_addtime=now,
+                ))
+                days.append(dates)
+            HolidayEvent.objects.bulk_create(events)
+            LeaveDay.objects.bulk_create(
+                [leave_day for event, dates in zip(events, days) for leave_day in LeaveDay.for_event(event, dates)])
+
+    def bench(self, name, check, rng, users, checks):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(checks):
+                first = date(2022, 1, 1) + timedelta(days=rng.randrange(3 * 365))
+                dates = [first + timedelta(days=i) for i in range(rng.randint(1, 5))]
+                username = rng.choice(users)
+                started = time.perf_counter()
+                check(username, dates)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{name}: {checks} checks, {len(queries) / checks:.1f} queries/check, '
+            f'p50 {statistics.median(timings):.2f}ms, p95 {timings[int(len(timings) * 0.95)]:.2f}ms, '
+            f'max {timings[-1]:.2f}ms')
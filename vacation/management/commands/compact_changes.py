@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from vacation.changelog import Compaction
+
+
+class Command(BaseCommand):
+    help = 'Delete change log entries that every known changes?since= consumer has already read'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-days', type=int,
+                            help="Ignore consumers not seen for this many days (they'll have to resync)")
+        parser.add_argument('--dry-run', action='store_true', help='Print what would be deleted and exit')
+
+    def handle(self, *args, **options):
+        compaction = Compaction(stale_days=options['stale_days'])
+        if options['dry_run']:
+            target = compaction.target()
+            if target is None:
+                self.stdout.write('Nothing to compact')
+            else:
+                self.stdout.write(f'Would delete change log entries up to seq {target}')
+            return
+        target, deleted = compaction.run()
+        if target is None:
+            self.stdout.write('Nothing to compact')
+        else:
+            self.stdout.write(f'{deleted} change log entries deleted up to seq {target}')
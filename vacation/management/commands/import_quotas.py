@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vacation.quota_import import IMPORT_CHUNK_SIZE, import_quotas
+
+
+class Command(BaseCommand):
+    help = 'Upsert annual leave quotas (HolidayTimes) from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension, else jsonl')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            report = import_quotas(sys.stdin.buffer, fmt, options['chunk_size'])
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    report = import_quotas(stream, fmt, options['chunk_size'])
+            except OSError as e:
+                raise CommandError(e)
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(f"{report['rows']} rows read, {report['imported']} imported, {report['error_count']} errors")
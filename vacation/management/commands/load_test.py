@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from vacation import loadtest
+from vacation.workflow_stub import WorkflowStub
+
+
+class Command(BaseCommand):
+    help = ('Drive the vacation endpoints against data from seed_load_data and report requests/second, '
+            'p50/p95/p99 latency and SQL queries per request (from /metrics). In-process by default, with a '
+            'local workflow stub; --url targets a running server instead (set METRICS_SAMPLE_RATE = 1 there, '
+            'and point its WORKFLOW_* / APPROVAL_RESULTS_URL settings at manage.py load_test --serve-stub). '
+            'With SQLite, run write endpoints with --workers 1.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent client threads')
+        parser.add_argument('--endpoints', help='Comma-separated endpoints (default: all reads)')
+        parser.add_argument('--writes', action='store_true', help='Also drive the write endpoints')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--callback-secret', default='load-test',
+                            help="APPROVAL_CALLBACK_SECRET of the server (with --url; '' skips approval_callback)")
+        parser.add_argument('--stub-latency', type=float, default=0.05, help='Seconds per workflow stub response')
+        parser.add_argument('--serve-stub', type=int, metavar='PORT', help='Only run the workflow stub on PORT')
+
+    def handle(self, *args, **options):
+        if options['serve_stub'] is not None:
+            return self.serve_stub(options['serve_stub'], options['stub_latency'])
+        names = options['endpoints'].split(',') if options['endpoints'] else list(loadtest.READ_ENDPOINTS)
+        if options['writes']:
+            names += loadtest.WRITE_ENDPOINTS
+        unknown = set(names) - set(loadtest.READ_ENDPOINTS) - set(loadtest.WRITE_ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        try:
+            workload = loadtest.Workload(seed=options['seed'], callback_secret=options['callback_secret'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['url']:
+            runner = loadtest.LoadRunner(loadtest.HttpTransport(options['url']), workload)
+            elapsed, report = runner.run(names, options['requests'], options['workers'])
+        else:
+            with WorkflowStub(latency=options['stub_latency']) as stub, \
+                    override_settings(**loadtest.load_test_settings(stub, options['callback_secret'])):
+                runner = loadtest.LoadRunner(loadtest.InProcessTransport(), workload)
+                elapsed, report = runner.run(names, options['requests'], options['workers'])
+            self.stdout.write(f'workflow stub: {dict(stub.requests)}')
+        self.write_report(elapsed, report, options['workers'])
+
+    def write_report(self, elapsed, report, workers):
+        total = sum(stats['requests'] for stats in report.values())
+        self.stdout.write(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), {workers} workers')
+        self.stdout.write(f'{"endpoint":<26} {"req":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"budget":>6}  statuses')
+        for name, stats in report.items():
+            queries = f'{stats["queries"]:.1f}' if stats['queries'] is not None else '-'
+            over = stats['queries'] is not None and stats['budget'] is not None and stats['queries'] > stats['budget']
+            line = (f'{name:<26} {stats["requests"]:>6} {stats["p50"] * 1000:>8.2f} {stats["p95"] * 1000:>8.2f} '
+                    f'{stats["p99"] * 1000:>8.2f} {queries:>8} {stats["budget"]:>6}  {stats["statuses"]}')
+            self.stdout.write(self.style.ERROR(line) if over else line)
+
+    def serve_stub(self, port, latency):
+        stub = WorkflowStub(host='0.0.0.0', port=port, latency=latency)
+        for name, value in stub.settings().items():
+            self.stdout.write(f"{name} = '{value}'")
+        stub.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            stub.stop()
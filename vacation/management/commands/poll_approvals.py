@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from vacation.integration import get_client
+from vacation.poller import ApprovalPoller
+from vacation.views import update_vacation_status
+
+
+class Command(BaseCommand):
+    help = 'Poll the workflow system for approval results of pending vacation events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single poll cycle and exit')
+        parser.add_argument('--url', help='Approval results endpoint (default: settings.APPROVAL_RESULTS_URL)')
+        parser.add_argument('--concurrency', type=int, help='Maximum concurrent HTTP lookups')
+        parser.add_argument('--batch-size', type=int, help='Tickets per lookup, if the upstream supports ticket_ids=')
+
+    def handle(self, *args, **options):
+        poller = ApprovalPoller(
+            update_vacation_status,
+            url=options['url'],
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            session=get_client().session,
+        )
+        if options['once']:
+            decided = poller.run_once()
+            self.stdout.write(f'{decided} vacation events decided')
+            self.stdout.write(f'HTTP client: {get_client().stats()}')
+            return
+        try:
+            poller.run_forever()
+        except KeyboardInterrupt:
+            poller.stop()
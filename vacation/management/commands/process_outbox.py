@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from vacation.outbox import OutboxWorker
+from vacation.views import create_workflow
+
+
+class Command(BaseCommand):
+    help = 'Send queued workflow ticket requests from the outbox to the workflow system'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit')
+        parser.add_argument('--workers', type=int, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, help='Rows claimed per worker per round')
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(create_workflow, workers=options['workers'], batch_size=options['batch_size'])
+        if options['once']:
+            self.stdout.write(f'{worker.drain()} outbox rows processed')
+            return
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            worker.stop()
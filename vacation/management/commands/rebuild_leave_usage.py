@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from vacation.usage import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the LeaveUsage reporting table from the leave history in one GROUP BY pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only rebuild this year (default: everything)')
+
+    def handle(self, *args, **options):
+        created = rebuild(options['year'])
+        scope = options['year'] if options['year'] is not None else 'all years'
+        self.stdout.write(f'{created} usage rows rebuilt for {scope}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from vacation.ledger import Reconciliation
+
+
+class Command(BaseCommand):
+    help = ('Recompute every annual leave balance from the quota ledger credits and the leave history, and '
+            'report HolidayTimes counters or ledger balances that drifted from it. --fix corrects them and '
+            'records adjust entries')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only this quota year (default: all)')
+        parser.add_argument('--fix', action='store_true', help='Correct the drifted balances')
+
+    def handle(self, *args, **options):
+        reconciliation = Reconciliation(options['year'])
+        drifts = list(reconciliation.drifts())
+        for drift in drifts:
+            self.stdout.write(str(drift))
+        if options['fix'] and drifts:
+            fixed = reconciliation.fix(drifts)
+            self.stdout.write(f'{len(drifts)} balances drifted, {len(fixed)} fixed')
+        else:
+            self.stdout.write(f'{len(drifts)} balances drifted')
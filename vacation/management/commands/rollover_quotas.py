@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vacation.rollover import Rollover
+
+
+class Command(BaseCommand):
+    help = "Open a new year's annual leave quotas for everyone who has one in the previous year"
+
+    def add_arguments(self, parser):
+        parser.add_argument('to_year', type=int, help='Year to open, e.g. 2026')
+        parser.add_argument('--from-year', type=int, help='Year to roll over from (default: to_year - 1)')
+        parser.add_argument('--carry-over', type=int, default=0, help='Carry up to this many unused days forward')
+        parser.add_argument('--rules', help='JSON file of [min_workyear, min_cmbyear, days] rules, first match wins '
+                                            '(default: settings.QUOTA_ENTITLEMENT_RULES)')
+        parser.add_argument('--dry-run', action='store_true', help='Print the rows that would be created and exit')
+
+    def handle(self, *args, **options):
+        rules = None
+        if options['rules']:
+            try:
+                with open(options['rules']) as f:
+                    rules = [tuple(int(v) for v in rule) for rule in json.load(f)]
+            except (OSError, ValueError, TypeError) as e:
+                raise CommandError(f'Invalid rules file: {e}')
+        rollover = Rollover(options['to_year'], options['from_year'], options['carry_over'], rules)
+
+        if options['dry_run']:
+            count = 0
+            for opname, entitlement, carried, workyear, cmbyear in rollover.preview():
+                count += 1
+                self.stdout.write(f'+ {opname} {rollover.to_year}: {entitlement + carried} days '
+                                  f'(entitlement {entitlement}, carried {carried}, workyear {workyear}, cmbyear {cmbyear})')
+            self.stdout.write(f'{count} rows would be created, {rollover.existing().count()} already exist '
+                              f'for {rollover.to_year} and are left unchanged')
+            return
+
+        created = rollover.run()
+        self.stdout.write(f'{created} rows created for {rollover.to_year}')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vacation import loadtest
+
+
+class Command(BaseCommand):
+    help = (f'Seed HolidayEvent / LeaveDay / HolidayTimes rows for load tests (users named '
+            f'{loadtest.USER_PREFIX}NNNNNN) and rebuild LeaveUsage. The data is committed: use a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000, help='HolidayEvent rows (100k-1M)')
+        parser.add_argument('--users', type=int, default=10000, help='Users, each with one HolidayTimes row')
+        parser.add_argument('--year', type=int, help='Quota year; leave covers it and the year before (default: this year)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed: the same seed gives the same data')
+        parser.add_argument('--clear', action='store_true', help='Only delete previously seeded rows')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['clear']:
+            self.stdout.write(f'{loadtest.clear()} rows deleted')
+        else:
+            loadtest.clear()
+            created = loadtest.seed(options['events'], options['users'], options['year'], options['seed'])
+            self.stdout.write(', '.join(f'{rows} {table}' for table, rows in created.items()))
+        self.stdout.write(f'{time.perf_counter() - started:.1f}s')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from vacation.ledger import SNAPSHOT_SETTLE_SECONDS, take_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Fold the quota ledger entries written since the last run into quota_snapshot, so balance reads '
+            'only sum the entries after it. Run it periodically (e.g. every few minutes from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle-seconds', type=int, default=SNAPSHOT_SETTLE_SECONDS,
+                            help='Leave entries younger than this for the next run')
+
+    def handle(self, *args, **options):
+        upto, users = take_snapshots(options['settle_seconds'])
+        self.stdout.write(f'Snapshots cover ledger entries up to {upto} ({users} balances updated)')
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from vacation.routers import replicas
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over a stand-in replica with the SQLite backup API, once or '
+            'every --every seconds: local "replication" for trying out DATABASE_REPLICAS. The copy carries '
+            'the heartbeat, so the replica lags by the time since the last copy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica', help='Replica alias to overwrite')
+        parser.add_argument('--every', type=float, help='Keep copying every this many seconds')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias == DEFAULT_DB_ALIAS or alias not in connections:
+            raise CommandError(f'Unknown replica alias: {alias}')
+        for name in (DEFAULT_DB_ALIAS, alias):
+            if connections[name].vendor != 'sqlite':
+                raise CommandError(f'{name} is not SQLite; use the database\'s own replication')
+        while True:
+            replicas.beat()
+            primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+            primary.ensure_connection()
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}')
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,235 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PREFIX = 'vacation'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by view, method and status; every request, not sampled', None),
+    'http_request_duration_seconds': ('histogram', 'Time until the response is returned (sampled)', LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', 'SQL queries run per request (sampled)', QUERY_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'Time spent in SQL per request (sampled)', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Body size of non-streaming responses (sampled)', SIZE_BUCKETS),
+    'background_cycle_seconds': ('histogram', 'One cycle of a background task (approval poller, outbox)',
+                                 LATENCY_BUCKETS),
+    'approval_poll_tickets_total': ('counter', 'Tickets looked up by the approval poller, by outcome', None),
+    'workflow_outbox_rows_total': ('counter', 'Outbox rows processed, by resulting status', None),
+    'outbound_http_seconds': ('histogram', 'Requests to the workflow system, by host and status', LATENCY_BUCKETS),
+}
+
+
+def metrics_setting(name, default):
+    return getattr(settings, f'METRICS_{name}', default)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format.
+
+    Each process keeps its own numbers; with several workers, scrape each of them (or sum in
+    Prometheus). Series are keyed by ``(name, sorted label items)``.
+    """
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = Histogram(self.metrics[name][2])
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        # Also usable as a decorator
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self.lock:
+            series = sorted((key, value if not isinstance(value, Histogram) else
+                             (list(value.counts), value.sum, value.count)) for key, value in self.series.items())
+        lines = []
+        current = None
+        for (name, labels), value in series:
+            full_name = f'{PREFIX}_{name}'
+            if name != current:
+                kind, help_text, _ = self.metrics[name]
+                lines += [f'# HELP {full_name} {help_text}', f'# TYPE {full_name} {kind}']
+                current = name
+            if not isinstance(value, tuple):
+                lines.append(f'{full_name}{format_labels(labels)} {format_number(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket in zip(self.metrics[name][2] + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f'{full_name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{full_name}_sum{format_labels(labels)} {format_number(total)}')
+            lines.append(f'{full_name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+registry = Registry()
+
+
+# -- per-request SQL timing ---------------------------------------------------
+
+class RequestSample:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0
+
+
+# The sample of the request being handled; contextvars follow a request into sync_to_async
+# threads, so the queries of async views are counted too
+current_sample = ContextVar('vacation_metrics_sample', default=None)
+
+
+def query_hook(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_seconds += time.perf_counter() - started
+
+
+def install_query_hook(sender, connection, **kwargs):
+    # connection_created receiver: every connection (one per thread and alias) gets the hook
+    # once; for unsampled requests it is a single ContextVar lookup
+    if query_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_hook)
+
+
+def observe_outbound(host, status, seconds):
+    registry.observe('outbound_http_seconds', seconds, host=host, status=status)
+
+
+async def httpx_request_hook(request):
+    request.extensions['metrics_started'] = time.perf_counter()
+
+
+async def httpx_response_hook(response):
+    started = response.request.extensions.get('metrics_started')
+    if started is not None:
+        observe_outbound(response.request.url.netloc.decode(), response.status_code, time.perf_counter() - started)
+
+
+def requests_hook(response, *args, **kwargs):
+    # requests response hook (build_session)
+    observe_outbound(urlparse(response.request.url).netloc, response.status_code, response.elapsed.total_seconds())
+
+
+class MetricsMiddleware:
+    """Records latency, SQL count/time and response size per view for ``METRICS_SAMPLE_RATE`` of
+    the requests (0 turns sampling off, 1 records every request); the request counter always
+    counts. Put it first in MIDDLEWARE so the timing covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = metrics_setting('SAMPLE_RATE', 1.0)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        sample, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                current_sample.reset(token)
+        self.finish(request, response, sample)
+        return response
+
+    async def acall(self, request):
+        sample, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                current_sample.reset(token)
+        self.finish(request, response, sample)
+        return response
+
+    def start(self):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None, None
+        sample = RequestSample()
+        return sample, current_sample.set(sample)
+
+    def finish(self, request, response, sample):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        registry.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        if sample is None:
+            return
+        registry.observe('http_request_duration_seconds', time.perf_counter() - sample.started, view=view)
+        registry.observe('http_request_db_queries', sample.queries, view=view)
+        registry.observe('http_request_db_seconds', sample.db_seconds, view=view)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', len(response.content), view=view)
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HolidayEvent',
+            fields=[
+                ('holidayevents_id', models.AutoField(primary_key=True, serialize=False)),
+                ('holidayevents_hname', models.CharField(max_length=20)),
+                ('holidayevents_htype', models.CharField(max_length=20)),
+                ('holidayevents_day', models.TextField()),
+                ('holidayevents_remark', models.TextField()),
+                ('holidayevents_ispermit', models.IntegerField()),
+                ('holidayevents_approval_user', models.TextField()),
+                ('holidayevents_approval_opinion', models.TextField()),
+                ('holidayevents_permittime', models.CharField(blank=True, max_length=20, null=True)),
+                ('holidayevents_usedDay', models.IntegerField()),
+                ('holidayevents_addtime', models.DateTimeField()),
+                ('runiuId', models.CharField(blank=True, max_length=255, verbose_name='孺牛单ID')),
+                ('taskId', models.CharField(blank=True, max_length=255, verbose_name='孺牛任务状态ID')),
+            ],
+            options={
+                'db_table': 'holiday_events',
+            },
+        ),
+        migrations.CreateModel(
+            name='HolidayTimes',
+            fields=[
+                ('holidaytimes_id', models.AutoField(primary_key=True, serialize=False)),
+                ('holidaytimes_opname', models.CharField(max_length=11)),
+                ('holidaytimes_year', models.IntegerField()),
+                ('holidaytimes_days', models.IntegerField()),
+                ('holidaytimes_haddays', models.IntegerField()),
+                ('holidaytimes_addtime', models.DateTimeField()),
+                ('holidaytimes_workyear', models.IntegerField()),
+                ('holidaytimes_cmbyear', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'holiday_times',
+            },
+        ),
+        migrations.CreateModel(
+            name='SpecialHoliday',
+            fields=[
+                ('specialholiday_id', models.AutoField(primary_key=True, serialize=False)),
+                ('specialholiday_type', models.IntegerField()),
+                ('specialholiday_remark', models.TextField()),
+                ('specialholiday_standard', models.CharField(max_length=20)),
+            ],
+            options={
+                'db_table': 'special_holiday',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+def epoch_to_datetime(apps, schema_editor):
+    HolidayEvent = apps.get_model('vacation', 'HolidayEvent')
+    events = HolidayEvent.objects.exclude(holidayevents_permittime__isnull=True).exclude(holidayevents_permittime='')
+    batch = []
+    for event in events.only('holidayevents_id', 'holidayevents_permittime').iterator(chunk_size=2000):
+        try:
+            permitted = datetime.fromtimestamp(int(event.holidayevents_permittime), tz=timezone.utc)
+        except (TypeError, ValueError, OverflowError, OSError):
+            continue
+        event.holidayevents_permitted_at = permitted
+        batch.append(event)
+        if len(batch) >= 2000:
+            HolidayEvent.objects.bulk_update(batch, ['holidayevents_permitted_at'])
+            batch = []
+    if batch:
+        HolidayEvent.objects.bulk_update(batch, ['holidayevents_permitted_at'])
+
+
+def datetime_to_epoch(apps, schema_editor):
+    HolidayEvent = apps.get_model('vacation', 'HolidayEvent')
+    events = HolidayEvent.objects.exclude(holidayevents_permitted_at__isnull=True)
+    batch = []
+    for event in events.only('holidayevents_id', 'holidayevents_permitted_at').iterator(chunk_size=2000):
+        event.holidayevents_permittime = str(int(event.holidayevents_permitted_at.timestamp()))
+        batch.append(event)
+        if len(batch) >= 2000:
+            HolidayEvent.objects.bulk_update(batch, ['holidayevents_permittime'])
+            batch = []
+    if batch:
+        HolidayEvent.objects.bulk_update(batch, ['holidayevents_permittime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='holidayevent',
+            name='holidayevents_permitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(epoch_to_datetime, datetime_to_epoch),
+        migrations.RemoveField(
+            model_name='holidayevent',
+            name='holidayevents_permittime',
+        ),
+        migrations.RenameField(
+            model_name='holidayevent',
+            old_name='holidayevents_permitted_at',
+            new_name='holidayevents_permittime',
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Shown per conflicting (opname, year) before giving up
+MAX_REPORTED_CONFLICTS = 50
+
+
+def dedupe_quotas(apps, schema_editor):
+    # holiday_times_opname_year_uniq can't be added while a person has two rows for a year. Exact
+    # copies (same balance) are merged into the oldest row; rows that disagree need a person to
+    # decide which one is right, so the migration stops and lists them
+    HolidayTimes = apps.get_model('vacation', 'HolidayTimes')
+    duplicated = HolidayTimes.objects.values('holidaytimes_opname', 'holidaytimes_year').annotate(
+        n=Count('holidaytimes_id')).filter(n__gt=1).order_by('holidaytimes_opname', 'holidaytimes_year')
+    conflicts = []
+    for key in duplicated:
+        rows = list(HolidayTimes.objects.filter(
+            holidaytimes_opname=key['holidaytimes_opname'], holidaytimes_year=key['holidaytimes_year'],
+        ).order_by('holidaytimes_id'))
+        balances = {(row.holidaytimes_days, row.holidaytimes_haddays, row.holidaytimes_workyear,
+                     row.holidaytimes_cmbyear) for row in rows}
+        if len(balances) > 1:
+            conflicts.append(f"  {key['holidaytimes_opname']} {key['holidaytimes_year']}: " + ', '.join(
+                f'id {row.holidaytimes_id} (days={row.holidaytimes_days}, haddays={row.holidaytimes_haddays}, '
+                f'workyear={row.holidaytimes_workyear}, cmbyear={row.holidaytimes_cmbyear})' for row in rows))
+            continue
+        HolidayTimes.objects.filter(holidaytimes_id__in=[row.holidaytimes_id for row in rows[1:]]).delete()
+    if conflicts:
+        shown = conflicts[:MAX_REPORTED_CONFLICTS]
+        if len(conflicts) > len(shown):
+            shown.append(f'  ... and {len(conflicts) - len(shown)} more')
+        raise RuntimeError(
+            f'holiday_times has {len(conflicts)} (opname, year) pairs with conflicting rows. Delete or merge '
+            f'them so each pair has one row, then rerun migrate:\n' + '\n'.join(shown))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0002_holidayevent_permittime_datetime'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='holidayevent',
+            index=models.Index(fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_evt_addtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayevent',
+            index=models.Index(fields=['holidayevents_hname', '-holidayevents_addtime', '-holidayevents_id'], name='holiday_evt_hname_addtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayevent',
+            index=models.Index(condition=models.Q(('holidayevents_ispermit', 1)), fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_evt_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayevent',
+            index=models.Index(fields=['holidayevents_permittime'], name='holiday_evt_permittime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidaytimes',
+            index=models.Index(fields=['-holidaytimes_addtime', '-holidaytimes_id'], name='holiday_times_addtime_idx'),
+        ),
+        migrations.RunPython(dedupe_quotas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='holidaytimes',
+            constraint=models.UniqueConstraint(fields=('holidaytimes_opname', 'holidaytimes_year'), name='holiday_times_opname_year_uniq'),
+        ),
+    ]
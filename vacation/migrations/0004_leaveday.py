@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0003_event_and_quota_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveDay',
+            fields=[
+                ('leaveday_id', models.AutoField(primary_key=True, serialize=False)),
+                ('leaveday_user', models.CharField(max_length=20)),
+                ('leaveday_date', models.DateField()),
+                ('leaveday_event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_days', to='vacation.holidayevent')),
+            ],
+            options={
+                'db_table': 'leave_day',
+                'indexes': [models.Index(fields=['leaveday_date', 'leaveday_user'], name='leave_day_date_user_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaveday',
+            constraint=models.UniqueConstraint(fields=('leaveday_event', 'leaveday_date'), name='leave_day_event_date_uniq'),
+        ),
+    ]
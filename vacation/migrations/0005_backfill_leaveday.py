@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.db import migrations
+
+
+def parse_leave_days(value):
+    # A copy of vacation.models.parse_leave_days() as it stood here, so later changes to it
+    # can't change what this migration does
+    days = {date.fromisoformat(part.strip()) for part in value.split(',') if part.strip()}
+    if not days:
+        raise ValueError(f'No leave days in: {value!r}')
+    return sorted(days)
+
+
+def backfill_leave_days(apps, schema_editor):
+    HolidayEvent = apps.get_model('vacation', 'HolidayEvent')
+    LeaveDay = apps.get_model('vacation', 'LeaveDay')
+    events = HolidayEvent.objects.only('holidayevents_id', 'holidayevents_hname', 'holidayevents_day')
+    batch = []
+    for event in events.iterator(chunk_size=2000):
+        try:
+            days = parse_leave_days(event.holidayevents_day)
+        except ValueError:
+            print(f'Skipping vacation event {event.holidayevents_id}: bad holidayevents_day {event.holidayevents_day!r}')
+            continue
+        batch.extend(
+            LeaveDay(leaveday_event_id=event.holidayevents_id, leaveday_user=event.holidayevents_hname, leaveday_date=day)
+            for day in days
+        )
+        if len(batch) >= 5000:
+            LeaveDay.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        LeaveDay.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0004_leaveday'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leave_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0005_backfill_leaveday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalSchedule',
+            fields=[
+                ('schedule_event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='approval_schedule', serialize=False, to='vacation.holidayevent')),
+                ('schedule_next_check_at', models.DateTimeField(db_index=True)),
+                ('schedule_last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('schedule_checks', models.IntegerField(default=0)),
+                ('schedule_failures', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'approval_schedule',
+            },
+        ),
+    ]
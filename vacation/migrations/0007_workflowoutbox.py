@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0006_approvalschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkflowOutbox',
+            fields=[
+                ('outbox_id', models.AutoField(primary_key=True, serialize=False)),
+                ('outbox_idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('outbox_payload', models.JSONField()),
+                ('outbox_status', models.CharField(default='pending', max_length=10)),
+                ('outbox_attempts', models.IntegerField(default=0)),
+                ('outbox_next_attempt_at', models.DateTimeField()),
+                ('outbox_claim', models.CharField(blank=True, max_length=32)),
+                ('outbox_last_error', models.TextField(blank=True)),
+                ('outbox_addtime', models.DateTimeField()),
+                ('outbox_sent_at', models.DateTimeField(blank=True, null=True)),
+                ('outbox_event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workflow_outbox', to='vacation.holidayevent')),
+            ],
+            options={
+                'db_table': 'workflow_outbox',
+                'indexes': [models.Index(condition=models.Q(('outbox_status', 'pending')), fields=['outbox_next_attempt_at'], name='workflow_outbox_due_idx')],
+            },
+        ),
+    ]
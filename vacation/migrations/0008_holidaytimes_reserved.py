@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
+
+
+def reserve_pending_annual_leave(apps, schema_editor):
+    # Pending 年假 requests submitted before reservations existed still need to hold their days.
+    # Annual leave is charged to the year the request was submitted in (quota.quota_year()), so
+    # each request is reserved on that year's quota row.
+    HolidayEvent = apps.get_model('vacation', 'HolidayEvent')
+    HolidayTimes = apps.get_model('vacation', 'HolidayTimes')
+    pending = (HolidayEvent.objects.filter(holidayevents_ispermit=1, holidayevents_htype='年假')
+               .values('holidayevents_hname', year=ExtractYear('holidayevents_addtime'))
+               .annotate(days=Sum('holidayevents_usedDay')).order_by())
+    for row in pending:
+        HolidayTimes.objects.filter(holidaytimes_opname=row['holidayevents_hname'],
+                                    holidaytimes_year=row['year']).update(holidaytimes_reserved=row['days'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0007_workflowoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='holidaytimes',
+            name='holidaytimes_reserved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(reserve_pending_annual_leave, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0008_holidaytimes_reserved'),
+    ]
+
+    operations = [
+        # specialholiday_day was declared without () and never became a column
+        migrations.AddField(
+            model_name='specialholiday',
+            name='specialholiday_day',
+            field=models.DateField(db_index=True, default=datetime.date(1970, 1, 1)),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:19
+
+from django.db import migrations, models
+from django.db.models import Case, Exists, F, OuterRef, Sum, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+# A copy of vacation.usage.rebuild() as it stood here: migrations must not follow later changes
+# to the app code (or to the models it imports)
+TYPE_HOLIDAY = 1
+TYPE_WORKDAY = 2
+CHUNK_SIZE = 2000
+
+
+def backfill_leave_usage(apps, schema_editor):
+    LeaveDay = apps.get_model('vacation', 'LeaveDay')
+    SpecialHoliday = apps.get_model('vacation', 'SpecialHoliday')
+    LeaveUsage = apps.get_model('vacation', 'LeaveUsage')
+
+    # 调休上班 wins over 节假日, otherwise Monday to Friday
+    special = SpecialHoliday.objects.filter(specialholiday_day=OuterRef('leaveday_date'))
+    worked = Case(
+        When(Exists(special.filter(specialholiday_type=TYPE_WORKDAY)), then=Value(1)),
+        When(Exists(special.filter(specialholiday_type=TYPE_HOLIDAY)), then=Value(0)),
+        When(leaveday_date__iso_week_day__lte=5, then=Value(1)),
+        default=Value(0),
+    )
+    rows = LeaveDay.objects.filter(leaveday_event__holidayevents_ispermit__in=(1, 2)).values(
+        user=F('leaveday_user'),
+        year=ExtractYear('leaveday_date'),
+        month=ExtractMonth('leaveday_date'),
+        htype=F('leaveday_event__holidayevents_htype'),
+    ).annotate(
+        pending=Sum(Case(When(leaveday_event__holidayevents_ispermit=1, then=worked), default=Value(0))),
+        approved=Sum(Case(When(leaveday_event__holidayevents_ispermit=2, then=worked), default=Value(0))),
+    ).order_by()
+
+    batch = []
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        if not row['pending'] and not row['approved']:
+            continue
+        batch.append(LeaveUsage(usage_user=row['user'], usage_year=row['year'], usage_month=row['month'],
+                                usage_htype=row['htype'], usage_pending_days=row['pending'],
+                                usage_approved_days=row['approved']))
+        if len(batch) >= CHUNK_SIZE:
+            LeaveUsage.objects.bulk_create(batch)
+            batch = []
+    LeaveUsage.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0009_specialholiday_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveUsage',
+            fields=[
+                ('usage_id', models.AutoField(primary_key=True, serialize=False)),
+                ('usage_user', models.CharField(max_length=20)),
+                ('usage_year', models.IntegerField()),
+                ('usage_month', models.IntegerField()),
+                ('usage_htype', models.CharField(max_length=20)),
+                ('usage_pending_days', models.IntegerField(default=0)),
+                ('usage_approved_days', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'leave_usage',
+                'indexes': [models.Index(fields=['usage_user', 'usage_year'], name='leave_usage_user_year_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaveusage',
+            constraint=models.UniqueConstraint(fields=('usage_year', 'usage_month', 'usage_htype', 'usage_user'), name='leave_usage_bucket_uniq'),
+        ),
+        migrations.RunPython(backfill_leave_usage, migrations.RunPython.noop),
+    ]
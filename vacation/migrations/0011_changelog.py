@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0010_leaveusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeConsumer',
+            fields=[
+                ('consumer_name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('consumer_seq', models.BigIntegerField(default=0)),
+                ('consumer_seen_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'change_consumer',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('change_seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('change_table', models.CharField(max_length=10)),
+                ('change_key', models.IntegerField()),
+                ('change_op', models.CharField(max_length=10)),
+                ('change_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'change_log',
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeLogCompaction',
+            fields=[
+                ('compaction_id', models.AutoField(primary_key=True, serialize=False)),
+                ('compaction_seq', models.BigIntegerField()),
+                ('compaction_deleted', models.IntegerField()),
+                ('compaction_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'change_log_compaction',
+            },
+        ),
+    ]
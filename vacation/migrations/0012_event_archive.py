@@ -0,0 +1,63 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0011_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HolidayEventArchive',
+            fields=[
+                ('holidayevents_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('holidayevents_hname', models.CharField(max_length=20)),
+                ('holidayevents_htype', models.CharField(max_length=20)),
+                ('holidayevents_day', models.TextField()),
+                ('holidayevents_remark', models.TextField()),
+                ('holidayevents_ispermit', models.IntegerField()),
+                ('holidayevents_approval_user', models.TextField()),
+                ('holidayevents_approval_opinion', models.TextField()),
+                ('holidayevents_permittime', models.DateTimeField(blank=True, null=True)),
+                ('holidayevents_usedDay', models.IntegerField()),
+                ('holidayevents_addtime', models.DateTimeField()),
+                ('runiuId', models.CharField(blank=True, max_length=255, verbose_name='孺牛单ID')),
+                ('taskId', models.CharField(blank=True, max_length=255, verbose_name='孺牛任务状态ID')),
+            ],
+            options={
+                'db_table': 'holiday_events_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaveDayArchive',
+            fields=[
+                ('leaveday_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('leaveday_user', models.CharField(max_length=20)),
+                ('leaveday_date', models.DateField()),
+                ('leaveday_event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_days', to='vacation.holidayeventarchive')),
+            ],
+            options={
+                'db_table': 'leave_day_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='holidayeventarchive',
+            index=models.Index(fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_arch_addtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='holidayeventarchive',
+            index=models.Index(fields=['holidayevents_hname', '-holidayevents_addtime', '-holidayevents_id'], name='holiday_arch_hname_addtime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leavedayarchive',
+            index=models.Index(fields=['leaveday_date', 'leaveday_user'], name='leave_day_arch_date_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leavedayarchive',
+            constraint=models.UniqueConstraint(fields=('leaveday_event', 'leaveday_date'), name='leave_day_arch_event_date_uniq'),
+        ),
+    ]
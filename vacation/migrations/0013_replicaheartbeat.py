@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0012_event_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicaHeartbeat',
+            fields=[
+                ('heartbeat_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('heartbeat_at', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'replica_heartbeat',
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+# A copy of vacation.ledger.open_ledger() as it stood here: migrations must not follow later
+# changes to the app code (or to the models it imports)
+QUOTA_LEAVE_TYPE = '年假'
+KIND_CREDIT = 'credit'
+KIND_RESERVE = 'reserve'
+KIND_DEBIT = 'debit'
+
+
+def backfill_quota_ledger(apps, schema_editor):
+    HolidayTimes = apps.get_model('vacation', 'HolidayTimes')
+    QuotaLedger = apps.get_model('vacation', 'QuotaLedger')
+
+    # Approved annual leave per (user, year submitted in), live and archived
+    approved_days = {}
+    for name in ('HolidayEvent', 'HolidayEventArchive'):
+        rows = apps.get_model('vacation', name).objects.filter(
+            holidayevents_htype=QUOTA_LEAVE_TYPE, holidayevents_ispermit=2,
+        ).values(user=F('holidayevents_hname'), year=ExtractYear('holidayevents_addtime')).annotate(
+            days=Sum('holidayevents_usedDay')).order_by()
+        for row in rows:
+            approved_days[(row['user'], row['year'])] = approved_days.get((row['user'], row['year']), 0) + row['days']
+
+    # The entitlement is credited as days + approved, so credits minus approved leave starts
+    # equal to the counters
+    now = timezone.now()
+    entries = []
+    for quota in HolidayTimes.objects.iterator():
+        user, year = quota.holidaytimes_opname, quota.holidaytimes_year
+        approved = approved_days.get((user, year), 0)
+        for kind, days, haddays, reserved in (
+            (KIND_CREDIT, quota.holidaytimes_days + approved, quota.holidaytimes_haddays - approved, 0),
+            (KIND_DEBIT, -approved, approved, 0),
+            (KIND_RESERVE, 0, 0, quota.holidaytimes_reserved),
+        ):
+            if days or haddays or reserved:
+                entries.append(QuotaLedger(ledger_user=user, ledger_year=year, ledger_kind=kind, ledger_days=days,
+                                           ledger_haddays=haddays, ledger_reserved=reserved, ledger_at=now))
+    QuotaLedger.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0013_replicaheartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaLedger',
+            fields=[
+                ('ledger_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ledger_user', models.CharField(max_length=11)),
+                ('ledger_year', models.IntegerField()),
+                ('ledger_kind', models.CharField(max_length=10)),
+                ('ledger_days', models.IntegerField(default=0)),
+                ('ledger_haddays', models.IntegerField(default=0)),
+                ('ledger_reserved', models.IntegerField(default=0)),
+                ('ledger_event_id', models.IntegerField(blank=True, null=True)),
+                ('ledger_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'quota_ledger',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuotaSnapshot',
+            fields=[
+                ('snapshot_id', models.AutoField(primary_key=True, serialize=False)),
+                ('snapshot_user', models.CharField(max_length=11)),
+                ('snapshot_year', models.IntegerField()),
+                ('snapshot_days', models.IntegerField()),
+                ('snapshot_haddays', models.IntegerField()),
+                ('snapshot_reserved', models.IntegerField()),
+                ('snapshot_ledger_id', models.BigIntegerField()),
+                ('snapshot_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'quota_snapshot',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='quotasnapshot',
+            constraint=models.UniqueConstraint(fields=('snapshot_user', 'snapshot_year'), name='quota_snapshot_user_year_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='quotaledger',
+            index=models.Index(fields=['ledger_user', 'ledger_year', 'ledger_id'], name='quota_ledger_user_year_idx'),
+        ),
+        migrations.RunPython(backfill_quota_ledger, migrations.RunPython.noop),
+    ]
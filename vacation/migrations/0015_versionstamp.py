@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:59
+
+import time
+
+from django.db import migrations, models
+
+
+def create_stamps(apps, schema_editor):
+    VersionStamp = apps.get_model('vacation', 'VersionStamp')
+    VersionStamp.objects.bulk_create([VersionStamp(stamp_table=table, stamp_value=time.time_ns())
+                                      for table in ('events', 'quotas', 'calendar')], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacation', '0014_quotaledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionStamp',
+            fields=[
+                ('stamp_table', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('stamp_value', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'version_stamp',
+            },
+        ),
+        migrations.RunPython(create_stamps, migrations.RunPython.noop),
+    ]
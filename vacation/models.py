@@ -1,6 +1,16 @@
+from datetime import date
+
 from django.db import models
 
 
+def parse_leave_days(value):
+    # "2024-04-01,2024-04-02" -> [date(2024, 4, 1), date(2024, 4, 2)]; raises ValueError on bad dates
+    days = {date.fromisoformat(part.strip()) for part in value.split(',') if part.strip()}
+    if not days:
+        raise ValueError(f'No leave days in: {value!r}')
+    return sorted(days)
+
+
 class HolidayEvent(models.Model):
     # Primary key
     holidayevents_id = models.AutoField(primary_key=True)
@@ -13,7 +23,7 @@ class HolidayEvent(models.Model):
     holidayevents_ispermit = models.IntegerField()  # 审批状态: 1 = 待审批, 2 = 同意, 3 = 拒绝 4 = 已撤销
     holidayevents_approval_user = models.TextField()  # 审批人
     holidayevents_approval_opinion = models.TextField()  # 审批意见
-    holidayevents_permittime = models.CharField(max_length=20, null=True, blank=True)  #审批时间
+    holidayevents_permittime = models.DateTimeField(null=True, blank=True)  # 审批时间
     holidayevents_usedDay = models.IntegerField()  # 休假天数
     holidayevents_addtime = models.DateTimeField()  # 提交时间
     runiuId = models.CharField(max_length=255, blank=True, verbose_name='孺牛单ID')
@@ -21,6 +31,202 @@ class HolidayEvent(models.Model):
 
     class Meta:
         db_table = 'holiday_events'
+        indexes = [
+            # get_vacation_list 及分页游标
+            models.Index(fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_evt_addtime_idx'),
+            # get_user_vacation_info
+            models.Index(fields=['holidayevents_hname', '-holidayevents_addtime', '-holidayevents_id'],
+                         name='holiday_evt_hname_addtime_idx'),
+            # get_approve_vacation_list / 审批轮询: 只索引待审批记录
+            models.Index(fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_evt_pending_idx',
+                         condition=models.Q(holidayevents_ispermit=1)),
+            models.Index(fields=['holidayevents_permittime'], name='holiday_evt_permittime_idx'),
+        ]
+
+
+class LeaveDay(models.Model):
+    # 休假日期明细，每个休假日一行，由 holidayevents_day 拆分而来
+    leaveday_id = models.AutoField(primary_key=True)
+    leaveday_event = models.ForeignKey(HolidayEvent, on_delete=models.CASCADE, related_name='leave_days')
+    leaveday_user = models.CharField(max_length=20)  # 申请用户人姓名，冗余自 holidayevents_hname
+    leaveday_date = models.DateField()  # 休假日期
+
+    class Meta:
+        db_table = 'leave_day'
+        indexes = [
+            models.Index(fields=['leaveday_date', 'leaveday_user'], name='leave_day_date_user_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['leaveday_event', 'leaveday_date'], name='leave_day_event_date_uniq'),
+        ]
+
+    @classmethod
+    def for_event(cls, event, days=None):
+        days = days if days is not None else parse_leave_days(event.holidayevents_day)
+        return [cls(leaveday_event=event, leaveday_user=event.holidayevents_hname, leaveday_date=day) for day in days]
+
+
+class HolidayEventArchive(models.Model):
+    # 冷数据: 已结束（同意 / 拒绝 / 撤销）的往年休假记录，由 archive_events 从 holiday_events 整行搬来，
+    # 列与 id 都和 HolidayEvent 相同；读接口带 include_archived=1 或 year= 时才查这里
+    holidayevents_id = models.IntegerField(primary_key=True)
+
+    holidayevents_hname = models.CharField(max_length=20)
+    holidayevents_htype = models.CharField(max_length=20)
+    holidayevents_day = models.TextField()
+    holidayevents_remark = models.TextField()
+    holidayevents_ispermit = models.IntegerField()
+    holidayevents_approval_user = models.TextField()
+    holidayevents_approval_opinion = models.TextField()
+    holidayevents_permittime = models.DateTimeField(null=True, blank=True)
+    holidayevents_usedDay = models.IntegerField()
+    holidayevents_addtime = models.DateTimeField()
+    runiuId = models.CharField(max_length=255, blank=True, verbose_name='孺牛单ID')
+    taskId = models.CharField(max_length=255, blank=True, verbose_name='孺牛任务状态ID')
+
+    class Meta:
+        db_table = 'holiday_events_archive'
+        indexes = [
+            models.Index(fields=['-holidayevents_addtime', '-holidayevents_id'], name='holiday_arch_addtime_idx'),
+            models.Index(fields=['holidayevents_hname', '-holidayevents_addtime', '-holidayevents_id'],
+                         name='holiday_arch_hname_addtime_idx'),
+        ]
+
+
+class LeaveDayArchive(models.Model):
+    # 归档记录的休假日期明细，与 HolidayEventArchive 一起搬来（team_calendar 查往年、重建 LeaveUsage 用）
+    leaveday_id = models.IntegerField(primary_key=True)
+    leaveday_event = models.ForeignKey(HolidayEventArchive, on_delete=models.CASCADE, related_name='leave_days')
+    leaveday_user = models.CharField(max_length=20)
+    leaveday_date = models.DateField()
+
+    class Meta:
+        db_table = 'leave_day_archive'
+        indexes = [
+            models.Index(fields=['leaveday_date', 'leaveday_user'], name='leave_day_arch_date_user_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['leaveday_event', 'leaveday_date'], name='leave_day_arch_event_date_uniq'),
+        ]
+
+
+class ApprovalSchedule(models.Model):
+    # 审批结果轮询计划，每个已建单的待审批记录一行
+    schedule_event = models.OneToOneField(HolidayEvent, on_delete=models.CASCADE, primary_key=True,
+                                          related_name='approval_schedule')
+    schedule_next_check_at = models.DateTimeField(db_index=True)  # 下次查询时间
+    schedule_last_checked_at = models.DateTimeField(null=True, blank=True)  # 上次查询时间
+    schedule_checks = models.IntegerField(default=0)  # 已查询次数
+    schedule_failures = models.IntegerField(default=0)  # 连续失败次数
+
+    class Meta:
+        db_table = 'approval_schedule'
+
+
+class WorkflowOutbox(models.Model):
+    # 待发送到审批系统的建单请求，与 HolidayEvent 在同一事务中写入
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_SKIPPED = 'skipped'  # 发送前休假记录已不是待审批状态
+    STATUS_DEAD = 'dead'  # 超过最大重试次数
+
+    outbox_id = models.AutoField(primary_key=True)
+    outbox_event = models.ForeignKey(HolidayEvent, on_delete=models.CASCADE, related_name='workflow_outbox')
+    outbox_idempotency_key = models.CharField(max_length=64, unique=True)
+    outbox_payload = models.JSONField()  # create_workflow 参数
+    outbox_status = models.CharField(max_length=10, default=STATUS_PENDING)
+    outbox_attempts = models.IntegerField(default=0)
+    outbox_next_attempt_at = models.DateTimeField()  # 下次发送时间，处理中时为租约到期时间
+    outbox_claim = models.CharField(max_length=32, blank=True)  # 当前处理者
+    outbox_last_error = models.TextField(blank=True)
+    outbox_addtime = models.DateTimeField()
+    outbox_sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'workflow_outbox'
+        indexes = [
+            models.Index(fields=['outbox_next_attempt_at'], name='workflow_outbox_due_idx',
+                         condition=models.Q(outbox_status='pending')),
+        ]
+
+
+class LeaveUsage(models.Model):
+    # 休假统计汇总: 每人每月每种假期一行，随提交/审批/撤销/删除增量更新，可用 rebuild_leave_usage 重算
+    usage_id = models.AutoField(primary_key=True)
+    usage_user = models.CharField(max_length=20)  # 申请用户人姓名
+    usage_year = models.IntegerField()
+    usage_month = models.IntegerField()
+    usage_htype = models.CharField(max_length=20)  # 休假类型
+    usage_pending_days = models.IntegerField(default=0)  # 待审批的工作日天数
+    usage_approved_days = models.IntegerField(default=0)  # 已批准的工作日天数
+
+    class Meta:
+        db_table = 'leave_usage'
+        indexes = [
+            models.Index(fields=['usage_user', 'usage_year'], name='leave_usage_user_year_idx'),
+        ]
+        constraints = [
+            # Leading year/month: reports always filter on the year
+            models.UniqueConstraint(fields=['usage_year', 'usage_month', 'usage_htype', 'usage_user'],
+                                    name='leave_usage_bucket_uniq'),
+        ]
+
+
+class ChangeLog(models.Model):
+    # 数据变更日志，只追加；与 HolidayEvent / HolidayTimes 的写入在同一事务中，供 changes?since= 增量同步
+    TABLE_EVENT = 'event'
+    TABLE_QUOTA = 'quota'
+    OP_UPSERT = 'upsert'
+    OP_DELETE = 'delete'
+
+    change_seq = models.BigAutoField(primary_key=True)
+    change_table = models.CharField(max_length=10)  # event / quota
+    change_key = models.IntegerField()  # holidayevents_id / holidaytimes_id
+    change_op = models.CharField(max_length=10)  # upsert / delete
+    change_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'change_log'
+
+
+class ChangeConsumer(models.Model):
+    # 已知的增量同步方，记录其已处理到的位置；压缩只删除所有消费方都已读过的日志
+    consumer_name = models.CharField(max_length=64, primary_key=True)
+    consumer_seq = models.BigIntegerField(default=0)
+    consumer_seen_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'change_consumer'
+
+
+class ChangeLogCompaction(models.Model):
+    # 每次压缩一行: change_seq <= compaction_seq 的日志已删除，since 更早的请求需要全量重新同步
+    compaction_id = models.AutoField(primary_key=True)
+    compaction_seq = models.BigIntegerField()
+    compaction_deleted = models.IntegerField()
+    compaction_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'change_log_compaction'
+
+
+class ReplicaHeartbeat(models.Model):
+    # 主库上的一行心跳，由 vacation/routers.py 定期写入并随复制到达从库；从库上读到的时间即其已同步到的位置
+    heartbeat_id = models.IntegerField(primary_key=True)
+    heartbeat_at = models.BigIntegerField()  # time.time_ns()，与版本戳同一时钟
+
+    class Meta:
+        db_table = 'replica_heartbeat'
+
+
+class VersionStamp(models.Model):
+    # 每组表一行 (events / quotas / calendar)，与数据写入在同一事务中更新；ETag / Last-Modified 的来源，
+    # 随复制到达从库后可据此判断从库是否已包含最近的写入
+    stamp_table = models.CharField(max_length=20, primary_key=True)
+    stamp_value = models.BigIntegerField()  # 最近一次写入的 time.time_ns()，严格递增
+
+    class Meta:
+        db_table = 'version_stamp'
 
 
 class HolidayTimes(models.Model):
@@ -30,18 +236,74 @@ class HolidayTimes(models.Model):
     holidaytimes_year = models.IntegerField()  # 休假年份
     holidaytimes_days = models.IntegerField()  # 可休天数
     holidaytimes_haddays = models.IntegerField()  # 已休天数
+    holidaytimes_reserved = models.IntegerField(default=0)  # 待审批申请占用的天数（包含在可休天数内）
     holidaytimes_addtime = models.DateTimeField()  # 添加时间
     holidaytimes_workyear = models.IntegerField()  # 工作年份
     holidaytimes_cmbyear = models.IntegerField()  # Cmb年份
 
     class Meta:
         db_table = 'holiday_times'
+        indexes = [
+            models.Index(fields=['-holidaytimes_addtime', '-holidaytimes_id'], name='holiday_times_addtime_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['holidaytimes_opname', 'holidaytimes_year'],
+                                    name='holiday_times_opname_year_uniq'),
+        ]
+
+
+class QuotaLedger(models.Model):
+    # 年假额度流水，只追加；与 HolidayTimes 计数器的每次变化在同一事务中写入，记录各计数器的增减
+    KIND_CREDIT = 'credit'  # 额度发放或修改：新建、导入、结转、手工修改、删除
+    KIND_RESERVE = 'reserve'  # 提交年假申请，占用
+    KIND_RELEASE = 'release'  # 拒绝 / 撤销 / 删除待审批申请，释放占用
+    KIND_DEBIT = 'debit'  # 审批通过，占用转为已休
+    KIND_ADJUST = 'adjust'  # reconcile_quotas 修正偏差
+
+    ledger_id = models.BigAutoField(primary_key=True)
+    ledger_user = models.CharField(max_length=11)  # 用户姓名
+    ledger_year = models.IntegerField()  # 休假年份
+    ledger_kind = models.CharField(max_length=10)
+    ledger_days = models.IntegerField(default=0)  # holidaytimes_days 的变化
+    ledger_haddays = models.IntegerField(default=0)  # holidaytimes_haddays 的变化
+    ledger_reserved = models.IntegerField(default=0)  # holidaytimes_reserved 的变化
+    ledger_event_id = models.IntegerField(null=True, blank=True)  # 相关休假记录（记录可能已删除或归档）
+    ledger_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'quota_ledger'
+        indexes = [
+            # 余额 = 快照 + 快照之后的流水
+            models.Index(fields=['ledger_user', 'ledger_year', 'ledger_id'], name='quota_ledger_user_year_idx'),
+        ]
+
+
+class QuotaSnapshot(models.Model):
+    # 每人每年一行: ledger_id <= snapshot_ledger_id 的流水之和
+    snapshot_id = models.AutoField(primary_key=True)
+    snapshot_user = models.CharField(max_length=11)
+    snapshot_year = models.IntegerField()
+    snapshot_days = models.IntegerField()
+    snapshot_haddays = models.IntegerField()
+    snapshot_reserved = models.IntegerField()
+    snapshot_ledger_id = models.BigIntegerField()
+    snapshot_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'quota_snapshot'
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot_user', 'snapshot_year'], name='quota_snapshot_user_year_uniq'),
+        ]
+
 
 class SpecialHoliday(models.Model):
+    TYPE_HOLIDAY = 1  # 法定节假日（工作日放假）
+    TYPE_WORKDAY = 2  # 调休上班（周末上班）
+
     # Primary key
     specialholiday_id = models.AutoField(primary_key=True)
-    specialholiday_day = models.DateField 
-    specialholiday_type = models.IntegerField()
+    specialholiday_day = models.DateField(db_index=True)  # 日期
+    specialholiday_type = models.IntegerField()  # 1 = 节假日, 2 = 调休上班
     specialholiday_remark = models.TextField()
     specialholiday_standard = models.CharField(max_length=20)
 
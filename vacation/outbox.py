@@ -0,0 +1,135 @@
+import logging
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .metrics import registry
+from .models import WorkflowOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_setting(name, default):
+    return getattr(settings, f'WORKFLOW_OUTBOX_{name}', default)
+
+
+def enqueue_workflow(event, **payload):
+    # Call inside the transaction that saves ``event`` so the two commit or roll back together
+    now = timezone.now()
+    return WorkflowOutbox.objects.create(
+        outbox_event=event,
+        outbox_idempotency_key=f'vacation-{event.holidayevents_id}',
+        outbox_payload=payload,
+        outbox_next_attempt_at=now,
+        outbox_addtime=now,
+    )
+
+
+class OutboxWorker:
+    """Drains ``WorkflowOutbox`` with a pool of worker threads.
+
+    Workers claim due rows in batches by pushing ``outbox_next_attempt_at`` out by a lease, so
+    concurrent workers (or processes) never send the same row twice, and a worker that dies
+    mid-batch only delays its rows until the lease runs out. ``send(idempotency_key=..., **payload)``
+    raises on failure; failures are retried with jittered exponential backoff and dead-lettered
+    after ``MAX_ATTEMPTS``.
+    """
+
+    def __init__(self, send, workers=None, batch_size=None, max_attempts=None, lease=None):
+        self.send = send
+        self.workers = workers or outbox_setting('WORKERS', 4)
+        self.batch_size = batch_size or outbox_setting('BATCH_SIZE', 20)
+        self.max_attempts = max_attempts or outbox_setting('MAX_ATTEMPTS', 8)
+        self.lease = timedelta(seconds=lease or outbox_setting('LEASE', 300))
+        self.base_delay = outbox_setting('RETRY_DELAY', 30)
+        self.max_delay = outbox_setting('MAX_RETRY_DELAY', 3600)
+        self.interval = outbox_setting('POLL_INTERVAL', 5)
+        self.stop_event = threading.Event()
+
+    def claim(self):
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        due = WorkflowOutbox.objects.filter(outbox_status=WorkflowOutbox.STATUS_PENDING, outbox_next_attempt_at__lte=now)
+        ids = list(due.order_by('outbox_next_attempt_at').values_list('outbox_id', flat=True)[:self.batch_size])
+        if not ids:
+            return []
+        # Only rows nobody else claimed in the meantime are still due
+        due.filter(outbox_id__in=ids).update(outbox_next_attempt_at=now + self.lease, outbox_claim=token)
+        return list(WorkflowOutbox.objects.filter(outbox_claim=token, outbox_status=WorkflowOutbox.STATUS_PENDING)
+                    .select_related('outbox_event'))
+
+    def retry_delay(self, attempts):
+        return random.uniform(0, min(self.base_delay * 2 ** min(attempts, 16), self.max_delay))
+
+    def process(self, row):
+        now = timezone.now()
+        event = row.outbox_event
+        if event.runiuId or event.holidayevents_ispermit != 1:
+            # Already sent by an earlier attempt, or revoked/decided before we got to it
+            row.outbox_status = WorkflowOutbox.STATUS_SENT if event.runiuId else WorkflowOutbox.STATUS_SKIPPED
+            row.save(update_fields=['outbox_status'])
+            return row.outbox_status
+        try:
+            self.send(idempotency_key=row.outbox_idempotency_key, **row.outbox_payload)
+        except Exception as e:
+            row.outbox_attempts += 1
+            row.outbox_last_error = str(e)[:2000]
+            if row.outbox_attempts >= self.max_attempts:
+                row.outbox_status = WorkflowOutbox.STATUS_DEAD
+                logger.exception('Workflow outbox %s dead-lettered after %s attempts', row.outbox_id, row.outbox_attempts)
+            else:
+                row.outbox_next_attempt_at = now + timedelta(seconds=self.retry_delay(row.outbox_attempts))
+            row.save(update_fields=['outbox_attempts', 'outbox_last_error', 'outbox_status', 'outbox_next_attempt_at'])
+            return row.outbox_status
+        row.outbox_status = WorkflowOutbox.STATUS_SENT
+        row.outbox_sent_at = now
+        row.outbox_attempts += 1
+        row.save(update_fields=['outbox_status', 'outbox_sent_at', 'outbox_attempts'])
+        return row.outbox_status
+
+    def drain_one_worker(self):
+        processed = 0
+        while True:
+            rows = self.claim()
+            if not rows:
+                return processed
+            for row in rows:
+                registry.inc('workflow_outbox_rows_total', status=self.process(row))
+                processed += 1
+
+    @registry.timer('background_cycle_seconds', task='workflow_outbox')
+    def drain(self):
+        """Process everything that is due right now; returns the number of rows handled."""
+        if self.workers == 1:
+            return self.drain_one_worker()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.in_thread, self.drain_one_worker) for _ in range(self.workers)]
+            return sum(future.result() for future in futures)
+
+    @staticmethod
+    def in_thread(func):
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            connection.close()
+
+    def run_forever(self, stop_when_idle=False):
+        while not self.stop_event.is_set():
+            try:
+                self.drain()
+                if stop_when_idle and not WorkflowOutbox.objects.filter(
+                        outbox_status=WorkflowOutbox.STATUS_PENDING).exists():
+                    break
+            except Exception:
+                logger.exception('Error draining workflow outbox')
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,152 @@
+import base64
+import heapq
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+
+from . import codec
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+STREAM_CHUNK_SIZE = 2000
+
+
+def encode_cursor(added, pk):
+    raw = json.dumps([added.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Raises ValueError for anything that is not a cursor we handed out
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        added, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(added), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def parse_limit(limit):
+    if limit in (None, ''):
+        return DEFAULT_PAGE_LIMIT
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError(f'Invalid limit: {limit}')
+    return min(limit, MAX_PAGE_LIMIT)
+
+
+def keyset_page(queryset, time_field, id_field, limit, after=None, fields=()):
+    """Return one page of ``queryset.values(*fields)`` newest first, plus the cursor for the next page.
+
+    Rows are ordered by ``(time_field, id_field)`` descending, and ``after`` resumes strictly
+    below the last row of the previous page, so the database only ever reads ``limit + 1`` rows.
+    """
+    rows = list(keyset_query(queryset, time_field, id_field, limit, after, fields))
+    return split_page(rows, time_field, id_field, limit)
+
+
+def query_fields(fields, time_field, id_field):
+    # The cursor and the merge need the keyset columns even when ?fields= leaves them out
+    if not fields:
+        return ()
+    return (*fields, *(field for field in (time_field, id_field) if field not in fields))
+
+
+def keyset_query(queryset, time_field, id_field, limit, after=None, fields=()):
+    queryset = queryset.order_by(f'-{time_field}', f'-{id_field}')
+    if after:
+        added, pk = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lt': added}) | Q(**{time_field: added, f'{id_field}__lt': pk})
+        )
+    return queryset.values(*query_fields(fields, time_field, id_field))[:limit + 1]
+
+
+def split_page(rows, time_field, id_field, limit):
+    # keyset_query() fetches one extra row to know whether there is a next page
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][time_field], rows[-1][id_field])
+    return rows, next_cursor
+
+
+# Several tables with the same columns (holiday_events + holiday_events_archive): each is read
+# in index order and the rows are merged, newest first
+
+def merge_rows(time_field, id_field, *rows):
+    return heapq.merge(*rows, key=lambda row: (row[time_field], row[id_field]), reverse=True)
+
+
+def merged_keyset_page(querysets, time_field, id_field, limit, after=None, fields=()):
+    """keyset_page() over the same query on several tables; each reads at most ``limit + 1`` rows."""
+    rows = merge_rows(time_field, id_field, *(
+        keyset_query(queryset, time_field, id_field, limit, after, fields) for queryset in querysets))
+    return split_page(list(islice(rows, limit + 1)), time_field, id_field, limit)
+
+
+def stream_list(fmt, key, querysets, time_field, id_field, columns, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream ``{key: <list of columns>}`` in ``fmt`` from server-side cursors instead of building the
+    list in memory (MessagePack, which can't be written row by row, is built in one go)."""
+    fields = query_fields(columns, time_field, id_field)
+    rows = merge_rows(time_field, id_field, *(
+        queryset.order_by(f'-{time_field}', f'-{id_field}').values(*fields).iterator(chunk_size=chunk_size)
+        for queryset in querysets))
+    if not fmt.streams():
+        return HttpResponse(fmt.encode({key: codec.shape(fmt, rows, columns)}), content_type=fmt.content_type)
+    return StreamingHttpResponse(codec.iter_list(fmt, key, rows, columns), content_type=fmt.content_type)
+
+
+# Async versions for the ASGI views (vacation/async_views.py)
+
+async def amerge(*rows, key, reverse=False):
+    """heapq.merge() over async iterables (a handful of them, so the heads are just scanned)."""
+    iterators = [aiter(it) for it in rows]
+    heads = {}
+    for i, iterator in enumerate(iterators):
+        row = await anext(iterator, None)
+        if row is not None:
+            heads[i] = row
+    pick = max if reverse else min
+    while heads:
+        i = pick(heads, key=lambda i: (key(heads[i]), i if not reverse else -i))
+        yield heads[i]
+        row = await anext(iterators[i], None)
+        if row is None:
+            del heads[i]
+        else:
+            heads[i] = row
+
+
+def amerge_rows(time_field, id_field, *rows):
+    return amerge(*rows, key=lambda row: (row[time_field], row[id_field]), reverse=True)
+
+
+async def amerged_keyset_page(querysets, time_field, id_field, limit, after=None, fields=()):
+    rows = []
+    async for row in amerge_rows(time_field, id_field, *(
+            keyset_query(queryset, time_field, id_field, limit, after, fields) for queryset in querysets)):
+        rows.append(row)
+        if len(rows) > limit:
+            break
+    return split_page(rows, time_field, id_field, limit)
+
+
+async def aiter_list(fmt, key, rows, columns):
+    yield codec.list_opening(fmt, key, columns)
+    first = True
+    async for row in rows:
+        yield codec.encode_row(fmt, row, columns) if first else b',' + codec.encode_row(fmt, row, columns)
+        first = False
+    yield codec.list_closing(fmt)
+
+
+def astream_list(fmt, key, querysets, time_field, id_field, columns, chunk_size=STREAM_CHUNK_SIZE):
+    fields = query_fields(columns, time_field, id_field)
+    rows = amerge_rows(time_field, id_field, *(
+        queryset.order_by(f'-{time_field}', f'-{id_field}').values(*fields).aiterator(chunk_size=chunk_size)
+        for queryset in querysets))
+    return StreamingHttpResponse(aiter_list(fmt, key, rows, columns), content_type=fmt.content_type)
@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .metrics import registry
+from .models import ApprovalSchedule, HolidayEvent
+
+logger = logging.getLogger(__name__)
+
+# action_name -> ispermit
+APPROVAL_ACTIONS = {'同意': 2, '拒绝': 3}
+
+
+def poll_setting(name, default):
+    return getattr(settings, f'APPROVAL_POLL_{name}', default)
+
+
+def parse_approval(elements):
+    # Returns (ispermit, operator, message) for the first decided 审批 step, or None while still pending
+    for element in elements or []:
+        if element.get('from_state_name') != '审批':
+            continue
+        ispermit = APPROVAL_ACTIONS.get(element.get('action_name'))
+        if ispermit:
+            return ispermit, element.get('operator') or '', element.get('message') or ''
+    return None
+
+
+def jittered(seconds, jitter=0.2):
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+
+class ApprovalPoller:
+    """Polls the workflow system for pending tickets.
+
+    HTTP lookups run on a bounded thread pool; database reads and writes stay on the calling
+    thread. Each ticket carries a persisted ``ApprovalSchedule`` so recently checked tickets are
+    skipped, old tickets back off towards ``MAX_INTERVAL`` and failing lookups back off
+    exponentially with jitter.
+    """
+
+    def __init__(self, apply_result, url=None, concurrency=None, batch_size=None, timeout=None, session=None):
+        self.apply_result = apply_result
+        self.url = url or getattr(settings, 'APPROVAL_RESULTS_URL', 'http://external.api/approval_results')
+        self.concurrency = concurrency or poll_setting('CONCURRENCY', 8)
+        # Only use batch_size > 1 if the upstream accepts ?ticket_ids=a,b,c
+        self.batch_size = batch_size or poll_setting('BATCH_SIZE', 1)
+        self.timeout = timeout or poll_setting('TIMEOUT', (3.05, 10))
+        self.min_interval = poll_setting('MIN_INTERVAL', 60)
+        if getattr(settings, 'APPROVAL_CALLBACK_SECRET', ''):
+            # Decisions arrive through approval_callback; polling only reconciles missed callbacks
+            self.min_interval = poll_setting('RECONCILE_INTERVAL', 1800)
+        self.max_interval = poll_setting('MAX_INTERVAL', 3600)
+        self.stale_after = timedelta(seconds=poll_setting('STALE_AFTER', 3 * 24 * 3600))
+        self.max_due = poll_setting('MAX_DUE', 500)
+        self.session = session or requests
+        self.stop_event = threading.Event()
+
+    # -- scheduling ---------------------------------------------------------
+
+    def due_events(self, now):
+        events = HolidayEvent.objects.filter(holidayevents_ispermit=1).exclude(runiuId='').filter(
+            Q(approval_schedule__isnull=True) | Q(approval_schedule__schedule_next_check_at__lte=now)
+        )
+        return list(events.select_related('approval_schedule')
+                    .order_by('approval_schedule__schedule_next_check_at')[:self.max_due])
+
+    def next_interval(self, event, schedule, now):
+        # Back off with every unanswered check; tickets nobody has touched for days go to the slowest rate
+        if now - event.holidayevents_addtime > self.stale_after:
+            return jittered(self.max_interval)
+        return jittered(min(self.min_interval * 2 ** min(schedule.schedule_checks, 16), self.max_interval))
+
+    def failure_interval(self, schedule):
+        return random.uniform(0, min(self.min_interval * 2 ** min(schedule.schedule_failures, 16), self.max_interval))
+
+    def seconds_until_next_due(self, now):
+        next_check = ApprovalSchedule.objects.filter(
+            schedule_event__holidayevents_ispermit=1).aggregate(next_check=Min('schedule_next_check_at'))['next_check']
+        if next_check is None:
+            return self.min_interval
+        return min(max((next_check - now).total_seconds(), 1), self.min_interval)
+
+    # -- HTTP ---------------------------------------------------------------
+
+    def fetch_batch(self, ticket_ids):
+        if len(ticket_ids) == 1:
+            response = self.session.get(self.url, params={'ticket_id': ticket_ids[0]}, timeout=self.timeout)
+            response.raise_for_status()
+            return {ticket_ids[0]: response.json().get('data', [])}
+        response = self.session.get(self.url, params={'ticket_ids': ','.join(ticket_ids)}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json().get('data', {})
+        return {ticket_id: data.get(ticket_id, []) for ticket_id in ticket_ids}
+
+    def fetch_all(self, ticket_ids):
+        # {ticket_id: elements or Exception}
+        batches = [ticket_ids[i:i + self.batch_size] for i in range(0, len(ticket_ids), self.batch_size)]
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            futures = {pool.submit(self.fetch_batch, batch): batch for batch in batches}
+            for future, batch in futures.items():
+                try:
+                    results.update(future.result())
+                except Exception as e:
+                    # Backed off per ticket below; a traceback per batch would only repeat itself
+                    logger.warning('Error fetching approval results for %s: %s', ','.join(batch), e)
+                    results.update(dict.fromkeys(batch, e))
+        return results
+
+    # -- cycle --------------------------------------------------------------
+
+    @registry.timer('background_cycle_seconds', task='approval_poll')
+    def run_once(self):
+        """Check every due ticket once. Returns the number of tickets that reached a decision."""
+        now = timezone.now()
+        due = self.due_events(now)
+        if not due:
+            return 0
+        results = self.fetch_all(sorted({event.runiuId for event in due}))
+
+        decided = 0
+        schedules = []
+        for event in due:
+            try:
+                schedule = event.approval_schedule
+            except ApprovalSchedule.DoesNotExist:
+                schedule = ApprovalSchedule(schedule_event=event)
+            schedule.schedule_last_checked_at = now
+            outcome = results.get(event.runiuId)
+            if isinstance(outcome, Exception):
+                registry.inc('approval_poll_tickets_total', outcome='failed')
+                schedule.schedule_failures += 1
+                schedule.schedule_next_check_at = now + timedelta(seconds=self.failure_interval(schedule))
+            else:
+                decision = parse_approval(outcome)
+                registry.inc('approval_poll_tickets_total', outcome='decided' if decision else 'pending')
+                if decision:
+                    try:
+                        if self.apply_result(event, *decision):
+                            decided += 1
+                    except Exception:
+                        logger.exception('Error applying approval result for %s', event.runiuId)
+                schedule.schedule_failures = 0
+                schedule.schedule_checks += 1
+                schedule.schedule_next_check_at = now + timedelta(seconds=self.next_interval(event, schedule, now))
+            schedules.append(schedule)
+
+        ApprovalSchedule.objects.bulk_create(
+            schedules,
+            update_conflicts=True,
+            unique_fields=['schedule_event'],
+            update_fields=['schedule_next_check_at', 'schedule_last_checked_at', 'schedule_checks',
+                           'schedule_failures'],
+        )
+        return decided
+
+    def run_forever(self, stop_when_idle=False):
+        while not self.stop_event.is_set():
+            try:
+                if stop_when_idle and not HolidayEvent.objects.filter(holidayevents_ispermit=1).exists():
+                    break
+                self.run_once()
+                self.stop_event.wait(self.seconds_until_next_due(timezone.now()))
+            except Exception:
+                logger.exception('Error in approval poll cycle')
+                self.stop_event.wait(jittered(self.min_interval))
+
+    def stop(self):
+        self.stop_event.set()
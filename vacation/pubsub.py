@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import uuid
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+
+
+def stream_setting(name, default):
+    return getattr(settings, f'PENDING_STREAM_{name}', default)
+
+
+class Subscription:
+    """One listener: an asyncio.Queue on the listener's event loop, fed from any thread."""
+
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def push(self, item):
+        # Called from the publishing thread
+        try:
+            self.loop.call_soon_threadsafe(self.put, item)
+        except RuntimeError:
+            # Loop already closed; the listener is about to unsubscribe
+            pass
+
+    def put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Too slow to keep up: stop feeding it, the stream tells the client to reload
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+
+class Broker:
+    """In-process pub/sub for the pending queue.
+
+    Messages get ids ``{epoch}-{seq}``; the last ``history`` are kept so a reconnecting client
+    (SSE ``Last-Event-ID`` or long-poll ``?after=``) gets what it missed. An id from another
+    process lifetime or older than the history returns None from subscribe(): the client has to
+    reload the list. Listeners only wait on their queues, so idle connections cost no threads.
+
+    Only publishes made in this process are seen; run the stream in the same process as the
+    views that change the queue (or swap this class for a shared broker).
+    """
+
+    def __init__(self, history=None, queue_size=None):
+        self.lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.history = deque(maxlen=history or stream_setting('HISTORY', 1000))
+        self.queue_size = queue_size or stream_setting('QUEUE_SIZE', 1000)
+        # Weak: a stream abandoned without running its finally (client gone mid-write) doesn't leak
+        self.subscribers = weakref.WeakSet()
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def parse_id(self, event_id):
+        # Sequence number for an id from this process lifetime, else None
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, message):
+        with self.lock:
+            self.seq += 1
+            item = (self.seq, message)
+            self.history.append(item)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.push(item)
+
+    def subscribe(self, after=None):
+        """Register a listener on the running loop; returns ``(subscription, missed, position)``.
+
+        ``after`` is the last event id the client has; ``missed`` is what it needs replayed, or
+        None if that can't be done. ``position`` is the id of the newest message at registration:
+        everything later arrives on the subscription. Registering and reading the history happen
+        under one lock, so nothing published in between is lost or delivered twice.
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscription)
+            position = self.event_id(self.seq)
+            if after is None:
+                return subscription, [], position
+            seq = self.parse_id(after)
+            oldest = self.history[0][0] if self.history else self.seq + 1
+            if seq is None or seq > self.seq or seq < oldest - 1:
+                return subscription, None, position
+            return subscription, [item for item in self.history if item[0] > seq], position
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+
+pending_queue = Broker()
+
+
+def pending_added(event):
+    return {
+        'op': 'added',
+        'id': event.holidayevents_id,
+        'username': event.holidayevents_hname,
+        'leave_type': event.holidayevents_htype,
+        'leave_day': event.holidayevents_day,
+        'used_days': event.holidayevents_usedDay,
+        'addtime': event.holidayevents_addtime.isoformat(),
+    }
+
+
+def pending_removed(event_id, ispermit):
+    # ispermit: what it became (2 approved, 3 rejected, 4 revoked; 0 deleted)
+    return {'op': 'removed', 'id': event_id, 'ispermit': ispermit}
+
+
+def publish_pending(*messages):
+    """Publish ``messages`` to the pending-queue stream once the current transaction commits."""
+    def publish():
+        for message in messages:
+            pending_queue.publish(message)
+
+    if messages:
+        transaction.on_commit(publish)
@@ -0,0 +1,99 @@
+from django.db.models import Case, F, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .changelog import log_rows
+from .ledger import QUOTA_LEAVE_TYPE, entry, record
+from .models import ChangeLog, HolidayTimes, QuotaLedger
+
+
+class QuotaError(Exception):
+    pass
+
+
+def quota_year(event):
+    """The HolidayTimes year an annual-leave request is charged to: the year it was submitted in.
+
+    Its days are reserved in that row at submit, so approval, rejection and revocation must use
+    the same row whenever they happen (ledger.event_totals buckets events the same way).
+    """
+    addtime = event.holidayevents_addtime
+    # A naive time (a request being submitted) is in TIME_ZONE, as the database stores it
+    return (timezone.localtime(addtime) if timezone.is_aware(addtime) else addtime).year
+
+
+def quota_rows(username, year):
+    return HolidayTimes.objects.filter(holidaytimes_opname=username, holidaytimes_year=year)
+
+
+def quota_rows_for(usernames, year):
+    return HolidayTimes.objects.filter(holidaytimes_opname__in=usernames, holidaytimes_year=year)
+
+
+# Each helper is a single conditional UPDATE, so concurrent callers can never over-reserve or
+# double-spend: the database re-checks the condition against the row it is about to write.
+# ``holidaytimes_days + holidaytimes_haddays`` is never changed by any of them. Each logs the
+# rows it changed to the change log and appends the same deltas to the QuotaLedger (callers are
+# inside a transaction).
+
+def reserve(username, year, days, event_id=None):
+    """Hold ``days`` for a pending request. Returns False if the free balance is too small."""
+    updated = quota_rows(username, year).filter(
+        holidaytimes_days__gte=F('holidaytimes_reserved') + days,
+    ).update(holidaytimes_reserved=F('holidaytimes_reserved') + days)
+    if updated:
+        log_rows(ChangeLog.TABLE_QUOTA, quota_rows(username, year))
+        record(entry(username, year, QuotaLedger.KIND_RESERVE, reserved=days, event_id=event_id))
+    return updated == 1
+
+
+def release(username, year, days, event_id=None):
+    """Give back a reservation when a pending request is rejected, revoked or deleted."""
+    # The ledger records the days released; the clamp at 0 only matters once the counters have
+    # already drifted, which reconcile_quotas reports
+    if quota_rows(username, year).update(holidaytimes_reserved=Greatest(F('holidaytimes_reserved') - days, 0)):
+        log_rows(ChangeLog.TABLE_QUOTA, quota_rows(username, year))
+        record(entry(username, year, QuotaLedger.KIND_RELEASE, reserved=-days, event_id=event_id))
+
+
+def consume(username, year, days, event_id=None):
+    """Turn a reservation into used days when the request is approved."""
+    updated = quota_rows(username, year).filter(holidaytimes_days__gte=days).update(
+        holidaytimes_days=F('holidaytimes_days') - days,
+        holidaytimes_haddays=F('holidaytimes_haddays') + days,
+        holidaytimes_reserved=Greatest(F('holidaytimes_reserved') - days, 0),
+    )
+    if updated != 1:
+        raise QuotaError(f'{username} does not have {days} days of annual leave left in {year}')
+    log_rows(ChangeLog.TABLE_QUOTA, quota_rows(username, year))
+    record(entry(username, year, QuotaLedger.KIND_DEBIT, -days, days, -days, event_id=event_id))
+
+
+def apply_batch(year, consumed, released):
+    """Apply many users' approvals and releases at once: ``{username: days}`` each.
+
+    The caller must already have checked (under ``select_for_update``) that every user in
+    ``consumed`` has the days. Everything goes out as one UPDATE with a CASE per user.
+    """
+    users = set(consumed) | set(released)
+    if not users:
+        return 0
+
+    def per_user(values, field, sign):
+        whens = [When(holidaytimes_opname=user, then=F(field) + sign * days) for user, days in values.items() if days]
+        return Case(*whens, default=F(field)) if whens else F(field)
+
+    held = {user: consumed.get(user, 0) + released.get(user, 0) for user in users}
+    updated = quota_rows_for(users, year).update(
+        holidaytimes_days=per_user(consumed, 'holidaytimes_days', -1),
+        holidaytimes_haddays=per_user(consumed, 'holidaytimes_haddays', 1),
+        holidaytimes_reserved=Greatest(per_user(held, 'holidaytimes_reserved', -1), 0),
+    )
+    if updated:
+        log_rows(ChangeLog.TABLE_QUOTA, quota_rows_for(users, year))
+        now = timezone.now()
+        record(*[entry(user, year, QuotaLedger.KIND_DEBIT, -days, days, -days, now=now)
+                 for user, days in consumed.items()],
+               *[entry(user, year, QuotaLedger.KIND_RELEASE, reserved=-days, now=now)
+                 for user, days in released.items()])
+    return updated
@@ -0,0 +1,168 @@
+import csv
+import json
+from functools import reduce
+from operator import or_
+
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .changelog import log_rows
+from .ledger import record_change
+from .models import ChangeLog, HolidayTimes
+from .usercache import user_cache
+from .versions import stamps
+
+IMPORT_CHUNK_SIZE = 1000
+# Only the first errors are kept in the report; the count covers all of them
+MAX_REPORTED_ERRORS = 1000
+
+# Same field names as create_vacation_times
+IMPORT_FIELDS = {
+    'username': 'holidaytimes_opname',
+    'year': 'holidaytimes_year',
+    'days': 'holidaytimes_days',
+    'haddays': 'holidaytimes_haddays',
+    'workyear': 'holidaytimes_workyear',
+    'cmb_year': 'holidaytimes_cmbyear',
+}
+REQUIRED_FIELDS = ['username', 'year', 'days', 'workyear', 'cmb_year']
+# Never overwrite holidaytimes_reserved (live pending requests) or the original addtime
+UPSERT_FIELDS = ['holidaytimes_days', 'holidaytimes_haddays', 'holidaytimes_workyear', 'holidaytimes_cmbyear']
+
+
+def iter_text_lines(stream):
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def iter_records(stream, fmt):
+    """Yield ``(line_no, record_or_error)`` from a CSV (with header) or JSONL byte/text stream."""
+    lines = iter_text_lines(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, ValueError(f'Invalid JSON: {e}')
+            continue
+        yield line_no, record if isinstance(record, dict) else ValueError('Expected a JSON object')
+
+
+def build_quota(record, now):
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f'Missing required field: {missing[0]}')
+    username = str(record['username']).strip()
+    if not username or len(username) > HolidayTimes._meta.get_field('holidaytimes_opname').max_length:
+        raise ValueError(f'Invalid username: {username!r}')
+    values = {}
+    for field in ('year', 'days', 'haddays', 'workyear', 'cmb_year'):
+        raw = record.get(field)
+        try:
+            values[field] = int(raw) if raw not in (None, '') else 0
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be an integer, got {raw!r}')
+        if values[field] < 0:
+            raise ValueError(f'{field} must not be negative')
+    if not 1900 <= values['year'] <= 2999:
+        raise ValueError(f"Invalid year: {values['year']}")
+    return HolidayTimes(
+        holidaytimes_opname=username,
+        holidaytimes_addtime=now,
+        **{IMPORT_FIELDS[field]: value for field, value in values.items()},
+    )
+
+
+class QuotaImport:
+    """Streams quota records into HolidayTimes as chunked ``(opname, year)`` upserts.
+
+    Only one chunk is held in memory at a time. Bad rows are reported and skipped; a chunk the
+    database rejects as a whole is retried row by row so one bad row cannot sink the rest.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': str(message)})
+
+    def upsert(self, quotas):
+        # The upsert doesn't return ids on every backend, so log by natural key
+        rows = HolidayTimes.objects.filter(reduce(or_, (
+            Q(holidaytimes_opname=quota.holidaytimes_opname, holidaytimes_year=quota.holidaytimes_year)
+            for quota in quotas)))
+        before = list(rows.select_for_update())
+        HolidayTimes.objects.bulk_create(
+            quotas,
+            update_conflicts=True,
+            unique_fields=['holidaytimes_opname', 'holidaytimes_year'],
+            update_fields=UPSERT_FIELDS,
+        )
+        log_rows(ChangeLog.TABLE_QUOTA, rows)
+        # on_commit inside the caller's atomic block: readers can't re-cache the old rows in between
+        user_cache.invalidate(*{quota.holidaytimes_opname for quota in quotas})
+        stamps.bump('quotas')
+        # holidaytimes_reserved isn't among UPSERT_FIELDS: existing rows keep theirs
+        reserved = {(quota.holidaytimes_opname, quota.holidaytimes_year): quota.holidaytimes_reserved
+                    for quota in before}
+        for quota in quotas:
+            quota.holidaytimes_reserved = reserved.get((quota.holidaytimes_opname, quota.holidaytimes_year), 0)
+        record_change(before, quotas)
+
+    def flush(self, chunk):
+        if not chunk:
+            return
+        try:
+            with transaction.atomic():
+                self.upsert([quota for _, quota in chunk.values()])
+            self.imported += len(chunk)
+            return
+        except DatabaseError:
+            pass
+        for line_no, quota in chunk.values():
+            try:
+                with transaction.atomic():
+                    self.upsert([quota])
+                self.imported += 1
+            except DatabaseError as e:
+                self.error(line_no, e)
+
+    def run(self, records):
+        now = timezone.now()
+        # Keyed by (opname, year): a later row for the same person and year replaces an earlier one
+        chunk = {}
+        for line_no, record in records:
+            self.rows += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                quota = build_quota(record, now)
+            except ValueError as e:
+                self.error(line_no, e)
+                continue
+            chunk[(quota.holidaytimes_opname, quota.holidaytimes_year)] = (line_no, quota)
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = {}
+        self.flush(chunk)
+        return self.report()
+
+    def report(self):
+        return {'rows': self.rows, 'imported': self.imported, 'error_count': self.error_count, 'errors': self.errors}
+
+
+def import_quotas(stream, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    return QuotaImport(chunk_size).run(iter_records(stream, fmt))
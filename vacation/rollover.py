@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .changelog import log_rows
+from .ledger import credit_rows
+from .models import ChangeLog, HolidayTimes
+from .usercache import user_cache
+from .versions import stamps
+
+# (min workyear, min cmbyear, days), both counted in years of service; the first matching rule wins
+DEFAULT_ENTITLEMENT_RULES = [
+    (20, 0, 15),
+    (10, 0, 10),
+    (1, 0, 5),
+]
+
+
+def entitlement_rules():
+    rules = getattr(settings, 'QUOTA_ENTITLEMENT_RULES', DEFAULT_ENTITLEMENT_RULES)
+    return [(int(workyear), int(cmbyear), int(days)) for workyear, cmbyear, days in rules]
+
+
+def column(name):
+    return connection.ops.quote_name(HolidayTimes._meta.get_field(name).column)
+
+
+class Rollover:
+    """Opens ``to_year`` in HolidayTimes for everyone who has a ``from_year`` row.
+
+    Everything is one ``INSERT ... SELECT`` over the previous year: service years are bumped by
+    one, the entitlement comes from a CASE built from the rule table, and up to ``carry_over``
+    unused (and unreserved) days are added on top. People who already have a ``to_year`` row are
+    left alone, so the job can be rerun safely.
+    """
+
+    def __init__(self, to_year, from_year=None, carry_over=0, rules=None):
+        self.to_year = to_year
+        self.from_year = from_year if from_year is not None else to_year - 1
+        self.carry_over = max(int(carry_over), 0)
+        self.rules = rules if rules is not None else entitlement_rules()
+
+    def parts(self):
+        # SQL fragments (and their params) shared by preview() and run()
+        c = {name: column(f'holidaytimes_{name}') for name in (
+            'opname', 'year', 'days', 'haddays', 'reserved', 'workyear', 'cmbyear', 'addtime')}
+        table = connection.ops.quote_name(HolidayTimes._meta.db_table)
+
+        entitlement, entitlement_params = ['CASE'], []
+        for workyear, cmbyear, days in self.rules:
+            entitlement.append(f'WHEN prev.{c["workyear"]} + 1 >= %s AND prev.{c["cmbyear"]} + 1 >= %s THEN %s')
+            entitlement_params += [workyear, cmbyear, days]
+        entitlement.append('ELSE 0 END')
+
+        unused = f'prev.{c["days"]} - prev.{c["reserved"]}'
+        carry = f'CASE WHEN {unused} <= 0 THEN 0 WHEN {unused} > %s THEN %s ELSE {unused} END'
+
+        source = (
+            f'FROM {table} prev WHERE prev.{c["year"]} = %s AND NOT EXISTS ('
+            f'SELECT 1 FROM {table} cur WHERE cur.{c["opname"]} = prev.{c["opname"]} AND cur.{c["year"]} = %s)'
+        )
+        return {
+            'c': c,
+            'table': table,
+            'entitlement': (' '.join(entitlement), entitlement_params),
+            'carry': (carry, [self.carry_over, self.carry_over]),
+            'source': (source, [self.from_year, self.to_year]),
+        }
+
+    def preview(self):
+        """Yield ``(opname, entitlement, carried, workyear, cmbyear)`` for every row run() would insert."""
+        p = self.parts()
+        c = p['c']
+        (entitlement, entitlement_params), (carry, carry_params), (source, source_params) = (
+            p['entitlement'], p['carry'], p['source'])
+        sql = (f'SELECT prev.{c["opname"]}, {entitlement}, {carry}, prev.{c["workyear"]} + 1, prev.{c["cmbyear"]} + 1 '
+               f'{source} ORDER BY prev.{c["opname"]}')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, entitlement_params + carry_params + source_params)
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    return
+                yield from rows
+
+    def existing(self):
+        return HolidayTimes.objects.filter(holidaytimes_year=self.to_year)
+
+    def run(self):
+        """Insert the new year's rows in one statement; returns how many were created."""
+        p = self.parts()
+        c = p['c']
+        (entitlement, entitlement_params), (carry, carry_params), (source, source_params) = (
+            p['entitlement'], p['carry'], p['source'])
+        sql = (
+            f'INSERT INTO {p["table"]} ({c["opname"]}, {c["year"]}, {c["days"]}, {c["haddays"]}, {c["reserved"]}, '
+            f'{c["addtime"]}, {c["workyear"]}, {c["cmbyear"]}) '
+            f'SELECT prev.{c["opname"]}, %s, ({entitlement}) + ({carry}), 0, 0, %s, '
+            f'prev.{c["workyear"]} + 1, prev.{c["cmbyear"]} + 1 {source}'
+        )
+        now = timezone.now()
+        addtime = connection.ops.adapt_datetimefield_value(now)
+        params = [self.to_year] + entitlement_params + carry_params + [addtime] + source_params
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            log_rows(ChangeLog.TABLE_QUOTA, self.existing().filter(holidaytimes_addtime=now))
+            credit_rows(self.existing().filter(holidaytimes_addtime=now))
+            # Touches an unknown set of users, so start a new cache generation for everyone
+            user_cache.invalidate_all()
+            stamps.bump('quotas')
+            return cursor.rowcount
@@ -0,0 +1,210 @@
+"""Read replicas for the read-only views.
+
+Only views wrapped by views.conditional() (the lists, info, calendar and report endpoints) read
+from a replica; everything else, and every write, uses ``default``. A replica serves a request
+only when
+
+* it answered the last health check and its heartbeat is at most ``REPLICA_MAX_LAG_SECONDS`` old,
+* it has caught up with the last write to the tables the view reads: its copy of their
+  VersionStamp rows (read at each health check) is as new as the primary's, so the ETag never
+  labels old rows with a new version, and
+* the client hasn't written in the last ``REPLICA_STICKY_SECONDS`` (PrimaryPinMiddleware sets
+  a cookie on successful writes).
+
+Otherwise the primary answers, as it does when a replica query fails.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+from .models import ReplicaHeartbeat, VersionStamp
+from .versions import stamps
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'vacation_primary'
+HEARTBEAT_ID = 1
+
+# The replica alias the current request reads from; None means the primary
+read_alias = ContextVar('vacation_read_alias', default=None)
+
+
+def replica_setting(name, default):
+    return getattr(settings, f'REPLICA_{name}', default)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class Replicas:
+    """Health and lag of the ``DATABASE_REPLICAS`` aliases.
+
+    Every ``REPLICA_CHECK_INTERVAL`` seconds one request thread writes the heartbeat on the
+    primary and reads it back from each replica; the others use the last result meanwhile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.heartbeats = {}  # alias -> heartbeat seen on it (ns), None if it failed
+        self.stamps = {}  # alias -> {table: version stamp} seen on it
+
+    def aliases(self):
+        return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+    def beat(self):
+        ReplicaHeartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            heartbeat_id=HEARTBEAT_ID, defaults={'heartbeat_at': time.time_ns()})
+
+    def check(self):
+        self.beat()
+        heartbeats, replica_stamps = {}, {}
+        for alias in self.aliases():
+            try:
+                heartbeat = ReplicaHeartbeat.objects.using(alias).filter(heartbeat_id=HEARTBEAT_ID).first()
+                heartbeats[alias] = heartbeat.heartbeat_at if heartbeat else None
+                replica_stamps[alias] = dict(VersionStamp.objects.using(alias).values_list(
+                    'stamp_table', 'stamp_value'))
+            except DatabaseError:
+                logger.warning('Replica %s failed its health check', alias, exc_info=True)
+                heartbeats[alias] = None
+        self.heartbeats = heartbeats
+        self.stamps = replica_stamps
+        self.checked_at = time.monotonic()
+
+    def refresh(self):
+        due = self.checked_at is None or time.monotonic() - self.checked_at >= replica_setting('CHECK_INTERVAL', 1)
+        if due and self.lock.acquire(blocking=False):
+            try:
+                self.check()
+            except DatabaseError:
+                # The primary itself is failing; the request will find out
+                logger.warning('Replica health check failed', exc_info=True)
+            finally:
+                self.lock.release()
+
+    def mark_down(self, alias):
+        # Until the next check
+        self.heartbeats[alias] = None
+
+    def choose(self, request, tables):
+        """A replica alias for a read of ``tables`` by ``request``, or None for the primary."""
+        if not self.aliases() or request.COOKIES.get(PIN_COOKIE):
+            return None
+        self.refresh()
+        oldest = time.time_ns() - replica_setting('MAX_LAG_SECONDS', 10) * 10**9
+        # A stamp moves inside its write's transaction, so a replica holding it holds the write
+        primary = dict(zip(tables, stamps.for_request(request, *tables))) if tables else {}
+        ready = [alias for alias, heartbeat in self.heartbeats.items()
+                 if heartbeat is not None and heartbeat >= oldest
+                 and all(self.stamps.get(alias, {}).get(table, -1) >= stamp for table, stamp in primary.items())]
+        return random.choice(ready) if ready else None
+
+    def reset(self):
+        self.checked_at = None
+        self.heartbeats = {}
+        self.stamps = {}
+
+
+replicas = Replicas()
+
+
+def on_alias(alias, chunks):
+    # A streaming body runs its queries after the view has returned
+    chunks = iter(chunks)
+    while True:
+        token = read_alias.set(alias)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            read_alias.reset(token)
+        yield chunk
+
+
+async def aon_alias(alias, chunks):
+    chunks = aiter(chunks)
+    while True:
+        token = read_alias.set(alias)
+        try:
+            chunk = await anext(chunks)
+        except StopAsyncIteration:
+            return
+        finally:
+            read_alias.reset(token)
+        yield chunk
+
+
+def pin_streaming(response, alias):
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = aon_alias(alias, response.streaming_content)
+        else:
+            response.streaming_content = on_alias(alias, response.streaming_content)
+    return response
+
+
+def replica_reads(*tables):
+    """Decorator for read-only views (sync or async): run on a replica when Replicas.choose() allows it."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            alias = replicas.choose(request, tables)
+            if alias is None:
+                return view(request, *args, **kwargs)
+            token = read_alias.set(alias)
+            try:
+                return pin_streaming(view(request, *args, **kwargs), alias)
+            except DatabaseError:
+                logger.warning('Replica %s failed, reading from the primary', alias, exc_info=True)
+                replicas.mark_down(alias)
+            finally:
+                read_alias.reset(token)
+            return view(request, *args, **kwargs)
+
+        @wraps(view)
+        async def awrapper(request, *args, **kwargs):
+            # The ORM's sync_to_async threads inherit read_alias from here
+            alias = await sync_to_async(replicas.choose)(request, tables) if replicas.aliases() else None
+            if alias is None:
+                return await view(request, *args, **kwargs)
+            token = read_alias.set(alias)
+            try:
+                return pin_streaming(await view(request, *args, **kwargs), alias)
+            except DatabaseError:
+                logger.warning('Replica %s failed, reading from the primary', alias, exc_info=True)
+                replicas.mark_down(alias)
+            finally:
+                read_alias.reset(token)
+            return await view(request, *args, **kwargs)
+
+        return awrapper if iscoroutinefunction(view) else wrapper
+    return decorator
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+    """After a successful write, the client's reads stay on the primary for ``REPLICA_STICKY_SECONDS``."""
+
+    def process_response(self, request, response):
+        sticky = replica_setting('STICKY_SECONDS', 10)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and sticky:
+            response.set_cookie(PIN_COOKIE, '1', max_age=sticky, httponly=True, samesite='Lax')
+        return response
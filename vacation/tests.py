@@ -1,5 +1,1992 @@
-from django.test import TestCase
+import asyncio
+import base64
+import contextlib
+import gc
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
-# 测试github desktop
-# push test
\ No newline at end of file
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, OperationalError, connection, connections, models, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .archive import EventArchiver
+from .models import (ApprovalSchedule, ChangeConsumer, ChangeLog, HolidayEvent, HolidayEventArchive, HolidayTimes,
+                     LeaveDay, LeaveDayArchive, LeaveUsage, QuotaLedger, QuotaSnapshot, ReplicaHeartbeat,
+                     SpecialHoliday, VersionStamp, WorkflowOutbox)
+from .integration import AsyncTokenCache, AsyncWorkflowClient, ThreadedHTTP, TokenCache, WorkflowClient, build_session
+from .metrics import Registry, registry
+from .outbox import OutboxWorker, enqueue_workflow
+from .poller import ApprovalPoller
+from .pubsub import pending_queue
+from .quota_import import QuotaImport, import_quotas
+from .rollover import Rollover
+from .routers import PIN_COOKIE, replicas
+from .usercache import user_cache
+from .versions import stamps
+from .workflow_stub import WorkflowStub
+from . import async_views, changelog, codec, ledger, loadtest, pagination, usage, views, workdays
+from .views import approval_callback, update_vacation_status
+
+current_year = datetime.now().year
+
+
+def make_event(hname='张三', ispermit=1, htype='年假', day='2024-04-01', addtime=None, **extra):
+    fields = dict(
+        holidayevents_hname=hname,
+        holidayevents_htype=htype,
+        holidayevents_day=day,
+        holidayevents_remark='',
+        holidayevents_ispermit=ispermit,
+        holidayevents_approval_user='',
+        holidayevents_approval_opinion='',
+        holidayevents_usedDay=len(day.split(',')),
+        holidayevents_addtime=addtime or timezone.now(),
+    )
+    fields.update(extra)
+    return HolidayEvent.objects.create(**fields)
+
+
+def make_quota(opname='张三', year=None, days=10, haddays=0, **extra):
+    fields = dict(
+        holidaytimes_opname=opname,
+        holidaytimes_year=year or datetime.now().year,
+        holidaytimes_days=days,
+        holidaytimes_haddays=haddays,
+        holidaytimes_addtime=timezone.now(),
+        holidaytimes_workyear=5,
+        holidaytimes_cmbyear=3,
+    )
+    fields.update(extra)
+    return HolidayTimes.objects.create(**fields)
+
+
+def results_url(stub):
+    return stub.settings()['APPROVAL_RESULTS_URL']
+
+
+class ApprovalPollerTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        self.approved = make_event('张三', runiuId='T1')
+        self.rejected = make_event('张三', runiuId='T2')
+        self.waiting = make_event('张三', runiuId='T3')
+
+    def test_cycle_applies_decisions_and_schedules_the_rest(self):
+        with WorkflowStub(decisions={'T1': '同意', 'T2': '拒绝'}) as stub:
+            poller = ApprovalPoller(update_vacation_status, url=results_url(stub), concurrency=4)
+            self.assertEqual(poller.run_once(), 2)
+            self.assertEqual(stub.requests['lookup'], 3)
+
+            # T3 was just checked, so it is not due again yet
+            self.assertEqual(poller.run_once(), 0)
+            self.assertEqual(stub.requests['lookup'], 3)
+
+        self.approved.refresh_from_db()
+        self.rejected.refresh_from_db()
+        self.assertEqual(self.approved.holidayevents_ispermit, 2)
+        self.assertEqual(self.approved.holidayevents_approval_user, 'stub')
+        self.assertEqual(self.rejected.holidayevents_ispermit, 3)
+        self.assertEqual(HolidayTimes.objects.get().holidaytimes_days, 9)
+        schedule = ApprovalSchedule.objects.get(schedule_event=self.waiting)
+        self.assertEqual(schedule.schedule_checks, 1)
+        self.assertGreater(schedule.schedule_next_check_at, schedule.schedule_last_checked_at)
+
+    def test_batched_lookup(self):
+        with WorkflowStub(decisions={'T1': '同意'}) as stub:
+            poller = ApprovalPoller(update_vacation_status, url=results_url(stub), batch_size=10)
+            self.assertEqual(poller.run_once(), 1)
+            self.assertEqual(stub.requests['lookup'], 1)
+            self.assertEqual(stub.lookups, {'T1': 1, 'T2': 1, 'T3': 1})
+
+    def test_apply_errors_are_logged(self):
+        apply_result = mock.Mock(side_effect=ValueError('bad row'))
+        with WorkflowStub(decisions={'T1': '同意'}) as stub, self.assertLogs('vacation.poller', 'ERROR') as logs:
+            self.assertEqual(ApprovalPoller(apply_result, url=results_url(stub)).run_once(), 0)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Error applying approval result for T1', logs.output[0])
+        self.assertIn('ValueError: bad row', logs.output[0])
+        self.assertEqual(ApprovalSchedule.objects.count(), 3)
+
+    def test_upstream_failure_backs_off(self):
+        with WorkflowStub(fail=True) as stub, self.assertLogs('vacation.poller', 'WARNING') as logs:
+            ApprovalPoller(update_vacation_status, url=results_url(stub)).run_once()
+        # One warning per failed batch (batch_size defaults to 1)
+        self.assertEqual(sorted(record.args[0] for record in logs.records), ['T1', 'T2', 'T3'])
+        schedules = ApprovalSchedule.objects.all()
+        self.assertEqual([s.schedule_failures for s in schedules], [1, 1, 1])
+        self.assertEqual(HolidayEvent.objects.filter(holidayevents_ispermit=1).count(), 3)
+
+
+@override_settings(APPROVAL_CALLBACK_SECRET='s3cret')
+class ApprovalCallbackTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        self.event = make_event('张三', runiuId='T1', day='2024-04-01,2024-04-02')
+
+    def post(self, payload, secret='s3cret'):
+        body = json.dumps(payload).encode()
+        signature = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        request = RequestFactory().post('/', body, content_type='application/json',
+                                        HTTP_X_APPROVAL_SIGNATURE=signature)
+        return approval_callback(request)
+
+    def test_rejects_bad_signature(self):
+        response = self.post({'ticket_id': 'T1', 'action_name': '同意'}, secret='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.holidayevents_ispermit, 1)
+
+    def test_redelivery_is_idempotent(self):
+        payload = {'ticket_id': 'T1', 'action_name': '同意', 'operator': '李四', 'message': 'ok'}
+        self.assertEqual(json.loads(self.post(payload).content)['results'][0]['result'], 'applied')
+        self.assertEqual(json.loads(self.post(payload).content)['results'][0]['result'], 'already_decided')
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.holidayevents_ispermit, 2)
+        self.assertEqual(HolidayTimes.objects.get().holidaytimes_days, 8)
+
+    def test_batch(self):
+        other = make_event('张三', runiuId='T2')
+        response = self.post({'events': [
+            {'ticket_id': 'T1', 'action_name': '拒绝', 'operator': '李四'},
+            {'ticket_id': 'T2', 'action_name': '转交'},
+            {'ticket_id': 'T9', 'action_name': '同意'},
+        ]})
+        results = [r['result'] for r in json.loads(response.content)['results']]
+        self.assertEqual(results, ['applied', 'ignored', 'unknown_ticket'])
+        self.event.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.event.holidayevents_ispermit, other.holidayevents_ispermit), (3, 1))
+
+
+def make_jwt(expires_in):
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': time.time() + expires_in}).encode()).decode().rstrip('=')
+    return f'header.{payload}.signature'
+
+
+class WorkflowClientTests(TestCase):
+    def test_concurrent_callers_share_one_refresh(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return make_jwt(3600)
+
+        cache = TokenCache(fetch)
+        threads = [threading.Thread(target=cache.get) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.counters['token_refreshes'], 1)
+
+    def test_refreshes_ahead_of_expiry(self):
+        tokens = iter([make_jwt(30), make_jwt(3600)])
+        cache = TokenCache(lambda: next(tokens), refresh_margin=60)
+        first = cache.get()
+        self.assertNotEqual(cache.get(), first)
+        self.assertEqual(cache.counters['token_refreshes'], 2)
+
+    def test_failed_refresh_ahead_keeps_the_current_token(self):
+        tokens = iter([make_jwt(30)])
+        cache = TokenCache(lambda: next(tokens), refresh_margin=60)
+        first = cache.get()
+        with self.assertLogs('vacation.integration', 'ERROR') as logs:
+            self.assertEqual(cache.get(), first)
+        self.assertIn('Error refreshing service token', logs.output[0])
+        self.assertIn('StopIteration', logs.output[0])
+
+    def test_session_reuses_connections(self):
+        client = WorkflowClient()
+        with WorkflowStub() as stub:
+            for ticket in ('T1', 'T2', 'T3', 'T4'):
+                client.session.get(results_url(stub), params={'ticket_id': ticket}).raise_for_status()
+        stats = client.stats()
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 3)
+
+
+def post_json(view, payload):
+    request = RequestFactory().post('/', json.dumps(payload), content_type='application/json')
+    return view(request)
+
+
+class WorkflowOutboxTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = post_json(views.submit_vacation, {
+                'username': '张三', 'leave_type': '年假', 'leave_day': '2024-04-01,2024-04-02', 'reason': '回家'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(views.start_or_notify_outbox_worker, callbacks)
+        return WorkflowOutbox.objects.get()
+
+    def test_submit_writes_event_and_outbox_together(self):
+        row = self.submit()
+        self.assertEqual(row.outbox_event.holidayevents_hname, '张三')
+        self.assertEqual(row.outbox_payload['used_days'], 2)
+        self.assertEqual(row.outbox_idempotency_key, f'vacation-{row.outbox_event_id}')
+
+    def test_retries_then_dead_letters(self):
+        row = self.submit()
+        send = mock.Mock(side_effect=ConnectionError('workflow down'))
+        worker = OutboxWorker(send, workers=1, max_attempts=2)
+        self.assertEqual(worker.drain(), 1)
+        row.refresh_from_db()
+        self.assertEqual((row.outbox_status, row.outbox_attempts), ('pending', 1))
+
+        WorkflowOutbox.objects.update(outbox_next_attempt_at=timezone.now())
+        with self.assertLogs('vacation.outbox', 'ERROR') as logs:
+            worker.drain()
+        self.assertIn(f'Workflow outbox {row.outbox_id} dead-lettered after 2 attempts', logs.output[0])
+        self.assertIn('ConnectionError: workflow down', logs.output[0])
+        row.refresh_from_db()
+        self.assertEqual((row.outbox_status, row.outbox_last_error), ('dead', 'workflow down'))
+        self.assertEqual(send.call_count, 2)
+        send.assert_called_with(idempotency_key=row.outbox_idempotency_key, **row.outbox_payload)
+
+    def test_does_not_resend_created_tickets(self):
+        row = self.submit()
+        HolidayEvent.objects.update(runiuId='R1', taskId='K1')
+        send = mock.Mock()
+        OutboxWorker(send, workers=1).drain()
+        send.assert_not_called()
+        row.refresh_from_db()
+        self.assertEqual(row.outbox_status, 'sent')
+
+
+class QuotaAccountingTests(TestCase):
+    def setUp(self):
+        self.quota = make_quota('张三', days=3)
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, leave_day):
+        return post_json(views.submit_vacation, {
+            'username': '张三', 'leave_type': '年假', 'leave_day': leave_day, 'reason': '回家'})
+
+    def test_pending_requests_hold_quota(self):
+        self.assertEqual(self.submit('2024-04-01,2024-04-02').status_code, 201)
+        self.assertEqual(self.submit('2024-04-03,2024-04-04').status_code, 400)
+        self.quota.refresh_from_db()
+        self.assertEqual((self.quota.holidaytimes_days, self.quota.holidaytimes_reserved), (3, 2))
+
+    def test_revoke_releases_and_approve_consumes(self):
+        self.submit('2024-04-01')
+        self.submit('2024-04-02,2024-04-03')
+        first, second = HolidayEvent.objects.order_by('holidayevents_id')
+        post_json(views.revoke_vacation, {'vacation_id': first.holidayevents_id})
+        post_json(views.approve_vacation, {'id': second.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'})
+        self.quota.refresh_from_db()
+        self.assertEqual(
+            (self.quota.holidaytimes_days, self.quota.holidaytimes_haddays, self.quota.holidaytimes_reserved), (1, 2, 0))
+
+        # Already decided: neither a second approval nor a revoke touches the quota again
+        post_json(views.approve_vacation, {'id': second.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'})
+        self.assertEqual(post_json(views.revoke_vacation, {'vacation_id': second.holidayevents_id}).status_code, 400)
+        self.quota.refresh_from_db()
+        self.assertEqual(self.quota.holidaytimes_days, 1)
+
+    def test_requests_stay_charged_to_the_year_they_were_submitted_in(self):
+        # Submitted last December, decided after the new year (and a restart)
+        last_year = make_quota('张三', year=current_year - 1, days=5, holidaytimes_reserved=3)
+        december = timezone.make_aware(datetime(current_year - 1, 12, 20))
+        approved, rejected, revoked = (make_event('张三', day=day, addtime=december)
+                                       for day in ('2024-04-01', '2024-04-02', '2024-04-03'))
+        post_json(views.approve_vacation, {'id': approved.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'})
+        post_json(views.batch_approve_vacation, {'items': [
+            {'id': rejected.holidayevents_id, 'ispermit': 3, 'opinion': 'no'}]})
+        post_json(views.revoke_vacation, {'vacation_id': revoked.holidayevents_id})
+
+        last_year.refresh_from_db()
+        self.quota.refresh_from_db()
+        self.assertEqual((last_year.holidaytimes_days, last_year.holidaytimes_haddays,
+                          last_year.holidaytimes_reserved), (4, 1, 0))
+        self.assertEqual((self.quota.holidaytimes_days, self.quota.holidaytimes_haddays,
+                          self.quota.holidaytimes_reserved), (3, 0, 0))
+
+
+class BatchApproveTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=5, holidaytimes_reserved=5)
+
+    def batch(self, items):
+        return post_json(views.batch_approve_vacation, {'approver': '王五', 'items': items})
+
+    def test_per_item_results_and_aggregated_quota(self):
+        a = make_event('张三', day='2024-04-01,2024-04-02')
+        b = make_event('张三', day='2024-04-03,2024-04-04')
+        c = make_event('张三', day='2024-04-05')
+        sick = make_event('李四', htype='病假')
+        response = self.batch([
+            {'id': a.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'},
+            {'id': b.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'},
+            {'id': c.holidayevents_id, 'ispermit': 3, 'opinion': 'no'},
+            {'id': sick.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'},
+            {'id': a.holidayevents_id, 'ispermit': 3, 'opinion': 'again'},
+            {'id': 999999, 'ispermit': 2, 'opinion': 'ok'},
+            {'id': c.holidayevents_id, 'ispermit': 7, 'opinion': 'ok'},
+        ])
+        results = [r['result'] for r in json.loads(response.content)['results']]
+        self.assertEqual(results, ['approved', 'approved', 'rejected', 'approved', 'already_decided', 'not_found',
+                                   'invalid'])
+        quota = HolidayTimes.objects.get()
+        self.assertEqual((quota.holidaytimes_days, quota.holidaytimes_haddays, quota.holidaytimes_reserved), (1, 4, 0))
+        a.refresh_from_db()
+        self.assertEqual((a.holidayevents_ispermit, a.holidayevents_approval_user), (2, '王五'))
+
+    def test_insufficient_quota_is_reported_per_item(self):
+        events = [make_event('张三', day='2024-04-01,2024-04-02') for _ in range(3)]
+        response = self.batch([{'id': e.holidayevents_id, 'ispermit': 2, 'opinion': 'ok'} for e in events])
+        results = [r['result'] for r in json.loads(response.content)['results']]
+        self.assertEqual(results, ['approved', 'approved', 'quota_error'])
+        self.assertEqual(HolidayEvent.objects.filter(holidayevents_ispermit=1).count(), 1)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def run(n, offset):
+            users = [f'user{offset + i % 7}' for i in range(n)]
+            for user in set(users):
+                make_quota(user, days=100)
+            events = [make_event(user) for user in users]
+            with CaptureQueriesContext(connection) as queries:
+                self.batch([{'id': e.holidayevents_id, 'ispermit': 2 if i % 2 else 3, 'opinion': 'ok'}
+                            for i, e in enumerate(events)])
+            return len(queries)
+
+        # bulk_update still splits at the backend's parameter limit (166 rows per statement on SQLite)
+        self.assertEqual(run(5, 0), run(150, 100))
+
+
+class QuotaConcurrencyTests(TransactionTestCase):
+    """Hammers submit/approve/revoke from many threads; every thread uses its own DB connection."""
+
+    THREADS = 8
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(views, 'start_or_notify_outbox_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_threads(self, target, jobs):
+        errors = []
+
+        def worker(chunk):
+            try:
+                for job in chunk:
+                    target(job)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(jobs[i::self.THREADS],)) for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_submits_never_over_reserve(self):
+        quota = make_quota('张三', days=10)
+        statuses = []
+        self.run_threads(lambda n: statuses.append(post_json(views.submit_vacation, {
+            'username': '张三', 'leave_type': '年假', 'leave_day': f'2024-05-{n:02d}', 'reason': '回家'}).status_code),
+            list(range(1, 31)))
+        quota.refresh_from_db()
+        self.assertEqual(statuses.count(201), 10)
+        self.assertEqual(quota.holidaytimes_reserved, 10)
+        self.assertEqual(HolidayEvent.objects.count(), 10)
+
+    def test_approve_and_revoke_keep_the_invariant(self):
+        quota = make_quota('张三', days=60, haddays=5)
+        events = [make_event('张三', day='2024-06-01,2024-06-02') for _ in range(25)]
+        HolidayTimes.objects.update(holidaytimes_reserved=50)
+
+        # Every event gets an approve, a reject and a revoke racing each other
+        jobs = [(action, e.holidayevents_id) for e in events for action in ('approve', 'reject', 'revoke')] * 2
+        random.Random(0).shuffle(jobs)
+
+        def act(job):
+            action, pk = job
+            if action == 'revoke':
+                post_json(views.revoke_vacation, {'vacation_id': pk})
+            else:
+                post_json(views.approve_vacation, {'id': pk, 'ispermit': 2 if action == 'approve' else 3, 'opinion': ''})
+
+        self.run_threads(act, jobs)
+        quota.refresh_from_db()
+        approved = HolidayEvent.objects.filter(holidayevents_ispermit=2).count()
+        self.assertFalse(HolidayEvent.objects.filter(holidayevents_ispermit=1).exists())
+        self.assertEqual(quota.holidaytimes_days + quota.holidaytimes_haddays, 65)
+        self.assertEqual(quota.holidaytimes_haddays, 5 + 2 * approved)
+        self.assertEqual(quota.holidaytimes_reserved, 0)
+
+
+def make_special_day(day, kind):
+    return SpecialHoliday.objects.create(specialholiday_day=day, specialholiday_type=kind, specialholiday_remark='',
+                                         specialholiday_standard='')
+
+
+class WorkdayCalendarTests(TestCase):
+    def setUp(self):
+        workdays.calendar.invalidate()
+        self.addCleanup(workdays.calendar.invalidate)
+        # 2024 国庆: Oct 1-7 off, Sep 29 (Sun) and Oct 12 (Sat) worked
+        for day in range(1, 8):
+            make_special_day(date(2024, 10, day), SpecialHoliday.TYPE_HOLIDAY)
+        for day in (date(2024, 9, 29), date(2024, 10, 12)):
+            make_special_day(day, SpecialHoliday.TYPE_WORKDAY)
+
+    def test_holidays_and_make_up_days(self):
+        calendar = workdays.calendar
+        self.assertFalse(calendar.is_working_day(date(2024, 10, 2)))
+        self.assertTrue(calendar.is_working_day(date(2024, 10, 12)))
+        self.assertFalse(calendar.is_working_day(date(2024, 10, 13)))
+        self.assertTrue(calendar.is_working_day(date(2024, 10, 8)))
+        # Sep 23-Oct 13: 15 weekdays, 5 of them holidays, plus 2 make-up Sundays/Saturdays
+        self.assertEqual(calendar.working_days_between(date(2024, 9, 23), date(2024, 10, 13)), 12)
+        self.assertEqual(calendar.working_days_between(date(2024, 12, 30), date(2025, 1, 3)), 5)
+
+    def test_range_limits(self):
+        def get(**params):
+            return views.working_days(RequestFactory().get('/', params))
+
+        self.assertEqual(json.loads(get(start='2024-09-23', end='2024-10-13').content)['working_days'], 12)
+        self.assertEqual(get(start='2024-01-01', end='9999-12-31').status_code, 400)
+        self.assertEqual(get(start='2024-10-13', end='2024-09-23').status_code, 400)
+        self.assertEqual(get(day='9999-12-31').status_code, 200)
+        self.assertEqual(workdays.calendar.working_days_between(date(9999, 12, 30), date(9999, 12, 31)), 2)
+        with mock.patch.object(views, 'start_or_notify_approval_check'):
+            for leave_day in ('9999-12-31', '2024-01-02,2025-06-02'):
+                response = post_json(views.submit_vacation, {'username': '张三', 'leave_type': '病假',
+                                                             'reason': '感冒', 'leave_day': leave_day})
+                self.assertEqual(response.status_code, 400 if ',' in leave_day else 201)
+
+    def test_changes_invalidate_the_cache(self):
+        self.assertTrue(workdays.calendar.is_working_day(date(2024, 10, 8)))
+        make_special_day(date(2024, 10, 8), SpecialHoliday.TYPE_HOLIDAY)
+        self.assertFalse(workdays.calendar.is_working_day(date(2024, 10, 8)))
+
+    def test_submit_counts_working_days_only(self):
+        make_quota('张三', days=10)
+        with mock.patch.object(views, 'start_or_notify_approval_check'):
+            post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假', 'reason': '国庆',
+                                              'leave_day': '2024-09-30,2024-10-01,2024-10-05,2024-10-08'})
+            response = post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假', 'reason': '国庆',
+                                                         'leave_day': '2024-10-03,2024-10-05'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(HolidayEvent.objects.get().holidayevents_usedDay, 2)
+        self.assertEqual(HolidayTimes.objects.get().holidaytimes_reserved, 2)
+
+
+class SubmitConflictTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, username, leave_day, leave_type='年假'):
+        return post_json(views.submit_vacation, {
+            'username': username, 'leave_type': leave_type, 'leave_day': leave_day, 'reason': '回家'})
+
+    def test_rejects_overlap_and_keeps_quota(self):
+        self.assertEqual(self.submit('张三', '2024-04-01,2024-04-02').status_code, 201)
+        response = self.submit('张三', '2024-04-02,2024-04-03')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['dates'], ['2024-04-02'])
+        self.assertEqual(HolidayTimes.objects.get().holidaytimes_reserved, 2)
+
+        # Revoked leave no longer blocks the day
+        post_json(views.revoke_vacation, {'vacation_id': HolidayEvent.objects.get().holidayevents_id})
+        self.assertEqual(self.submit('张三', '2024-04-02,2024-04-03').status_code, 201)
+
+    @override_settings(LEAVE_STAFFING_TEAMS={'运维组': {'members': ['张三', '李四', '王五'], 'max_off': 1}})
+    def test_team_staffing_limit(self):
+        self.assertEqual(self.submit('李四', '2024-04-02', leave_type='病假').status_code, 201)
+        response = self.submit('张三', '2024-04-01,2024-04-02')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['teams'], {'运维组': ['2024-04-02']})
+        self.assertEqual(self.submit('赵六', '2024-04-02', leave_type='病假').status_code, 201)
+
+
+class TeamCalendarTests(TestCase):
+    def setUp(self):
+        self.events = {}
+        for name, hname, ispermit, day in [
+            ('approved', '张三', 2, '2024-03-30,2024-03-31,2024-04-01,2024-04-02'),
+            ('pending', '李四', 1, '2024-03-31,2024-04-01'),
+            ('rejected', '王五', 3, '2024-04-01'),
+            ('around', '赵六', 2, '2024-03-29,2024-04-03'),
+        ]:
+            event = make_event(hname, ispermit=ispermit, htype='年假', day=day)
+            LeaveDay.objects.bulk_create(LeaveDay.for_event(event))
+            self.events[name] = event.pk
+
+    def calendar(self, **params):
+        response = views.team_calendar(RequestFactory().get('/', params))
+        return response.status_code, json.loads(response.content)
+
+    def entries(self, calendar):
+        return {day: [(entry['username'], entry['vacation_id']) for entry in entries]
+                for day, entries in calendar['calendar'].items()}
+
+    def test_multi_day_events_fill_every_day_in_range(self):
+        status, body = self.calendar(start='2024-03-31', end='2024-04-02')
+        self.assertEqual(status, 200)
+        self.assertEqual((body['start'], body['end']), ('2024-03-31', '2024-04-02'))
+        approved, pending = self.events['approved'], self.events['pending']
+        self.assertEqual(self.entries(body), {
+            '2024-03-31': [('张三', approved), ('李四', pending)],
+            '2024-04-01': [('张三', approved), ('李四', pending)],
+            '2024-04-02': [('张三', approved)],
+        })
+        self.assertEqual(body['calendar']['2024-04-02'], [
+            {'username': '张三', 'vacation_id': approved, 'leave_type': '年假', 'ispermit': 2}])
+
+    def test_filters(self):
+        approved = self.events['approved']
+        _, body = self.calendar(start='2024-03-01', end='2024-04-30', include_pending='0')
+        self.assertEqual(self.entries(body), {
+            '2024-03-29': [('赵六', self.events['around'])],
+            '2024-03-30': [('张三', approved)],
+            '2024-03-31': [('张三', approved)],
+            '2024-04-01': [('张三', approved)],
+            '2024-04-02': [('张三', approved)],
+            '2024-04-03': [('赵六', self.events['around'])],
+        })
+        _, body = self.calendar(start='2024-03-30', end='2024-04-30', users='李四,王五')
+        self.assertEqual(list(self.entries(body)), ['2024-03-31', '2024-04-01'])
+        _, body = self.calendar(start='2024-03-30', end='2024-03-30', users='李四')
+        self.assertEqual(body['calendar'], {})
+
+    def test_bad_ranges(self):
+        for params in [{}, {'start': '2024-04-01'}, {'start': '2024-04-01', 'end': '2024-13-01'},
+                       {'start': '2024-04-02', 'end': '2024-04-01'}, {'start': '2024-01-01', 'end': '2025-01-02'}]:
+            self.assertEqual(self.calendar(**params)[0], 400, params)
+        self.assertEqual(self.calendar(start='2024-01-01', end='2024-12-31')[0], 200)
+
+    def test_backfill_migration(self):
+        backfill = importlib.import_module('vacation.migrations.0005_backfill_leaveday').backfill_leave_days
+        LeaveDay.objects.all().delete()
+        # One row is already there: the backfill must not trip over it
+        LeaveDay.objects.create(leaveday_event_id=self.events['pending'], leaveday_user='李四',
+                                leaveday_date=date(2024, 3, 31))
+        duplicate = make_event('钱七', day='2024-05-01, 2024-05-01,2024-05-02')
+        broken = make_event('孙八', day='2024-05-xx')
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            backfill(apps, None)
+        self.assertIn(f'Skipping vacation event {broken.pk}', stdout.getvalue())
+        rows = LeaveDay.objects.order_by('leaveday_event_id', 'leaveday_date').values_list(
+            'leaveday_event_id', 'leaveday_user', 'leaveday_date')
+        e = self.events
+        self.assertEqual(list(rows), sorted([
+            (e['approved'], '张三', date(2024, 3, 30)), (e['approved'], '张三', date(2024, 3, 31)),
+            (e['approved'], '张三', date(2024, 4, 1)), (e['approved'], '张三', date(2024, 4, 2)),
+            (e['pending'], '李四', date(2024, 3, 31)), (e['pending'], '李四', date(2024, 4, 1)),
+            (e['rejected'], '王五', date(2024, 4, 1)),
+            (e['around'], '赵六', date(2024, 3, 29)), (e['around'], '赵六', date(2024, 4, 3)),
+            (duplicate.pk, '钱七', date(2024, 5, 1)), (duplicate.pk, '钱七', date(2024, 5, 2)),
+        ]))
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.quota = make_quota('张三', days=10)
+        user_cache.backend.clear()
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, view, **params):
+        return json.loads(view(RequestFactory().get('/', params)).content)
+
+    def balance(self):
+        return [(row['holidaytimes_year'], row['holidaytimes_days'], row['holidaytimes_reserved'])
+                for row in self.get(views.get_user_holiday_info, opname='张三')['holiday_info']]
+
+    def statuses(self):
+        return [row['holidayevents_ispermit']
+                for row in self.get(views.get_user_vacation_info, username='张三')['vacation_info']]
+
+    def write(self, view, payload):
+        # TestCase never commits, so run the on_commit invalidations explicitly
+        with self.captureOnCommitCallbacks(execute=True):
+            return post_json(view, payload)
+
+    def test_second_read_is_served_from_cache(self):
+        before = user_cache.stats()
+        self.assertEqual(self.balance(), [(current_year, 10, 0)])
+        # Only the version stamp
+        with self.assertNumQueries(1):
+            self.assertEqual(self.balance(), [(current_year, 10, 0)])
+        stats = user_cache.stats()
+        self.assertEqual((stats['hits'] - before['hits'], stats['misses'] - before['misses']), (1, 1))
+
+    def test_no_stale_reads_after_event_writes(self):
+        self.assertEqual((self.balance(), self.statuses()), ([(current_year, 10, 0)], []))
+        self.write(views.submit_vacation, {'username': '张三', 'leave_type': '年假',
+                                           'leave_day': '2024-04-01,2024-04-02', 'reason': '回家'})
+        self.assertEqual((self.balance(), self.statuses()), ([(current_year, 10, 2)], [1]))
+        event_id = HolidayEvent.objects.get().holidayevents_id
+
+        self.write(views.revoke_vacation, {'vacation_id': event_id})
+        self.assertEqual((self.balance(), self.statuses()), ([(current_year, 10, 0)], [4]))
+        self.write(views.delete_vacation, {'vacation_id': event_id})
+        self.assertEqual(self.statuses(), [])
+
+        first = make_event('张三', day='2024-05-06')
+        second = make_event('张三', day='2024-05-07')
+        self.quota.holidaytimes_reserved = 2
+        self.quota.save()
+        user_cache.backend.clear()
+        self.assertEqual(self.statuses(), [1, 1])
+        self.write(views.approve_vacation, {'id': first.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        self.assertEqual((self.balance(), sorted(self.statuses())), ([(current_year, 9, 1)], [1, 2]))
+        self.write(views.batch_approve_vacation, {'items': [
+            {'id': second.holidayevents_id, 'ispermit': 3, 'opinion': 'no'}]})
+        self.assertEqual((self.balance(), sorted(self.statuses())), ([(current_year, 9, 0)], [2, 3]))
+
+    def test_no_stale_reads_after_quota_writes(self):
+        self.assertEqual(self.balance(), [(current_year, 10, 0)])
+        self.write(views.update_vacation_times, {'id': self.quota.holidaytimes_id, 'available_days': 7})
+        self.assertEqual(self.balance(), [(current_year, 7, 0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_quotas(io.BytesIO(
+                f'{{"username": "张三", "year": {current_year}, "days": 12, "workyear": 3, "cmb_year": 2}}\n'.encode()),
+                'jsonl')
+        self.assertEqual(self.balance(), [(current_year, 12, 0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rollover(current_year + 1).run()
+        self.assertEqual(sorted(self.balance()), [(current_year, 12, 0), (current_year + 1, 5, 0)])
+
+        self.write(views.delete_vacation_times, {'id': self.quota.holidaytimes_id})
+        self.assertEqual(self.balance(), [(current_year + 1, 5, 0)])
+        self.write(views.create_vacation_times, {'username': '张三', 'year': current_year, 'days': 3, 'haddays': 0,
+                                                 'workyear': 3, 'cmb_year': 2})
+        self.assertEqual(sorted(self.balance()), [(current_year, 3, 0), (current_year + 1, 5, 0)])
+
+    def test_evicted_version_does_not_resurrect_old_entries(self):
+        self.assertEqual(self.balance(), [(current_year, 10, 0)])
+        HolidayTimes.objects.update(holidaytimes_days=4)
+        user_cache.backend.delete(f'{user_cache.user_key("张三")}:version')
+        self.assertEqual(self.balance(), [(current_year, 4, 0)])
+
+
+class ImportInvalidationTests(TransactionTestCase):
+    """Outside a transaction on_commit runs at once, so the cache must only move once the rows have."""
+
+    def test_invalidation_follows_the_upsert(self):
+        make_quota('张三', days=1)
+        seen = []
+
+        def bump_users(usernames):
+            seen.append(HolidayTimes.objects.get(holidaytimes_opname='张三').holidaytimes_days)
+
+        with mock.patch.object(user_cache, 'bump_users', side_effect=bump_users):
+            import_quotas(io.BytesIO(
+                f'{{"username": "张三", "year": {current_year}, "days": 9, "workyear": 3, "cmb_year": 2}}\n'.encode()),
+                'jsonl')
+        self.assertEqual(seen, [9])
+
+
+def quota_line(username, year=None, days=10, **extra):
+    return json.dumps(dict(username=username, year=year or current_year, days=days, workyear=3, cmb_year=2, **extra),
+                      ensure_ascii=False) + '\n'
+
+
+class QuotaImportTests(TestCase):
+    def balances(self):
+        return list(HolidayTimes.objects.order_by('holidaytimes_opname', 'holidaytimes_year').values_list(
+            'holidaytimes_opname', 'holidaytimes_year', 'holidaytimes_days', 'holidaytimes_reserved'))
+
+    def run_import(self, text, fmt='jsonl', **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_quotas(io.BytesIO(text.encode()), fmt, **kwargs)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        report = self.run_import(''.join([
+            quota_line('张三'),
+            '{not json\n',
+            '[1, 2]\n',
+            '\n',
+            json.dumps({'username': '李四', 'year': current_year, 'days': 5}) + '\n',
+            quota_line('王五', days=-1),
+            quota_line('赵六', year=1800),
+            quota_line('钱七', days='many'),
+            quota_line('孙八', days=4),
+        ]))
+        self.assertEqual(report['rows'], 8)
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(report['error_count'], 6)
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 5, 6, 7, 8])
+        self.assertEqual(report['errors'][2]['error'], 'Missing required field: workyear')
+        self.assertEqual(self.balances(), [('孙八', current_year, 4, 0), ('张三', current_year, 10, 0)])
+
+    def test_upserts_on_opname_and_year(self):
+        existing = make_quota('张三', days=1, holidaytimes_reserved=1)
+        make_quota('张三', year=current_year - 1, days=2)
+        report = self.run_import(quota_line('张三', days=8) + quota_line('李四', days=6))
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(self.balances(), [
+            ('张三', current_year - 1, 2, 0), ('张三', current_year, 8, 1), ('李四', current_year, 6, 0),
+        ])
+        updated = HolidayTimes.objects.get(pk=existing.pk)
+        self.assertEqual(updated.holidaytimes_addtime, existing.holidaytimes_addtime)
+
+    def test_writes_in_chunks(self):
+        chunks = []
+        upsert = QuotaImport.upsert
+
+        def spy(importer, quotas):
+            chunks.append(sorted(quota.holidaytimes_opname for quota in quotas))
+            return upsert(importer, quotas)
+
+        with mock.patch.object(QuotaImport, 'upsert', autospec=True, side_effect=spy):
+            report = self.run_import(''.join(quota_line(name) for name in 'abcde'), chunk_size=2)
+        self.assertEqual(chunks, [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(report['imported'], 5)
+        self.assertEqual(HolidayTimes.objects.count(), 5)
+
+    def test_later_rows_replace_earlier_ones_in_a_chunk(self):
+        report = self.run_import(quota_line('张三', days=3) + quota_line('李四') + quota_line('张三', days=7))
+        self.assertEqual((report['rows'], report['imported'], report['error_count']), (3, 2, 0))
+        self.assertEqual(self.balances(), [('张三', current_year, 7, 0), ('李四', current_year, 10, 0)])
+
+    def test_a_rejected_chunk_is_retried_row_by_row(self):
+        upsert = QuotaImport.upsert
+
+        def reject_lisi(importer, quotas):
+            if any(quota.holidaytimes_opname == '李四' for quota in quotas):
+                raise DatabaseError('value too long')
+            return upsert(importer, quotas)
+
+        with mock.patch.object(QuotaImport, 'upsert', autospec=True, side_effect=reject_lisi):
+            report = self.run_import(quota_line('张三') + quota_line('李四') + quota_line('王五'))
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(report['errors'], [{'line': 2, 'error': 'value too long'}])
+        self.assertEqual([row[0] for row in self.balances()], ['张三', '王五'])
+
+    def test_csv_upload(self):
+        upload = SimpleUploadedFile('quotas.csv', (
+            '\ufeffusername,year,days,haddays,workyear,cmb_year\n'
+            f'张三,{current_year},10,2,5,3\n'
+            f'李四,{current_year},,0,5,3\n'
+        ).encode())
+        request = RequestFactory().post('/', {'file': upload})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = views.import_vacation_times(request)
+        self.assertEqual(response.status_code, 200)
+        report = json.loads(response.content)
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(report['errors'], [{'line': 3, 'error': 'Missing required field: days'}])
+        quota = HolidayTimes.objects.get()
+        self.assertEqual((quota.holidaytimes_days, quota.holidaytimes_haddays), (10, 2))
+
+    def test_jsonl_body(self):
+        request = RequestFactory().post('/', quota_line('张三') + quota_line('李四'), content_type='application/x-ndjson')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = views.import_vacation_times(request)
+        self.assertEqual(json.loads(response.content)['imported'], 2)
+
+        request = RequestFactory().post('/?format=csv', f'username,year,days,workyear,cmb_year\n王五,{current_year},4,1,1\n',
+                                        content_type='text/plain')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = views.import_vacation_times(request)
+        self.assertEqual(json.loads(response.content)['imported'], 1)
+
+        response = views.import_vacation_times(RequestFactory().post('/?format=xlsx', '', content_type='text/plain'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(HolidayTimes.objects.count(), 3)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write(f'username,year,days,workyear,cmb_year\n张三,{current_year},9,1,1\n李四,{current_year},x,1,1\n')
+        self.addCleanup(os.unlink, f.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_quotas', f.name, '--chunk-size', '1', stdout=stdout, stderr=stderr)
+        self.assertEqual(stdout.getvalue().strip(), '2 rows read, 1 imported, 1 errors')
+        self.assertEqual(stderr.getvalue().strip(), "line 3: days must be an integer, got 'x'")
+        self.assertEqual(self.balances(), [('张三', current_year, 9, 0)])
+
+        with self.assertRaises(CommandError):
+            call_command('import_quotas', f.name + '.missing')
+
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        make_quota('张三', year=2024, days=10, holidaytimes_workyear=19, holidaytimes_reserved=2)
+        make_quota('李四', year=2024, days=2, holidaytimes_workyear=9)
+        make_quota('王五', year=2024, days=1, holidaytimes_workyear=0, holidaytimes_reserved=1)
+        make_quota('赵六', year=2024, days=4)
+        make_quota('赵六', year=2025, days=12)
+        make_quota('钱七', year=2023, days=6)
+
+    def rows(self, year=2025):
+        return list(HolidayTimes.objects.filter(holidaytimes_year=year).order_by('holidaytimes_opname').values_list(
+            'holidaytimes_opname', 'holidaytimes_days', 'holidaytimes_haddays', 'holidaytimes_reserved',
+            'holidaytimes_workyear', 'holidaytimes_cmbyear'))
+
+    def test_entitlement_and_carry_over(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = Rollover(2025, carry_over=3).run()
+        self.assertEqual(created, 3)
+        # 赵六 already had a 2025 row and 钱七 has no 2024 row
+        self.assertEqual(self.rows(), [
+            ('张三', 18, 0, 0, 20, 4),
+            ('李四', 12, 0, 0, 10, 4),
+            ('王五', 5, 0, 0, 1, 4),
+            ('赵六', 12, 0, 0, 5, 3),
+        ])
+        self.assertEqual(ledger.balance('张三', 2025), {'days': 18, 'haddays': 0, 'reserved': 0})
+
+    def test_rules_can_require_company_years(self):
+        HolidayTimes.objects.filter(holidaytimes_opname='李四').update(holidaytimes_cmbyear=1)
+        Rollover(2025, rules=[(10, 4, 20), (10, 0, 8), (0, 4, 3)]).run()
+        self.assertEqual([(row[0], row[1]) for row in self.rows()], [('张三', 20), ('李四', 8), ('王五', 3), ('赵六', 12)])
+
+    def test_a_rerun_is_a_no_op(self):
+        Rollover(2025).run()
+        before = self.rows()
+        HolidayTimes.objects.filter(holidaytimes_opname='李四', holidaytimes_year=2025).update(holidaytimes_days=1)
+        self.assertEqual(Rollover(2025, carry_over=5).run(), 0)
+        self.assertEqual(self.rows(), [row if row[0] != '李四' else ('李四', 1) + row[2:] for row in before])
+
+    def test_preview_matches_run_and_writes_nothing(self):
+        rollover = Rollover(2025, carry_over=3)
+        with self.assertNumQueries(1):
+            preview = list(rollover.preview())
+        self.assertEqual(preview, [('张三', 15, 3, 20, 4), ('李四', 10, 2, 10, 4), ('王五', 5, 0, 1, 4)])
+        self.assertEqual(len(self.rows()), 1)
+        rollover.run()
+        self.assertEqual([(row[0], row[1]) for row in self.rows()],
+                         [(opname, entitlement + carried) for opname, entitlement, carried, _, _ in preview] + [('赵六', 12)])
+
+    def test_dry_run_command(self):
+        stdout = io.StringIO()
+        call_command('rollover_quotas', '2025', '--carry-over', '3', '--dry-run', stdout=stdout)
+        self.assertEqual(stdout.getvalue().splitlines(), [
+            '+ 张三 2025: 18 days (entitlement 15, carried 3, workyear 20, cmbyear 4)',
+            '+ 李四 2025: 12 days (entitlement 10, carried 2, workyear 10, cmbyear 4)',
+            '+ 王五 2025: 5 days (entitlement 5, carried 0, workyear 1, cmbyear 4)',
+            '3 rows would be created, 1 already exist for 2025 and are left unchanged',
+        ])
+        self.assertEqual(len(self.rows()), 1)
+        self.assertFalse(QuotaLedger.objects.filter(ledger_year=2025).exists())
+
+    def test_command_with_a_rules_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump([[0, 0, 7]], f)
+        self.addCleanup(os.unlink, f.name)
+        stdout = io.StringIO()
+        call_command('rollover_quotas', '2024', '--rules', f.name, stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), '1 rows created for 2024')
+        self.assertEqual(self.rows(2024)[-1], ('钱七', 7, 0, 0, 6, 4))
+
+
+class LeaveUsageTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, leave_day, leave_type='年假', username='张三'):
+        response = post_json(views.submit_vacation, {
+            'username': username, 'leave_type': leave_type, 'leave_day': leave_day, 'reason': '回家'})
+        self.assertEqual(response.status_code, 201)
+        return HolidayEvent.objects.latest('holidayevents_id')
+
+    def summary(self):
+        return sorted((u.usage_user, u.usage_month, u.usage_htype, u.usage_pending_days, u.usage_approved_days)
+                      for u in LeaveUsage.objects.all() if u.usage_pending_days or u.usage_approved_days)
+
+    def assertMatchesRebuild(self, expected):
+        self.assertEqual(self.summary(), expected)
+        usage.rebuild()
+        self.assertEqual(self.summary(), expected)
+
+    def test_incremental_updates_match_rebuild(self):
+        # Apr 30 and May 2 are working days, May 4 is a Saturday
+        first = self.submit('2024-04-30,2024-05-02,2024-05-04')
+        second = self.submit('2024-05-06', leave_type='病假')
+        self.assertMatchesRebuild([('张三', 4, '年假', 1, 0), ('张三', 5, '年假', 1, 0), ('张三', 5, '病假', 1, 0)])
+
+        post_json(views.approve_vacation, {'id': first.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        post_json(views.revoke_vacation, {'vacation_id': second.holidayevents_id})
+        self.assertMatchesRebuild([('张三', 4, '年假', 0, 1), ('张三', 5, '年假', 0, 1)])
+
+        third = self.submit('2024-05-07', leave_type='病假', username='李四')
+        post_json(views.batch_approve_vacation, {'items': [
+            {'id': third.holidayevents_id, 'ispermit': 3, 'opinion': 'no'}]})
+        post_json(views.delete_vacation, {'vacation_id': first.holidayevents_id})
+        self.assertMatchesRebuild([])
+
+    def test_backfill_migration(self):
+        # A 调休上班 Saturday counts, a 节假日 weekday doesn't
+        make_special_day('2024-05-11', SpecialHoliday.TYPE_WORKDAY)
+        make_special_day('2024-05-01', SpecialHoliday.TYPE_HOLIDAY)
+        first = self.submit('2024-04-30,2024-05-01,2024-05-11')
+        self.submit('2024-05-06', leave_type='病假', username='李四')
+        post_json(views.approve_vacation, {'id': first.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        expected = self.summary()
+        self.assertEqual(expected, [('张三', 4, '年假', 0, 1), ('张三', 5, '年假', 0, 1), ('李四', 5, '病假', 1, 0)])
+
+        LeaveUsage.objects.all().delete()
+        importlib.import_module('vacation.migrations.0010_leaveusage').backfill_leave_usage(apps, None)
+        self.assertEqual(self.summary(), expected)
+
+    @override_settings(LEAVE_STAFFING_TEAMS={'运维组': {'members': ['张三', '李四'], 'max_off': 5}})
+    def test_report(self):
+        self.submit('2024-04-01,2024-04-02')
+        self.submit('2024-05-06', leave_type='病假', username='李四')
+        self.submit('2024-05-07', leave_type='病假', username='王五')
+        post_json(views.approve_vacation, {'id': HolidayEvent.objects.get(holidayevents_hname='李四').holidayevents_id,
+                                           'opinion': 'ok', 'ispermit': 2})
+
+        def report(**params):
+            return json.loads(views.leave_usage_report(RequestFactory().get('/', params)).content)
+
+        # The version stamp, then the two aggregates
+        with self.assertNumQueries(3):
+            data = report(year=2024)
+        self.assertEqual(data['rows'], [{'htype': '年假', 'pending_days': 2, 'approved_days': 0},
+                                        {'htype': '病假', 'pending_days': 1, 'approved_days': 1}])
+        self.assertEqual(data['total'], {'pending_days': 3, 'approved_days': 1})
+        self.assertEqual(report(year=2024, group_by='team,month')['rows'], [
+            {'team': '运维组', 'month': 4, 'pending_days': 2, 'approved_days': 0},
+            {'team': '运维组', 'month': 5, 'pending_days': 0, 'approved_days': 1},
+            {'team': None, 'month': 5, 'pending_days': 1, 'approved_days': 0},
+        ])
+        self.assertEqual(report(year=2024, month=5, htype='病假', group_by='user')['rows'], [
+            {'user': '李四', 'pending_days': 0, 'approved_days': 1},
+            {'user': '王五', 'pending_days': 1, 'approved_days': 0},
+        ])
+        self.assertEqual(views.leave_usage_report(RequestFactory().get('/', {'year': 2024, 'group_by': 'dept'}))
+                         .status_code, 400)
+
+
+class QuotaLedgerTests(TestCase):
+    def setUp(self):
+        post_json(views.create_vacation_times, {
+            'username': '张三', 'year': current_year, 'days': 10, 'haddays': 0, 'workyear': 5, 'cmb_year': 3})
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, leave_day):
+        response = post_json(views.submit_vacation, {
+            'username': '张三', 'leave_type': '年假', 'leave_day': leave_day, 'reason': '回家'})
+        self.assertEqual(response.status_code, 201)
+        return HolidayEvent.objects.latest('holidayevents_id')
+
+    def counters(self):
+        quota = HolidayTimes.objects.get(holidaytimes_opname='张三')
+        return {'days': quota.holidaytimes_days, 'haddays': quota.holidaytimes_haddays,
+                'reserved': quota.holidaytimes_reserved}
+
+    def assertLedgerMatches(self, expected):
+        self.assertEqual(self.counters(), expected)
+        self.assertEqual(ledger.balance('张三', current_year), expected)
+        self.assertEqual(list(ledger.Reconciliation().drifts()), [])
+
+    def test_ledger_follows_every_quota_write(self):
+        first = self.submit('2024-04-29,2024-04-30')
+        second = self.submit('2024-05-06')
+        self.assertLedgerMatches({'days': 10, 'haddays': 0, 'reserved': 3})
+
+        post_json(views.approve_vacation, {'id': first.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        post_json(views.batch_approve_vacation, {'items': [
+            {'id': second.holidayevents_id, 'ispermit': 3, 'opinion': 'no'}]})
+        self.assertLedgerMatches({'days': 8, 'haddays': 2, 'reserved': 0})
+
+        quota_id = HolidayTimes.objects.get().holidaytimes_id
+        post_json(views.update_vacation_times, {'id': quota_id, 'available_days': 12})
+        self.assertLedgerMatches({'days': 12, 'haddays': 2, 'reserved': 0})
+        self.assertEqual(list(QuotaLedger.objects.filter(ledger_event_id=first.holidayevents_id)
+                              .order_by('ledger_id').values_list('ledger_kind', flat=True)), ['reserve', 'debit'])
+        self.assertEqual(QuotaLedger.objects.get(ledger_kind=QuotaLedger.KIND_RESERVE,
+                                                 ledger_event_id=second.holidayevents_id).ledger_reserved, 1)
+        self.assertFalse(QuotaLedger.objects.filter(ledger_kind=QuotaLedger.KIND_RESERVE, ledger_event_id=None).exists())
+
+        post_json(views.update_vacation_times, {'id': quota_id, 'year': current_year + 1})
+        self.assertEqual(ledger.balance('张三', current_year), {'days': 0, 'haddays': 0, 'reserved': 0})
+        self.assertEqual(ledger.balance('张三', current_year + 1), {'days': 12, 'haddays': 2, 'reserved': 0})
+
+    def test_balance_reads_snapshot_and_tail(self):
+        self.submit('2024-04-29')
+        self.assertEqual(ledger.take_snapshots(settle_seconds=3600), (0, 0))
+        upto, users = ledger.take_snapshots(settle_seconds=0)
+        self.assertEqual((upto, users), (QuotaLedger.objects.latest('ledger_id').ledger_id, 1))
+        snapshot = QuotaSnapshot.objects.get(snapshot_user='张三')
+        self.assertEqual((snapshot.snapshot_days, snapshot.snapshot_reserved), (10, 1))
+
+        self.submit('2024-04-30')
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger.balance('张三', current_year), {'days': 10, 'haddays': 0, 'reserved': 2})
+        ledger.take_snapshots(settle_seconds=0)
+        self.assertEqual(QuotaSnapshot.objects.get(snapshot_user='张三').snapshot_reserved, 2)
+
+        response = views.quota_balance(RequestFactory().get('/', {'username': '张三', 'year': current_year}))
+        self.assertEqual(json.loads(response.content),
+                         {'username': '张三', 'year': current_year, 'days': 10, 'haddays': 0, 'reserved': 2})
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        event = self.submit('2024-04-29')
+        post_json(views.approve_vacation, {'id': event.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        self.submit('2024-04-30')
+        # A write that bypassed the ledger, and a ledger entry that went missing
+        HolidayTimes.objects.update(holidaytimes_days=models.F('holidaytimes_days') + 3)
+        QuotaLedger.objects.filter(ledger_kind=QuotaLedger.KIND_RESERVE).latest('ledger_id').delete()
+
+        reconciliation = ledger.Reconciliation(current_year)
+        drifts = list(reconciliation.drifts())
+        self.assertEqual([(d.counters, d.ledger, d.expected) for d in drifts], [((12, 1, 1), (9, 1, 0), (9, 1, 1))])
+        version = stamps.get('quotas')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(reconciliation.fix(drifts)), 1)
+        self.assertNotEqual(stamps.get('quotas'), version)
+        self.assertLedgerMatches({'days': 9, 'haddays': 1, 'reserved': 1})
+        self.assertEqual(QuotaLedger.objects.filter(ledger_kind=QuotaLedger.KIND_ADJUST).count(), 1)
+        self.assertTrue(ChangeLog.objects.filter(change_table=ChangeLog.TABLE_QUOTA, change_op='upsert').exists())
+
+    def test_backfill_migration(self):
+        event = self.submit('2024-04-29,2024-04-30')
+        post_json(views.approve_vacation, {'id': event.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        self.submit('2024-05-06')
+        QuotaLedger.objects.all().delete()
+
+        importlib.import_module('vacation.migrations.0014_quotaledger').backfill_quota_ledger(apps, None)
+        self.assertLedgerMatches({'days': 8, 'haddays': 2, 'reserved': 1})
+        backfilled = sorted(QuotaLedger.objects.values_list('ledger_kind', 'ledger_days', 'ledger_haddays',
+                                                            'ledger_reserved'))
+        self.assertEqual(backfilled, [('credit', 10, 0, 0), ('debit', -2, 2, 0), ('reserve', 0, 0, 1)])
+        # The same entries open_ledger() writes today
+        QuotaLedger.objects.all().delete()
+        ledger.open_ledger()
+        self.assertEqual(sorted(QuotaLedger.objects.values_list('ledger_kind', 'ledger_days', 'ledger_haddays',
+                                                                'ledger_reserved')), backfilled)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        make_event('张三')
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, view, path='/', **headers):
+        return view(RequestFactory().get(path, **headers))
+
+    def test_current_client_gets_304_from_the_stamps_alone(self):
+        response = self.get(views.get_approve_vacation_list)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.get(views.get_approve_vacation_list, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # The query string is part of the tag
+        self.assertNotEqual(self.get(views.get_approve_vacation_list, '/?limit=10')['ETag'], etag)
+
+    def test_writes_move_only_their_tables(self):
+        events_etag = self.get(views.get_vacation_list)['ETag']
+        quota_etag = self.get(views.vacation_quota_list)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            post_json(views.submit_vacation, {'username': '张三', 'leave_type': '病假',
+                                              'leave_day': '2024-04-02', 'reason': '感冒'})
+        self.assertEqual(self.get(views.get_vacation_list, HTTP_IF_NONE_MATCH=events_etag).status_code, 200)
+        self.assertEqual(self.get(views.vacation_quota_list, HTTP_IF_NONE_MATCH=quota_etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post_json(views.update_vacation_times, {'id': HolidayTimes.objects.get().holidaytimes_id,
+                                                    'available_days': 8})
+        self.assertEqual(self.get(views.vacation_quota_list, HTTP_IF_NONE_MATCH=quota_etag).status_code, 200)
+
+    def test_stamps_move_with_the_write_transaction(self):
+        etag = self.get(views.vacation_quota_list)['ETag']
+        # Stamps live in the database, not in a per-process cache
+        caches['default'].clear()
+        self.assertEqual(self.get(views.vacation_quota_list, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        try:
+            with transaction.atomic():
+                HolidayTimes.objects.update(holidaytimes_days=1)
+                stamps.bump('quotas')
+                raise OperationalError('rolled back')
+        except OperationalError:
+            pass
+        self.assertEqual(self.get(views.vacation_quota_list, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with transaction.atomic():
+            HolidayTimes.objects.update(holidaytimes_days=1)
+            stamps.bump('quotas')
+        self.assertEqual(self.get(views.vacation_quota_list, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified(self):
+        # No Last-Modified while the last write is in the current second
+        stamps.bump('quotas')
+        self.assertFalse(self.get(views.vacation_quota_list).has_header('Last-Modified'))
+        VersionStamp.objects.filter(stamp_table='quotas').update(stamp_value=time.time_ns() - 5 * 10**9)
+        last_modified = self.get(views.vacation_quota_list)['Last-Modified']
+        response = self.get(views.vacation_quota_list, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mirror(self, limit=1000):
+        tables, since = {'event': {}, 'quota': {}}, 0
+        while True:
+            feed = changelog.changes_since(since, limit)
+            for change in feed['changes']:
+                if change['op'] == 'upsert':
+                    tables[change['table']][change['id']] = change['data']
+                else:
+                    tables[change['table']].pop(change['id'], None)
+            since = feed['next_since']
+            if not feed['has_more']:
+                return tables
+
+    def assertMirrorIsCurrent(self):
+        expected = {
+            'event': {row['holidayevents_id']: row for row in HolidayEvent.objects.values()},
+            'quota': {row['holidaytimes_id']: row for row in HolidayTimes.objects.values()},
+        }
+        self.assertEqual(self.mirror(), expected)
+        self.assertEqual(self.mirror(limit=2), expected)
+
+    def test_every_write_path_is_logged(self):
+        post_json(views.create_vacation_times, {'username': '张三', 'year': current_year, 'days': 5, 'haddays': 0,
+                                                'workyear': 5, 'cmb_year': 3})
+        post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假',
+                                          'leave_day': '2024-04-01', 'reason': '回家'})
+        event = HolidayEvent.objects.get()
+        post_json(views.approve_vacation, {'id': event.holidayevents_id, 'opinion': 'ok', 'ispermit': 2})
+        self.assertMirrorIsCurrent()
+
+        post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假',
+                                          'leave_day': '2024-04-02', 'reason': '回家'})
+        post_json(views.delete_vacation, {'vacation_id': HolidayEvent.objects.latest('holidayevents_id').pk})
+        import_quotas(io.BytesIO('username,year,days,workyear,cmb_year\n李四,2024,7,1,1\n'.encode()), 'csv')
+        Rollover(current_year + 1).run()
+        post_json(views.delete_vacation_times, {'id': HolidayTimes.objects.get(holidaytimes_opname='李四').pk})
+        self.assertMirrorIsCurrent()
+
+        # A rejected submit rolls back and leaves nothing in the log
+        count = ChangeLog.objects.count()
+        post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假',
+                                          'leave_day': '2024-04-01', 'reason': '回家'})
+        self.assertEqual(ChangeLog.objects.count(), count)
+
+    def test_compaction_respects_consumers(self):
+        for day in range(1, 6):
+            make_event('张三', day=f'2024-04-0{day}')
+        changelog.log_keys('event', HolidayEvent.objects.values_list('pk', flat=True))
+        seqs = list(ChangeLog.objects.values_list('change_seq', flat=True))
+
+        def changes(**params):
+            return views.get_changes(RequestFactory().get('/', params))
+
+        changes(since=seqs[1], consumer='approver-app')
+        changes(since=seqs[3], consumer='hr-sync')
+        self.assertEqual(changelog.Compaction().run(), (seqs[1], 2))
+        self.assertEqual(changes(since=seqs[0]).status_code, 410)
+        self.assertEqual(len(json.loads(changes(since=seqs[1]).content)['changes']), 3)
+
+        ChangeConsumer.objects.filter(consumer_name='approver-app').update(
+            consumer_seen_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(changelog.Compaction(stale_days=30).run(), (seqs[3], 2))
+        # The newest entry is always kept
+        changes(since=seqs[4], consumer='hr-sync')
+        self.assertEqual(changelog.Compaction(stale_days=30).run(), (None, 0))
+        self.assertEqual(list(ChangeLog.objects.values_list('change_seq', flat=True)), seqs[4:])
+
+
+class EventArchiveTests(TestCase):
+    def setUp(self):
+        self.past = current_year - 2
+        self.events = {}
+        for name, ispermit, day, year in [
+            ('approved', 2, f'{self.past}-04-03', self.past),
+            ('rejected', 3, f'{self.past}-05-06', self.past),
+            ('pending', 1, f'{self.past}-06-01', self.past),  # never archived
+            ('spans', 4, f'{current_year - 1}-12-31,{current_year}-01-02', current_year - 1),
+            ('current', 2, f'{current_year}-01-05', current_year),
+        ]:
+            addtime = timezone.make_aware(datetime(year, 1, 2, 9)) + timedelta(minutes=len(self.events))
+            event = make_event('张三', ispermit=ispermit, htype='病假', day=day, addtime=addtime)
+            LeaveDay.objects.bulk_create(LeaveDay.for_event(event))
+            self.events[name] = event.pk
+        make_quota('张三')
+        usage.rebuild()
+
+    def vacation_ids(self, view, **params):
+        response = view(RequestFactory().get('/', params))
+        if response.streaming:
+            body = json.loads(b''.join(response.streaming_content))
+        else:
+            body = json.loads(response.content)
+        return [row['holidayevents_id'] for row in body[next(iter(body))]], body.get('next_cursor')
+
+    def test_chunks_resume_and_only_move_closed_past_events(self):
+        usage_before = sorted(LeaveUsage.objects.values_list(
+            'usage_year', 'usage_month', 'usage_pending_days', 'usage_approved_days'))
+        archiver = EventArchiver(current_year, chunk_size=1)
+        self.assertEqual(archiver.run(max_chunks=1), 1)
+        self.assertEqual(archiver.run(), 1)
+        self.assertEqual(archiver.run(), 0)
+
+        archived = {self.events['approved'], self.events['rejected']}
+        self.assertEqual(set(HolidayEventArchive.objects.values_list('pk', flat=True)), archived)
+        self.assertEqual(set(LeaveDayArchive.objects.values_list('leaveday_event_id', flat=True)), archived)
+        self.assertFalse(HolidayEvent.objects.filter(pk__in=archived).exists())
+        self.assertFalse(LeaveDay.objects.filter(leaveday_event_id__in=archived).exists())
+        # The summary still counts the archived days after a rebuild
+        usage.rebuild()
+        self.assertEqual(sorted(LeaveUsage.objects.values_list(
+            'usage_year', 'usage_month', 'usage_pending_days', 'usage_approved_days')), usage_before)
+
+        with self.assertRaises(ValueError):
+            EventArchiver(current_year + 1)
+
+    def test_reads_include_the_archive_when_asked(self):
+        changelog.log_keys('event', [self.events['approved']])
+        EventArchiver(current_year).run()
+        e = self.events
+        newest_first = [e['current'], e['spans'], e['pending'], e['rejected'], e['approved']]
+
+        self.assertEqual(self.vacation_ids(views.get_vacation_list)[0], [e['current'], e['spans'], e['pending']])
+        self.assertEqual(self.vacation_ids(views.get_vacation_list, include_archived=1)[0], newest_first)
+        self.assertEqual(self.vacation_ids(views.get_vacation_list, year=self.past)[0],
+                         [e['pending'], e['rejected'], e['approved']])
+        self.assertEqual(self.vacation_ids(views.get_vacation_list, year=current_year)[0], [e['current']])
+        self.assertEqual(views.get_vacation_list(RequestFactory().get('/', {'year': 'x'})).status_code, 400)
+
+        # Keyset pages run across both tables
+        ids, cursor = [], None
+        while True:
+            params = {'include_archived': 1, 'limit': 2, **({'after': cursor} if cursor else {})}
+            page, cursor = self.vacation_ids(views.get_vacation_list, **params)
+            ids += page
+            if not cursor:
+                break
+        self.assertEqual(ids, newest_first)
+
+        # The per-user cache keeps the hot and the archived lists apart
+        self.assertEqual(len(self.vacation_ids(views.get_user_vacation_info, username='张三')[0]), 3)
+        self.assertEqual(self.vacation_ids(views.get_user_vacation_info, username='张三', include_archived=1)[0],
+                         newest_first)
+
+        calendar = json.loads(views.team_calendar(RequestFactory().get('/', {
+            'start': f'{self.past}-04-01', 'end': f'{self.past}-04-30'})).content)['calendar']
+        self.assertEqual(calendar[f'{self.past}-04-03'][0]['vacation_id'], e['approved'])
+
+        # Entries logged before the move still carry the row
+        self.assertEqual(changelog.changes_since(0, 10)['changes'][0]['data']['holidayevents_id'], e['approved'])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        # Two share an addtime, so the id has to break the tie
+        same = timezone.make_aware(datetime(2024, 3, 1, 9))
+        self.ids = [make_event('张三', day=f'2024-04-0{day}', addtime=addtime).pk for day, addtime in [
+            (1, same - timedelta(days=1)), (2, same), (3, same), (4, same + timedelta(days=1)),
+            (5, same + timedelta(days=2))]]
+        self.newest_first = [self.ids[4], self.ids[3], self.ids[2], self.ids[1], self.ids[0]]
+
+    def get(self, **params):
+        response = views.get_vacation_list(RequestFactory().get('/', params))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, json.loads(content)
+
+    def test_cursor_round_trip(self):
+        added = timezone.make_aware(datetime(2024, 3, 1, 9, 30, 15, 123456))
+        cursor = pagination.encode_cursor(added, 42)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(pagination.decode_cursor(cursor), (added, 42))
+
+    def test_pages_cover_every_row_once(self):
+        for limit in (1, 2, 3, 5):
+            ids, cursor, pages = [], None, 0
+            while True:
+                _, body = self.get(limit=limit, **({'after': cursor} if cursor else {}))
+                self.assertLessEqual(len(body['vacation_list']), limit)
+                ids += [row['holidayevents_id'] for row in body['vacation_list']]
+                cursor, pages = body['next_cursor'], pages + 1
+                if not cursor:
+                    break
+            self.assertEqual(ids, self.newest_first)
+            self.assertEqual(pages, -(-len(self.ids) // limit))
+
+    def test_bad_cursors_are_rejected(self):
+        def b64(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+        for cursor in ['not a cursor', '!!!', b64('{"a": 1}'), b64('[1, 2]'), b64('["yesterday", 1]'),
+                       b64('["2024-03-01T09:00:00+00:00", "x"]'), b64('["2024-03-01T09:00:00+00:00"]')]:
+            with self.assertRaises(ValueError):
+                pagination.decode_cursor(cursor)
+            response, body = self.get(limit=2, after=cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(body['error'].startswith('Invalid cursor'))
+
+    def test_limit_bounds(self):
+        self.assertEqual(pagination.parse_limit(None), pagination.DEFAULT_PAGE_LIMIT)
+        self.assertEqual(pagination.parse_limit(''), pagination.DEFAULT_PAGE_LIMIT)
+        self.assertEqual(pagination.parse_limit('1'), 1)
+        self.assertEqual(pagination.parse_limit(str(pagination.MAX_PAGE_LIMIT + 1)), pagination.MAX_PAGE_LIMIT)
+        for limit in ('0', '-1', 'ten', '1.5'):
+            with self.assertRaises(ValueError):
+                pagination.parse_limit(limit)
+            self.assertEqual(self.get(limit=limit)[0].status_code, 400)
+        with mock.patch.object(pagination, 'MAX_PAGE_LIMIT', 2):
+            _, body = self.get(limit=100)
+        self.assertEqual(len(body['vacation_list']), 2)
+        self.assertIsNotNone(body['next_cursor'])
+
+    def test_full_list_streams(self):
+        response, body = self.get()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(list(body), ['vacation_list'])
+        self.assertEqual([row['holidayevents_id'] for row in body['vacation_list']], self.newest_first)
+
+        response, body = self.get(fields='holidayevents_day', format='columnar')
+        self.assertTrue(response.streaming)
+        self.assertEqual(body['vacation_list']['columns'], ['holidayevents_day'])
+        self.assertEqual(body['vacation_list']['rows'], [['2024-04-05'], ['2024-04-04'], ['2024-04-03'],
+                                                         ['2024-04-02'], ['2024-04-01']])
+
+        HolidayEvent.objects.all().delete()
+        response, body = self.get()
+        self.assertTrue(response.streaming)
+        self.assertEqual(body, {'vacation_list': []})
+
+
+class ResponseFormatTests(TestCase):
+    def setUp(self):
+        for day in range(1, 4):
+            make_event('张三', ispermit=2, day=f'2024-04-0{day}')
+
+    def get(self, view, accept=None, **params):
+        request = RequestFactory().get('/', params, headers={'Accept': accept} if accept else {})
+        response = view(request)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_columnar_and_fields_match_the_row_dicts(self):
+        _, content = self.get(views.get_vacation_list)
+        rows = json.loads(content)['vacation_list']
+        fields = 'holidayevents_day,holidayevents_id'
+        for params in ({}, {'limit': 2}):
+            response, content = self.get(views.get_vacation_list, codec.COLUMNAR.content_type, fields=fields, **params)
+            self.assertEqual(response['Content-Type'], codec.COLUMNAR.content_type)
+            table = json.loads(content)['vacation_list']
+            self.assertEqual(table['columns'], ['holidayevents_day', 'holidayevents_id'])
+            self.assertEqual(table['rows'], [[row['holidayevents_day'], row['holidayevents_id']]
+                                             for row in rows[:params.get('limit')]])
+        # Row dicts keep their shape: same values, and datetimes as DjangoJSONEncoder writes them
+        _, content = self.get(views.get_user_vacation_info, username='张三', fields='holidayevents_addtime')
+        self.assertEqual(json.loads(content)['vacation_info'],
+                         [{'holidayevents_addtime': row['holidayevents_addtime']} for row in rows])
+        self.assertEqual(json.loads(codec.dumps(rows)), json.loads(json.dumps(rows, cls=DjangoJSONEncoder)))
+
+        self.assertEqual(self.get(views.get_vacation_list, fields='nope')[0].status_code, 400)
+        self.assertEqual(self.get(views.get_vacation_list, format='xml')[0].status_code, 400)
+
+    def test_etag_varies_by_accept(self):
+        plain, _ = self.get(views.get_vacation_list, limit=10)
+        columnar, _ = self.get(views.get_vacation_list, codec.COLUMNAR.content_type, limit=10)
+        self.assertNotEqual(plain['ETag'], columnar['ETag'])
+        self.assertIn('Accept', columnar['Vary'])
+        request = RequestFactory().get('/', {'limit': 10}, headers={
+            'Accept': codec.COLUMNAR.content_type, 'If-None-Match': columnar['ETag']})
+        self.assertEqual(views.get_vacation_list(request).status_code, 304)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_CHECK_INTERVAL=0, REPLICA_MAX_LAG_SECONDS=10)
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        make_event('主库', ispermit=2)
+        HolidayEvent.objects.using('replica').create(
+            holidayevents_hname='从库', holidayevents_htype='年假', holidayevents_day='2024-04-01',
+            holidayevents_remark='', holidayevents_ispermit=2, holidayevents_approval_user='',
+            holidayevents_approval_opinion='', holidayevents_usedDay=1, holidayevents_addtime=timezone.now())
+        user_cache.invalidate_all()
+        replicas.reset()
+        self.addCleanup(replicas.reset)
+        stamps.bump('events', 'quotas')
+        self.replicate()
+
+    def replicate(self, heartbeat=None):
+        ReplicaHeartbeat.objects.using('replica').update_or_create(
+            heartbeat_id=1, defaults={'heartbeat_at': heartbeat or time.time_ns()})
+        for stamp in VersionStamp.objects.using('default'):
+            VersionStamp.objects.using('replica').update_or_create(
+                stamp_table=stamp.stamp_table, defaults={'stamp_value': stamp.stamp_value})
+
+    def served_by(self, path='/vacation/get_vacation_list', client=None, **params):
+        response = (client or self.client).get(path, params)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return [row['holidayevents_hname'] for row in json.loads(body)['vacation_list']]
+
+    def test_reads_use_a_replica_that_has_caught_up(self):
+        self.assertEqual(self.served_by(limit=10), ['从库'])
+        self.assertEqual(self.served_by(), ['从库'])  # streamed after the view returns
+
+        # A write the replica hasn't seen yet sends reads of that table to the primary
+        stamps.bump('events')
+        self.assertEqual(self.served_by(limit=10), ['主库'])
+        self.replicate()
+        self.assertEqual(self.served_by(limit=10), ['从库'])
+
+        # Too far behind, even with nothing newer written
+        self.replicate(time.time_ns() - 11 * 10**9)
+        self.assertEqual(self.served_by(limit=10), ['主库'])
+
+        self.replicate()
+        self.assertEqual(self.afetch_names('/vacation/async/get_vacation_list?limit=10'), ['从库'])
+
+    def afetch_names(self, path):
+        async def fetch():
+            response = await self.async_client.get(path)
+            return [row['holidayevents_hname'] for row in json.loads(response.content)['vacation_list']]
+        return async_to_sync(fetch)()
+
+    def test_writers_stick_to_the_primary(self):
+        response = self.client.post('/vacation/create_vacation_times', json.dumps({
+            'username': '张三', 'year': current_year, 'days': 5, 'haddays': 0, 'workyear': 5, 'cmb_year': 3,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(HolidayTimes.objects.using('default').filter(holidaytimes_opname='张三').exists())
+        self.assertFalse(HolidayTimes.objects.using('replica').exists())
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.served_by(limit=10), ['主库'])
+        self.assertEqual(self.served_by(client=Client(), limit=10), ['从库'])
+
+    def test_failing_replica_falls_back_to_the_primary(self):
+        self.assertEqual(self.served_by(limit=10), ['从库'])
+        with override_settings(REPLICA_CHECK_INTERVAL=3600), \
+                mock.patch.object(connections['replica'], 'cursor', side_effect=OperationalError('down')), \
+                self.assertLogs('vacation.routers', 'WARNING') as logs:
+            self.assertEqual(self.served_by(limit=10), ['主库'])
+            self.assertEqual(self.served_by(limit=10), ['主库'])
+        self.assertIsNone(replicas.heartbeats['replica'])
+        # Only the first request tried the replica; it is marked down until the next health check
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         ['Replica replica failed, reading from the primary'])
+        self.assertIn('OperationalError: down', logs.output[0])
+
+    def test_health_check_failures_are_logged(self):
+        with mock.patch.object(connections['replica'], 'cursor', side_effect=OperationalError('down')), \
+                self.assertLogs('vacation.routers', 'WARNING') as logs:
+            replicas.check()
+        self.assertIsNone(replicas.heartbeats['replica'])
+        self.assertEqual([record.getMessage() for record in logs.records], ['Replica replica failed its health check'])
+
+
+class PendingStreamTests(SimpleTestCase):
+    def publish(self, *messages):
+        # Publishers are request / poller threads, never the stream's event loop
+        thread = threading.Thread(target=lambda: [pending_queue.publish(m) for m in messages])
+        thread.start()
+        thread.join()
+
+    async def read(self, response, count):
+        content = response.streaming_content
+        chunks = [(await content.__anext__()).decode() for _ in range(count)]
+        return content, chunks
+
+    async def test_sse_streams_and_resumes(self):
+        response = await views.pending_stream(RequestFactory().get('/'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content, (retry, ready) = await self.read(response, 2)
+        self.assertTrue(retry.startswith('retry:'))
+        position = re.search(r'id: (\S+)', ready).group(1)
+
+        self.publish({'op': 'added', 'id': 7})
+        added = (await content.__anext__()).decode()
+        self.assertIn('event: added', added)
+        self.assertIn('"id": 7', added)
+        await content.aclose()
+        # Django 4.2 never acloses the view's iterator; the loop finalizes it once it is collected
+        del response, content
+        gc.collect()
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(pending_queue.subscribers), 0)
+
+        # Reconnecting with the id from "ready" replays what came after it
+        response = await views.pending_stream(RequestFactory().get('/', HTTP_LAST_EVENT_ID=position))
+        content, (_, _, replayed) = await self.read(response, 3)
+        self.assertIn('"id": 7', replayed)
+        await content.aclose()
+
+        response = await views.pending_stream(RequestFactory().get('/', HTTP_LAST_EVENT_ID='stale-1'))
+        content, (_, reset) = await self.read(response, 2)
+        self.assertIn('event: reset', reset)
+        await content.aclose()
+
+    async def test_long_poll(self):
+        position = json.loads((await views.pending_poll(RequestFactory().get('/'))).content)['last_id']
+        data = json.loads((await views.pending_poll(
+            RequestFactory().get('/', {'after': position, 'timeout': '0.05'}))).content)
+        self.assertEqual((data['events'], data['last_id']), ([], position))
+
+        self.publish({'op': 'removed', 'id': 7, 'ispermit': 2}, {'op': 'added', 'id': 8})
+        data = json.loads((await views.pending_poll(RequestFactory().get('/', {'after': position}))).content)
+        self.assertEqual([(e['op'], e['id']) for e in data['events']], [('removed', 7), ('added', 8)])
+        self.assertEqual(data['last_id'], data['events'][-1]['event_id'])
+        self.assertEqual(len(pending_queue.subscribers), 0)
+
+    async def test_idle_subscribers_need_no_threads(self):
+        threads = threading.active_count()
+        subscriptions = [pending_queue.subscribe()[0] for _ in range(5000)]
+        self.assertEqual(threading.active_count(), threads)
+        self.publish({'op': 'added', 'id': 9})
+        received = await asyncio.gather(*(subscription.get(5) for subscription in subscriptions))
+        self.assertTrue(all(message == {'op': 'added', 'id': 9} for _, message in received))
+        for subscription in subscriptions:
+            pending_queue.unsubscribe(subscription)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        make_quota('李四', days=5)
+        for day in ('2024-04-01', '2024-04-02', '2024-04-03'):
+            event = make_event('张三', day=day, htype='病假')
+            LeaveDay.objects.bulk_create(LeaveDay.for_event(event))
+        make_event('李四', ispermit=2, day='2024-04-02')
+        user_cache.invalidate_all()
+
+    def fetch(self, path):
+        response = self.client.get(path)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def afetch(self, path, method='get', headers=None):
+        async def fetch():
+            response = await getattr(self.async_client, method)(path, headers=headers)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+        return async_to_sync(fetch)()
+
+    def test_same_responses_as_sync_views(self):
+        for query in ('get_vacation_list', 'get_vacation_list?limit=2', 'vacation_quota_list',
+                      'get_approve_vacation_list?limit=1', 'get_user_vacation_info?username=张三',
+                      'get_user_vacation_info?username=张三&limit=2', 'get_user_holiday_info?opname=李四',
+                      'team_calendar?start=2024-04-01&end=2024-04-30', 'get_user_vacation_info'):
+            sync_response, sync_body = self.fetch(f'/vacation/{query}')
+            async_response, async_body = self.afetch(f'/vacation/async/{query}')
+            self.assertEqual(async_response.status_code, sync_response.status_code, query)
+            self.assertEqual(json.loads(async_body), json.loads(sync_body), query)
+
+        # Follow the cursor of the first page
+        _, body = self.afetch('/vacation/async/get_vacation_list?limit=2')
+        _, rest = self.afetch(f"/vacation/async/get_vacation_list?limit=2&after={json.loads(body)['next_cursor']}")
+        self.assertEqual(len(json.loads(rest)['vacation_list']), 2)
+
+    def test_archive_is_included_when_asked(self):
+        past = current_year - 2
+        archived = []
+        for n, (hname, ispermit) in enumerate([('张三', 2), ('李四', 3), ('张三', 4)]):
+            event = make_event(hname, ispermit=ispermit, day=f'{past}-04-0{n + 1}',
+                               addtime=timezone.make_aware(datetime(past, 3, 1 + n, 9)))
+            LeaveDay.objects.bulk_create(LeaveDay.for_event(event))
+            archived.append(event.pk)
+        EventArchiver(current_year).run()
+        self.assertEqual(sorted(HolidayEventArchive.objects.values_list('pk', flat=True)), archived)
+
+        for query in ('get_vacation_list?include_archived=1', f'get_vacation_list?year={past}',
+                      'get_vacation_list?include_archived=1&format=columnar&fields=holidayevents_id',
+                      'get_vacation_list?year=x', 'get_user_vacation_info?username=张三&include_archived=1',
+                      'get_user_vacation_info?username=张三&include_archived=1&limit=2',
+                      f'team_calendar?start={past}-04-01&end={past}-04-30'):
+            sync_response, sync_body = self.fetch(f'/vacation/{query}')
+            async_response, async_body = self.afetch(f'/vacation/async/{query}')
+            self.assertEqual(async_response.status_code, sync_response.status_code, query)
+            self.assertEqual(json.loads(async_body), json.loads(sync_body), query)
+
+        _, body = self.afetch('/vacation/async/get_vacation_list?include_archived=1')
+        ids = [row['holidayevents_id'] for row in json.loads(body)['vacation_list']]
+        self.assertEqual(ids[-3:], archived[::-1])
+        self.assertEqual(len(ids), 7)
+        _, body = self.afetch(f'/vacation/async/team_calendar?start={past}-04-01&end={past}-04-30')
+        self.assertEqual(list(json.loads(body)['calendar']), [f'{past}-04-01', f'{past}-04-02', f'{past}-04-03'])
+
+        # Keyset pages run across both tables
+        paged, cursor = [], None
+        while True:
+            _, body = self.afetch('/vacation/async/get_vacation_list?include_archived=1&limit=2'
+                                  + (f'&after={cursor}' if cursor else ''))
+            body = json.loads(body)
+            paged += [row['holidayevents_id'] for row in body['vacation_list']]
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(paged, ids)
+
+    def test_conditional_get_and_user_cache(self):
+        response, _ = self.afetch('/vacation/async/get_user_vacation_info?username=张三')
+        etag = response['ETag']
+        response, _ = self.afetch('/vacation/async/get_user_vacation_info?username=张三', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        hits = user_cache.stats()['hits']
+        self.afetch('/vacation/async/get_user_vacation_info?username=张三')
+        self.assertEqual(user_cache.stats()['hits'], hits + 1)
+        self.assertEqual(self.afetch('/vacation/async/get_vacation_list', 'post')[0].status_code, 405)
+
+    def test_acreate_workflow_saves_ticket(self):
+        event = HolidayEvent.objects.get(holidayevents_hname='李四')
+        sent = []
+
+        class FakeHTTP:
+            async def request(self, method, url, **kwargs):
+                sent.append(kwargs)
+                return mock.Mock(status_code=200, json=lambda: {
+                    'result': True, 'data': {'runiu_id': 'R1', 'task_id': 'T1'}})
+
+        client = AsyncWorkflowClient(http=FakeHTTP())
+        client.tokens.token, client.tokens.expires_at = 'tok', time.time() + 3600
+        with mock.patch.object(views, 'get_async_client', return_value=client), \
+                self.captureOnCommitCallbacks(execute=True):
+            result = async_to_sync(views.acreate_workflow)('李四', event.holidayevents_id, 't', '年假',
+                                                           '2024-04-02', 1, '')
+        self.assertEqual(result, ('R1', 'T1'))
+        self.assertEqual(sent[0]['headers']['id-token'], 'tok')
+        event.refresh_from_db()
+        self.assertEqual((event.runiuId, event.taskId), ('R1', 'T1'))
+
+
+class AsyncWorkflowClientTests(SimpleTestCase):
+    async def test_concurrent_callers_share_one_refresh(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return make_jwt(3600)
+
+        cache = AsyncTokenCache(fetch)
+        tokens = await asyncio.gather(*(cache.get() for _ in range(20)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(tokens)), 1)
+
+    async def test_refreshes_ahead_in_background(self):
+        tokens = iter([make_jwt(30), make_jwt(3600)])
+
+        async def fetch():
+            return next(tokens)
+
+        cache = AsyncTokenCache(fetch, refresh_margin=60)
+        first = await cache.get()
+        # Inside the margin the current token is still handed out while the refresh runs
+        self.assertEqual(await cache.get(), first)
+        await cache.refresh_task
+        self.assertNotEqual(await cache.get(), first)
+        self.assertEqual(cache.counters['token_refreshes'], 2)
+
+    async def test_threaded_fallback(self):
+        http = ThreadedHTTP(build_session())
+        with WorkflowStub(decisions={'T1': '同意'}) as stub:
+            response = await http.request('GET', results_url(stub), params={'ticket_id': 'T1'})
+        await http.aclose()
+        self.assertEqual(response.json()['data'][0]['action_name'], '同意')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        make_event('张三', runiuId='T1')
+        registry.clear()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def sample(self, text, name, **labels):
+        pattern = re.escape(name) + r'\{([^}]*)\} (\S+)'
+        for found, value in re.findall(pattern, text):
+            if all(f'{key}="{value}"' in found for key, value in labels.items()):
+                return float(value)
+        return None
+
+    def test_records_requests_queries_and_size(self):
+        view = 'vacation.views.get_approve_vacation_list'
+        self.client.get('/vacation/get_approve_vacation_list?limit=10')
+        async def aget():
+            await self.async_client.get('/vacation/async/get_approve_vacation_list?limit=10')
+        async_to_sync(aget)()
+        text = self.scrape()
+        self.assertIn('# TYPE vacation_http_request_duration_seconds histogram', text)
+        self.assertEqual(self.sample(text, 'vacation_http_requests_total', view=view, status='200'), 1)
+        # One query for the version stamps, one for the page
+        self.assertEqual(self.sample(text, 'vacation_http_request_db_queries_sum', view=view), 2)
+        self.assertEqual(self.sample(text, 'vacation_http_request_db_queries_bucket', view=view, le='0'), 0)
+        self.assertGreater(self.sample(text, 'vacation_http_response_size_bytes_sum', view=view), 0)
+        # Queries of async views run in sync_to_async threads and are still counted
+        self.assertEqual(self.sample(text, 'vacation_http_request_db_queries_sum',
+                                     view='vacation.async_views.get_approve_vacation_list'), 2)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_off_keeps_only_counts(self):
+        self.client.get('/vacation/get_vacation_list?limit=10')
+        text = self.scrape()
+        self.assertEqual(self.sample(text, 'vacation_http_requests_total', status='200'), 1)
+        self.assertNotIn('vacation_http_request_duration_seconds', text)
+
+    def test_poller_cycle_and_outbound_http(self):
+        with WorkflowStub(decisions={'T1': '同意'}) as stub:
+            ApprovalPoller(update_vacation_status, url=results_url(stub), session=build_session()).run_once()
+        text = registry.render()
+        self.assertEqual(self.sample(text, 'vacation_background_cycle_seconds_count', task='approval_poll'), 1)
+        self.assertEqual(self.sample(text, 'vacation_approval_poll_tickets_total', outcome='decided'), 1)
+        self.assertEqual(self.sample(text, 'vacation_outbound_http_seconds_count', status='200'), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = Registry({'x_seconds': ('histogram', 'x', (0.1, 1))})
+        for value in (0.05, 0.1, 0.5, 3):
+            metrics.observe('x_seconds', value, a='q"')
+        self.assertEqual(metrics.render().splitlines()[2:], [
+            'vacation_x_seconds_bucket{a="q\\"",le="0.1"} 2',
+            'vacation_x_seconds_bucket{a="q\\"",le="1"} 3',
+            'vacation_x_seconds_bucket{a="q\\"",le="+Inf"} 4',
+            'vacation_x_seconds_sum{a="q\\""} 3.65',
+            'vacation_x_seconds_count{a="q\\""} 4',
+        ])
+
+
+class PendingPublishTests(TestCase):
+    def setUp(self):
+        make_quota('张三', days=10)
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_views_publish_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post_json(views.submit_vacation, {'username': '张三', 'leave_type': '年假',
+                                              'leave_day': '2024-04-01', 'reason': '回家'})
+        event = HolidayEvent.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            update_vacation_status(event, 3, '李四', 'no')
+        messages = [message for _, message in list(pending_queue.history)[-2:]]
+        self.assertEqual([(m['op'], m['id']) for m in messages],
+                         [('added', event.holidayevents_id), ('removed', event.holidayevents_id)])
+        self.assertEqual(messages[1]['ispermit'], 3)
+
+
+class QueryPlanTests(TestCase):
+    """Every hot query in views.py should be answered from an index, not a table scan + sort."""
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if index_name and connection.vendor in ('sqlite', 'postgresql'):
+            self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertRegex(plan, r'(?i)using (covering )?index|index (only )?scan')
+
+    def test_vacation_list(self):
+        qs = HolidayEvent.objects.order_by('-holidayevents_addtime', '-holidayevents_id')
+        self.assertUsesIndex(qs, 'holiday_evt_addtime_idx')
+
+    def test_user_vacation_info(self):
+        qs = HolidayEvent.objects.filter(holidayevents_hname='张三').order_by('-holidayevents_addtime', '-holidayevents_id')
+        self.assertUsesIndex(qs, 'holiday_evt_hname_addtime_idx')
+
+    def test_pending_list(self):
+        qs = HolidayEvent.objects.filter(holidayevents_ispermit=1).order_by('-holidayevents_addtime', '-holidayevents_id')
+        self.assertUsesIndex(qs, 'holiday_evt_pending_idx')
+
+    def test_quota_lookup(self):
+        self.assertUsesIndex(HolidayTimes.objects.filter(holidaytimes_opname='张三', holidaytimes_year=2024))
+
+    def test_quota_list(self):
+        qs = HolidayTimes.objects.order_by('-holidaytimes_addtime', '-holidaytimes_id')
+        self.assertUsesIndex(qs, 'holiday_times_addtime_idx')
+
+    def test_team_calendar(self):
+        qs = LeaveDay.objects.filter(
+            leaveday_date__range=('2024-03-01', '2024-03-31'),
+            leaveday_event__holidayevents_ispermit__in=[1, 2],
+        ).order_by('leaveday_date', 'leaveday_user')
+        self.assertUsesIndex(qs, 'leave_day_date_user_idx')
+
+
+@override_settings(APPROVAL_CALLBACK_SECRET='load-test')
+class QueryBudgetTests(TestCase):
+    """Every endpoint stays within loadtest.QUERY_BUDGETS on seeded data, so an N+1 fails here."""
+
+    @classmethod
+    def setUpTestData(cls):
+        loadtest.seed(events=600, users=40, seed=1)
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'start_or_notify_approval_check')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.workload = loadtest.Workload(seed=1, callback_secret='load-test')
+
+    def test_endpoints_stay_within_budget(self):
+        for name in loadtest.READ_ENDPOINTS + loadtest.WRITE_ENDPOINTS:
+            with self.subTest(name):
+                # Cold caches: the budget is the worst case
+                user_cache.bump_generation()
+                method, path, body, content_type, headers = getattr(self.workload, name)()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.generic(method, '/' + path, body, content_type=content_type,
+                                                   headers=headers)
+                self.assertLess(response.status_code, 400, response.content[:200])
+                self.assertLessEqual(len(queries), loadtest.QUERY_BUDGETS[name],
+                                     '\n'.join(query['sql'] for query in queries))
+
+    def test_seeded_data_is_consistent(self):
+        self.assertEqual(HolidayEvent.objects.count(), 600)
+        self.assertEqual(HolidayTimes.objects.count(), 40)
+        for quota in HolidayTimes.objects.all():
+            self.assertGreaterEqual(quota.holidaytimes_days, quota.holidaytimes_reserved)
+        # No user has two requests on the same day
+        self.assertFalse(LeaveDay.objects.values('leaveday_user', 'leaveday_date')
+                         .annotate(n=models.Count('leaveday_id')).filter(n__gt=1).exists())
+        # LeaveUsage was rebuilt after seeding
+        self.assertEqual(LeaveUsage.objects.count(), usage.rebuild())
+        # The quota rows agree with the leave history, charged the way the app charges it
+        self.assertEqual([str(drift) for drift in ledger.Reconciliation().drifts()], [])
+
+    def test_runner_drives_every_endpoint_through_the_stub(self):
+        with WorkflowStub() as stub, override_settings(**loadtest.load_test_settings(stub, 'load-test')):
+            runner = loadtest.LoadRunner(loadtest.InProcessTransport(), self.workload)
+            with self.captureOnCommitCallbacks():  # the outbox worker thread isn't started
+                elapsed, report = runner.run(loadtest.READ_ENDPOINTS + loadtest.WRITE_ENDPOINTS, 2)
+            self.assertEqual(views.create_workflow('lt000000', HolidayEvent.objects.first().holidayevents_id,
+                                                   't', '病假', '2024-04-01', 1, ''), ('STUB1', 'TASK1'))
+        self.assertEqual(set(report), set(loadtest.READ_ENDPOINTS + loadtest.WRITE_ENDPOINTS))
+        for name, stats in report.items():
+            self.assertTrue(all(isinstance(status, int) and status < 400 for status in stats['statuses']),
+                            (name, stats['statuses']))
+            self.assertIsNotNone(stats['queries'], name)
+        self.assertEqual(stub.requests['token'], 1)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs the real migrations back to ``before``; each test then migrates forward to ``after``."""
+
+    before = after = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        latest = self.executor.loader.graph.leaf_nodes('vacation')
+        self.addCleanup(self.migrate, latest)
+        self.migrate(self.before)
+        self.old_apps = self.executor.loader.project_state(self.before).apps
+
+    def migrate(self, targets):
+        self.executor.loader.build_graph()
+        self.executor.migrate(targets)
+
+
+class QuotaDedupeMigrationTests(MigrationTestCase):
+    """0003 adds the (opname, year) unique constraint over whatever rows are already there."""
+
+    before = [('vacation', '0002_holidayevent_permittime_datetime')]
+    after = [('vacation', '0003_event_and_quota_indexes')]
+
+    def setUp(self):
+        super().setUp()
+        self.HolidayTimes = self.old_apps.get_model('vacation', 'HolidayTimes')
+
+    def add(self, opname, year, days, haddays=0):
+        return self.HolidayTimes.objects.create(
+            holidaytimes_opname=opname, holidaytimes_year=year, holidaytimes_days=days, holidaytimes_haddays=haddays,
+            holidaytimes_addtime=timezone.now(), holidaytimes_workyear=5, holidaytimes_cmbyear=3).pk
+
+    def test_exact_copies_are_merged(self):
+        kept = self.add('张三', 2024, 10)
+        self.add('张三', 2024, 10)
+        self.add('张三', 2024, 10)
+        other = self.add('张三', 2023, 10)
+        self.migrate(self.after)
+        self.assertEqual(sorted(HolidayTimes.objects.values_list('pk', flat=True)), sorted([kept, other]))
+
+    def test_conflicting_rows_stop_the_migration(self):
+        first = self.add('张三', 2024, 10)
+        second = self.add('张三', 2024, 8, haddays=2)
+        self.add('李四', 2024, 5)
+        with self.assertRaisesMessage(RuntimeError, f'张三 2024: id {first} (days=10, haddays=0, workyear=5, cmbyear=3), '
+                                                    f'id {second} (days=8, haddays=2, workyear=5, cmbyear=3)'):
+            self.migrate(self.after)
+        self.assertEqual(self.HolidayTimes.objects.count(), 3)
+
+        self.HolidayTimes.objects.filter(pk=second).delete()
+        self.migrate(self.after)
+        self.assertEqual(HolidayTimes.objects.count(), 2)
+
+
+class ReservedBackfillMigrationTests(MigrationTestCase):
+    """0008 reserves pending 年假 on the row of the year each request was submitted in."""
+
+    before = [('vacation', '0007_workflowoutbox')]
+    after = [('vacation', '0008_holidaytimes_reserved')]
+
+    def test_pending_requests_reserve_their_submission_year(self):
+        HolidayEvent = self.old_apps.get_model('vacation', 'HolidayEvent')
+        HolidayTimes = self.old_apps.get_model('vacation', 'HolidayTimes')
+        for year in (current_year - 1, current_year):
+            HolidayTimes.objects.create(
+                holidaytimes_opname='张三', holidaytimes_year=year, holidaytimes_days=10, holidaytimes_haddays=0,
+                holidaytimes_addtime=timezone.now(), holidaytimes_workyear=5, holidaytimes_cmbyear=3)
+        for ispermit, htype, used, addtime in [
+            (1, '年假', 2, datetime(current_year - 1, 12, 20, 10)),
+            (1, '年假', 1, datetime(current_year, 1, 5, 10)),
+            (1, '年假', 3, datetime(current_year, 2, 1, 10)),
+            (2, '年假', 4, datetime(current_year, 3, 1, 10)),
+            (1, '病假', 5, datetime(current_year, 3, 2, 10)),
+        ]:
+            HolidayEvent.objects.create(
+                holidayevents_hname='张三', holidayevents_htype=htype, holidayevents_day='', holidayevents_remark='',
+                holidayevents_ispermit=ispermit, holidayevents_approval_user='', holidayevents_approval_opinion='',
+                holidayevents_usedDay=used, holidayevents_addtime=timezone.make_aware(addtime))
+        self.migrate(self.after)
+        HolidayTimes = self.executor.loader.project_state(self.after).apps.get_model('vacation', 'HolidayTimes')
+        self.assertEqual(list(HolidayTimes.objects.order_by('holidaytimes_year').values_list(
+            'holidaytimes_year', 'holidaytimes_reserved')), [(current_year - 1, 2), (current_year, 4)])
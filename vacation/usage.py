@@ -0,0 +1,134 @@
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from .models import LeaveDay, LeaveDayArchive, LeaveUsage, SpecialHoliday, parse_leave_days
+from . import workdays
+
+REBUILD_CHUNK_SIZE = 2000
+
+
+def event_months(event):
+    """``{(year, month): working days}`` for one event's leave days."""
+    try:
+        days = parse_leave_days(event.holidayevents_day)
+    except ValueError:
+        return {}
+    months = {}
+    for day in days:
+        if workdays.calendar.is_working_day(day):
+            months[(day.year, day.month)] = months.get((day.year, day.month), 0) + 1
+    return months
+
+
+def usage_delta(event, pending=0, approved=0, deltas=None):
+    """Add ``event``'s days times ``pending`` / ``approved`` (+1 / -1) to ``deltas`` and return it.
+
+    Keys are ``(user, year, month, htype)``, values ``[pending days, approved days]``.
+    """
+    deltas = {} if deltas is None else deltas
+    for (year, month), days in event_months(event).items():
+        bucket = deltas.setdefault((event.holidayevents_hname, year, month, event.holidayevents_htype), [0, 0])
+        bucket[0] += pending * days
+        bucket[1] += approved * days
+    return deltas
+
+
+def bucket_q(key):
+    user, year, month, htype = key
+    return Q(usage_user=user, usage_year=year, usage_month=month, usage_htype=htype)
+
+
+def apply_usage(deltas):
+    """Apply ``deltas`` from usage_delta(): one INSERT for missing rows, then one UPDATE."""
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    LeaveUsage.objects.bulk_create([
+        LeaveUsage(usage_user=user, usage_year=year, usage_month=month, usage_htype=htype)
+        for user, year, month, htype in deltas
+    ], ignore_conflicts=True)
+
+    def per_bucket(field, index):
+        whens = [When(bucket_q(key), then=F(field) + delta[index]) for key, delta in deltas.items() if delta[index]]
+        return Case(*whens, default=F(field)) if whens else F(field)
+
+    LeaveUsage.objects.filter(reduce(or_, map(bucket_q, deltas))).update(
+        usage_pending_days=per_bucket('usage_pending_days', 0),
+        usage_approved_days=per_bucket('usage_approved_days', 1),
+    )
+
+
+def record_usage(event, pending=0, approved=0):
+    apply_usage(usage_delta(event, pending, approved))
+
+
+def working_day(special_holiday=SpecialHoliday):
+    # SQL version of WorkdayCalendar.is_working_day() for LeaveDay.leaveday_date:
+    # 调休上班 wins over 节假日, otherwise Monday to Friday
+    special = special_holiday.objects.filter(specialholiday_day=OuterRef('leaveday_date'))
+    return Case(
+        When(Exists(special.filter(specialholiday_type=SpecialHoliday.TYPE_WORKDAY)), then=Value(1)),
+        When(Exists(special.filter(specialholiday_type=SpecialHoliday.TYPE_HOLIDAY)), then=Value(0)),
+        When(leaveday_date__iso_week_day__lte=5, then=Value(1)),
+        default=Value(0),
+    )
+
+
+def usage_rows(year=None, leave_day=LeaveDay, special_holiday=SpecialHoliday):
+    """The whole summary in one GROUP BY over LeaveDay, yielded as ``values()`` dicts."""
+    days = leave_day.objects.filter(leaveday_event__holidayevents_ispermit__in=(1, 2))
+    if year is not None:
+        days = days.filter(leaveday_date__year=year)
+    worked = working_day(special_holiday)
+    return days.values(
+        user=F('leaveday_user'),
+        year=ExtractYear('leaveday_date'),
+        month=ExtractMonth('leaveday_date'),
+        htype=F('leaveday_event__holidayevents_htype'),
+    ).annotate(
+        pending=Sum(Case(When(leaveday_event__holidayevents_ispermit=1, then=worked), default=Value(0))),
+        approved=Sum(Case(When(leaveday_event__holidayevents_ispermit=2, then=worked), default=Value(0))),
+    ).order_by().iterator(chunk_size=REBUILD_CHUNK_SIZE)
+
+
+def bucket_rows(year):
+    # usage_rows() of LeaveDay with the archived events' days added in. Those are all in past
+    # years and already grouped, so they are held in memory and merged into the matching buckets
+    archived = {(row['user'], row['year'], row['month'], row['htype']): row
+                for row in usage_rows(year, LeaveDayArchive)}
+    for row in usage_rows(year):
+        extra = archived.pop((row['user'], row['year'], row['month'], row['htype']), None)
+        if extra:
+            row['pending'] += extra['pending']
+            row['approved'] += extra['approved']
+        yield row
+    yield from archived.values()
+
+
+def rebuild(year=None):
+    """Recompute the summary (one year, or everything) from LeaveDay and LeaveDayArchive; returns
+    the number of rows."""
+    created = 0
+    with transaction.atomic():
+        existing = LeaveUsage.objects.all()
+        if year is not None:
+            existing = existing.filter(usage_year=year)
+        existing.delete()
+        batch = []
+        for row in bucket_rows(year):
+            if not row['pending'] and not row['approved']:
+                continue
+            batch.append(LeaveUsage(usage_user=row['user'], usage_year=row['year'], usage_month=row['month'],
+                                    usage_htype=row['htype'], usage_pending_days=row['pending'],
+                                    usage_approved_days=row['approved']))
+            if len(batch) >= REBUILD_CHUNK_SIZE:
+                LeaveUsage.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        LeaveUsage.objects.bulk_create(batch)
+        created += len(batch)
+    return created
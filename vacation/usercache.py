@@ -0,0 +1,135 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'vacation:user'
+
+
+def cache_setting(name, default):
+    return getattr(settings, f'USER_CACHE_{name}', default)
+
+
+def fresh_version():
+    # Used when a version key is missing (never set, or evicted): it must not collide with any
+    # version that data may still be cached under, so it can't simply restart at 1
+    return time.time_ns()
+
+
+class UserCache:
+    """Per-user read cache for quota and leave history on Django's cache framework.
+
+    Entries are stored under ``{user}:{generation}:{version}:{part}``. Writes never touch the
+    entries themselves: they bump the user's version (or the global generation, for bulk jobs)
+    once the transaction commits, which makes every older entry unreachable. A reader that raced
+    the write and cached pre-commit data did so under the old version, so it is never served.
+    """
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias or cache_setting('ALIAS', 'default')
+        self.timeout = timeout if timeout is not None else cache_setting('TIMEOUT', 300)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def user_key(self, username):
+        # Usernames are mostly Chinese; memcached keys must be short ASCII
+        return f'{KEY_PREFIX}:{hashlib.sha1(username.encode()).hexdigest()}'
+
+    def generation_key(self):
+        return f'{KEY_PREFIX}:generation'
+
+    def versions(self, username):
+        keys = [self.generation_key(), f'{self.user_key(username)}:version']
+        found = self.backend.get_many(keys)
+        for key in keys:
+            if key not in found:
+                # add() so concurrent readers agree on one value
+                self.backend.add(key, fresh_version(), timeout=None)
+                found[key] = self.backend.get(key)
+        return found[keys[0]], found[keys[1]]
+
+    def get_or_load(self, username, part, load):
+        generation, version = self.versions(username)
+        key = f'{self.user_key(username)}:{generation}:{version}:{part}'
+        value = self.backend.get(key)
+        if value is not None:
+            self.count('hits')
+            return value
+        self.count('misses')
+        value = load()
+        self.backend.set(key, value, timeout=self.timeout)
+        return value
+
+    # Async versions for the ASGI views; ``load`` is a coroutine function
+
+    async def aversions(self, username):
+        keys = [self.generation_key(), f'{self.user_key(username)}:version']
+        found = await self.backend.aget_many(keys)
+        for key in keys:
+            if key not in found:
+                await self.backend.aadd(key, fresh_version(), timeout=None)
+                found[key] = await self.backend.aget(key)
+        return found[keys[0]], found[keys[1]]
+
+    async def aget_or_load(self, username, part, load):
+        generation, version = await self.aversions(username)
+        key = f'{self.user_key(username)}:{generation}:{version}:{part}'
+        value = await self.backend.aget(key)
+        if value is not None:
+            self.count('hits')
+            return value
+        self.count('misses')
+        value = await load()
+        await self.backend.aset(key, value, timeout=self.timeout)
+        return value
+
+    def bump(self, key):
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            # Not cached yet: the next read starts a fresh version anyway
+            pass
+
+    def invalidate(self, *usernames):
+        """Drop the cached data of ``usernames`` once the current transaction commits."""
+        usernames = {username for username in usernames if username}
+        if usernames:
+            transaction.on_commit(lambda: self.bump_users(usernames))
+
+    def invalidate_all(self):
+        transaction.on_commit(self.bump_generation)
+
+    def bump_users(self, usernames):
+        for username in usernames:
+            self.bump(f'{self.user_key(username)}:version')
+        self.count('invalidations', len(usernames))
+
+    def bump_generation(self):
+        self.bump(self.generation_key())
+        self.count('invalidations')
+
+    def count(self, counter, n=1):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+user_cache = UserCache()
@@ -0,0 +1,98 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import VersionStamp
+
+# What each stamp covers:
+#   events   - HolidayEvent and everything derived from it (LeaveDay, LeaveUsage)
+#   quotas   - HolidayTimes
+#   calendar - SpecialHoliday
+TABLES = ('events', 'quotas', 'calendar')
+
+
+class VersionStamps:
+    """Per-table version stamps for conditional GET, one VersionStamp row per table.
+
+    A stamp is the time of the table's last write in nanoseconds, so it doubles as
+    Last-Modified. It is moved in the write's own transaction, so every process (web workers,
+    poll_approvals, import_quotas, ...) sees it exactly when it sees the rows. A missing row is
+    created as "now", which can only cause an unnecessary 200, never a wrong 304. Always read
+    and written on the primary; routers.py compares the replicas' copies with it.
+    """
+
+    def rows(self):
+        return VersionStamp.objects.using(DEFAULT_DB_ALIAS)
+
+    def create_missing(self, tables):
+        self.rows().bulk_create([VersionStamp(stamp_table=table, stamp_value=time.time_ns()) for table in tables],
+                                ignore_conflicts=True)
+
+    def get(self, *tables):
+        found = dict(self.rows().filter(stamp_table__in=tables).values_list('stamp_table', 'stamp_value'))
+        missing = [table for table in tables if table not in found]
+        if missing:
+            self.create_missing(missing)
+            found.update(self.rows().filter(stamp_table__in=missing).values_list('stamp_table', 'stamp_value'))
+        return [found[table] for table in tables]
+
+    async def aget(self, *tables):
+        found = {table: value async for table, value in self.rows().filter(
+            stamp_table__in=tables).values_list('stamp_table', 'stamp_value')}
+        if any(table not in found for table in tables):
+            return await sync_to_async(self.get)(*tables)
+        return [found[table] for table in tables]
+
+    def for_request(self, request, *tables):
+        # etag, last_modified and the replica choice of one request share a single read
+        memo = request.__dict__.setdefault('_version_stamps', {})
+        if tables not in memo:
+            memo[tables] = self.get(*tables)
+        return memo[tables]
+
+    async def afor_request(self, request, *tables):
+        memo = request.__dict__.setdefault('_version_stamps', {})
+        if tables not in memo:
+            memo[tables] = await self.aget(*tables)
+        return memo[tables]
+
+    def bump(self, *tables):
+        """Move the stamps of ``tables`` inside the current transaction (call after the write)."""
+        # One UPDATE per row in a fixed order, so concurrent writers lock them in the same order
+        for table in sorted({table for table in tables if table}):
+            # Strictly increasing even if two writes land in the same clock tick
+            if not self.rows().filter(stamp_table=table).update(
+                    stamp_value=Greatest(Value(time.time_ns()), F('stamp_value') + 1)):
+                self.create_missing([table])
+
+    def etag(self, request, *tables):
+        return etag_for(request, self.for_request(request, *tables))
+
+    def last_modified(self, request, *tables):
+        return last_modified_for(self.for_request(request, *tables))
+
+
+def etag_for(request, stamps):
+    # Strong ETag: the same stamps, query string and Accept always give the same bytes
+    digest = hashlib.sha1(request.get_full_path().encode())
+    digest.update(request.headers.get('Accept', '').encode())
+    for stamp in stamps:
+        digest.update(str(stamp).encode())
+    return digest.hexdigest()
+
+
+def last_modified_for(stamps):
+    # HTTP dates have one-second resolution: while the last write is still in the current
+    # second another one could follow with the same date, so don't send one yet
+    seconds = max(stamps) // 10**9
+    if seconds >= int(time.time()):
+        return None
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+stamps = VersionStamps()
@@ -1,29 +1,66 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
-from .models import HolidayEvent, HolidayTimes
-from datetime import datetime, timedelta
-import time
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import (ChangeLog, HolidayEvent, HolidayEventArchive, HolidayTimes, LeaveDay, LeaveDayArchive, LeaveUsage,
+                     parse_leave_days)
+from .archive import hot_years
+from .conflicts import overlapping_dates, overstaffed_dates
+from .integration import WorkflowError, get_async_client, get_client
+from .metrics import registry
+from .outbox import OutboxWorker, enqueue_workflow
+from .poller import APPROVAL_ACTIONS, ApprovalPoller
+from .quota import QUOTA_LEAVE_TYPE, QuotaError, apply_batch, consume, quota_rows, quota_year, release, reserve
+from .quota_import import import_quotas
+from .ledger import balance, record_change
+from .pagination import merge_rows, merged_keyset_page, parse_limit, stream_list
+from .pubsub import pending_added, pending_queue, pending_removed, publish_pending, stream_setting
+from .changelog import ChangesCompacted, changes_since, log_keys, record_consumer
+from .usage import apply_usage, record_usage, usage_delta
+from .routers import replica_reads
+from .usercache import user_cache
+from .versions import stamps
+from . import codec, workdays
+from copy import copy
+from datetime import date, datetime
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.views.decorators.vary import vary_on_headers
+import asyncio
+import hashlib
+import heapq
+import hmac
 import json
-import requests
 import threading
 
-current_year = datetime.now().year
-
 # Constants for status codes
 STATUS_OK = 200
 STATUS_CREATED = 201
 STATUS_BAD_REQUEST = 400
+STATUS_UNAUTHORIZED = 401
 STATUS_NOT_FOUND = 404
+STATUS_CONFLICT = 409
+STATUS_GONE = 410
 STATUS_METHOD_NOT_ALLOWED = 405
 
+# batch_approve_vacation 单次最多处理的条数
+MAX_BATCH_APPROVE = 1000
+
+# team_calendar 单次查询允许的最大天数，也是一次请假首尾日期的最大跨度
+MAX_CALENDAR_DAYS = 366
+# working_days 单次查询允许的最大天数（约十年）
+MAX_WORKING_DAYS_RANGE = 3660
+
 # 用于标记线程是否已经启动
 approval_check_thread = None
+outbox_worker_thread = None
 
-# Utility function for JSON responses
-def json_response(data, status=STATUS_OK):
-    return JsonResponse(data, status=status)
+# Utility function for JSON responses (list endpoints pass the negotiated codec.Format)
+def json_response(data, status=STATUS_OK, fmt=codec.JSON):
+    return HttpResponse(fmt.encode(data), status=status, content_type=fmt.content_type)
 
 def validate_required_fields(data, required_fields):
     for field in required_fields:
@@ -31,30 +68,124 @@ def validate_required_fields(data, required_fields):
             return json_response({'error': f'Missing required field: {field}'}, status=STATUS_BAD_REQUEST)
     return None
 
+def list_response(request, querysets, key, time_field, id_field):
+    # ?limit=&after= returns one keyset page; without them the full list is streamed.
+    # ``querysets``: the same query on one or more tables (hot + archive), merged newest first.
+    # ?fields=a,b keeps only those columns; Accept / ?format= picks the layout (codec.FORMATS)
+    limit = request.GET.get('limit')
+    after = request.GET.get('after')
+    try:
+        fmt = codec.negotiate(request)
+        columns = codec.parse_fields(request, querysets[0].model)
+        if limit is None and after is None:
+            return stream_list(fmt, key, querysets, time_field, id_field, columns)
+        rows, next_cursor = merged_keyset_page(querysets, time_field, id_field, parse_limit(limit), after, columns)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    return json_response({key: codec.shape(fmt, rows, columns), 'next_cursor': next_cursor}, fmt=fmt)
+
+def archive_scope(request):
+    # ?include_archived=1 adds holiday_events_archive; ?year=2023 keeps the events submitted
+    # that year and reads the archive too when the year is a past one. Raises ValueError
+    include = request.GET.get('include_archived') == '1'
+    year = request.GET.get('year')
+    if year:
+        try:
+            year = int(year)
+        except ValueError:
+            raise ValueError(f'Invalid year: {year}') from None
+        include = include or year < hot_years()
+    return include, year or None
+
+def event_querysets(request, **filters):
+    include_archived, year = archive_scope(request)
+    querysets = [HolidayEvent.objects.filter(**filters)]
+    if include_archived:
+        querysets.append(HolidayEventArchive.objects.filter(**filters))
+    if year:
+        start = timezone.make_aware(datetime(year, 1, 1))
+        end = timezone.make_aware(datetime(year + 1, 1, 1))
+        querysets = [queryset.filter(holidayevents_addtime__gte=start, holidayevents_addtime__lt=end)
+                     for queryset in querysets]
+    return querysets
+
+def event_list_response(request, key, **filters):
+    try:
+        querysets = event_querysets(request, **filters)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    return list_response(request, querysets, key, 'holidayevents_addtime', 'holidayevents_id')
+
+def quota_list_response(request, queryset, key):
+    return list_response(request, [queryset], key, 'holidaytimes_addtime', 'holidaytimes_id')
+
+def cached_list_response(request, username, querysets, key, time_field, id_field, scope=''):
+    # The full list and the first page of one user's rows come from user_cache; later pages
+    # (?after=) are rare and go straight to the database. The cache holds whole rows, ?fields=
+    # and the format are applied per request
+    if request.GET.get('after'):
+        return list_response(request, querysets, key, time_field, id_field)
+    limit = request.GET.get('limit')
+    try:
+        fmt = codec.negotiate(request)
+        columns = codec.parse_fields(request, querysets[0].model)
+        limit = parse_limit(limit) if limit is not None else None
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+
+    def load():
+        if limit is None:
+            order = (f'-{time_field}', f'-{id_field}')
+            return {key: list(merge_rows(time_field, id_field,
+                                         *(queryset.order_by(*order).values() for queryset in querysets)))}
+        rows, next_cursor = merged_keyset_page(querysets, time_field, id_field, limit)
+        return {key: rows, 'next_cursor': next_cursor}
+
+    data = dict(user_cache.get_or_load(username, f'{key}:{limit or "all"}{scope}', load))
+    data[key] = codec.shape(fmt, data[key], columns)
+    return json_response(data, fmt=fmt)
+
+def data_changed(tables, *usernames):
+    # Call inside the write's transaction, after the write: on commit the users' cached rows are
+    # dropped, and the version stamps (ETag / Last-Modified) of the given tables move with it
+    user_cache.invalidate(*usernames)
+    stamps.bump(*tables)
+
+def event_tables(*events):
+    # Annual leave also changes HolidayTimes (reserved / used days)
+    if any(event.holidayevents_htype == QUOTA_LEAVE_TYPE for event in events):
+        return ('events', 'quotas')
+    return ('events',)
+
+def conditional(*tables):
+    # Conditional GET from the version stamps of ``tables``: a current client gets a 304
+    # without any rows being read or serialized. The body depends on Accept (codec.negotiate).
+    # These are the read-only views, so their queries may go to a replica (routers.py)
+    check = condition(etag_func=lambda request, *args, **kwargs: stamps.etag(request, *tables),
+                      last_modified_func=lambda request, *args, **kwargs: stamps.last_modified(request, *tables))
+    return lambda view: vary_on_headers('Accept')(check(replica_reads(*tables)(view)))
+
 def get_token():
-    url='http://127.0.0.1:8000/api/token/'
-    headers = {'Content-Type': 'application/json'}
-    data = {'username': 'admin', 'password': '123456'}
-    response = requests.post(url, headers=headers, json=data)
-    return response.json()['access']
+    return get_client().token()
+
+async def aget_token():
+    return await get_async_client().token()
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@conditional('events')
 def get_vacation_list(request):
-    vacation_list = HolidayEvent.objects.all().order_by('-holidayevents_addtime')
-    return json_response({'vacation_list': list(vacation_list.values())})
+    return event_list_response(request, 'vacation_list')
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@conditional('quotas')
 def vacation_quota_list(request):
-    vacation_quota = HolidayTimes.objects.all()
-    return json_response({'vacation_quota': list(vacation_quota.values())})
+    return quota_list_response(request, HolidayTimes.objects.all(), 'vacation_quota')
 
-def create_workflow(ystid,vacation_id,title,htype,events_day,used_days,remark):
-    url='https://example/url'
-    id_token = get_token
-    related_key='123456'
+def workflow_payload(ystid,vacation_id,title,htype,events_day,used_days,remark):
+    related_key = getattr(settings, 'WORKFLOW_RELATED_KEY', '123456')
     fields = [
         {
             "key":"title",
@@ -78,42 +209,60 @@ def create_workflow(ystid,vacation_id,title,htype,events_day,used_days,remark):
         }
     ]
 
-    payload = {
+    return {
         'username':ystid,
         'related_key':related_key,
         'fields':fields
     }
+
+def workflow_headers(id_token, idempotency_key=None):
     headers = {
         'Content-Type':'application/json',
         'id-token':id_token
     }
-    try:
-        response = requests.post(url,headers=headers,json=payload)
-        if response.status_code == 200:
-            response_data = response.json()
-            if response_data['result']:
-                data = response_data['data']
-                runiu_id = data['runiu_id']
-                task_id = data['task_id']
-                vacation=HolidayEvent.objects.get(holidayevents_id=vacation_id)
-                vacation.holidayevents_ticket_id = runiu_id
-                vacation.holidayevents_task_id = task_id
-                vacation.save()
-                return True
-            else:
-                print(f"Error creating workflow: {response_data['message']}")
-                return False
-        else:
-            print(f"Error creating workflow: {response.status_code} {response.text}")
-            return False
-    except Exception as e:
-        print(f"Error creating workflow: {e}")
-        return False
+    if idempotency_key:
+        headers['Idempotency-Key'] = idempotency_key
+    return headers
+
+def save_workflow_ticket(ystid, vacation_id, response):
+    # Parse the create response and store the ticket ids on the event; raises WorkflowError
+    if response.status_code != 200:
+        raise WorkflowError(f"Error creating workflow: {response.status_code} {response.text}")
+    response_data = response.json()
+    if not response_data['result']:
+        raise WorkflowError(f"Error creating workflow: {response_data['message']}")
+    data = response_data['data']
+    with transaction.atomic():
+        HolidayEvent.objects.filter(holidayevents_id=vacation_id).update(runiuId=data['runiu_id'], taskId=data['task_id'])
+        log_keys(ChangeLog.TABLE_EVENT, [vacation_id])
+        data_changed(('events',), ystid)
+    return data['runiu_id'], data['task_id']
+
+def create_workflow(ystid,vacation_id,title,htype,events_day,used_days,remark,idempotency_key=None):
+    client = get_client()
+    url = getattr(settings, 'WORKFLOW_CREATE_URL', 'https://example/url')
+    payload = workflow_payload(ystid,vacation_id,title,htype,events_day,used_days,remark)
+    headers = workflow_headers(client.token(), idempotency_key)
+    response = client.session.post(url,headers=headers,json=payload)
+    if response.status_code == 401:
+        client.tokens.invalidate()
+    return save_workflow_ticket(ystid, vacation_id, response)
+
+async def acreate_workflow(ystid,vacation_id,title,htype,events_day,used_days,remark,idempotency_key=None):
+    # create_workflow for async callers: the HTTP round trips don't hold a thread
+    client = get_async_client()
+    url = getattr(settings, 'WORKFLOW_CREATE_URL', 'https://example/url')
+    payload = workflow_payload(ystid,vacation_id,title,htype,events_day,used_days,remark)
+    headers = workflow_headers(await client.token(), idempotency_key)
+    response = await client.http.request('POST', url, headers=headers, json=payload)
+    if response.status_code == 401:
+        client.tokens.invalidate()
+    return await sync_to_async(save_workflow_ticket)(ystid, vacation_id, response)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def submit_vacation(request):
-    data = json.loads(request.body)
+    data = codec.loads(request.body)
     required_fields = ['username', 'leave_type', 'leave_day', 'reason']
     validation_error = validate_required_fields(data, required_fields)
     if validation_error:
@@ -124,13 +273,15 @@ def submit_vacation(request):
     leave_day = data.get('leave_day')  # format: 2024-04-01,2024-04-02,2024-04-03
     reason = data.get('reason')
 
-    
-    used_days = len(leave_day.split(','))  # Number of days of leave used
-
-    if leave_type == '年假':
-        holiday_times = get_object_or_404(HolidayTimes, holidaytimes_opname=username, holidaytimes_year=current_year)  # User's holiday_times data for the current year
-        if holiday_times.holidaytimes_days < used_days:
-            return json_response({'error': 'User has already used all their annual leave for the year'}, status=STATUS_BAD_REQUEST)
+    try:
+        leave_dates = parse_leave_days(leave_day)
+        if (leave_dates[-1] - leave_dates[0]).days > MAX_CALENDAR_DAYS:
+            raise ValueError(f'Leave days span more than {MAX_CALENDAR_DAYS} days')
+        used_days = workdays.calendar.working_days_in(leave_dates)  # 只计工作日，周末和法定节假日不占用额度
+    except ValueError:
+        return json_response({'error': f'Invalid leave_day: {leave_day}'}, status=STATUS_BAD_REQUEST)
+    if not used_days:
+        return json_response({'error': f'No working days in leave_day: {leave_day}'}, status=STATUS_BAD_REQUEST)
 
     # create a vacation event
     vacation_event = HolidayEvent(
@@ -142,7 +293,48 @@ def submit_vacation(request):
         holidayevents_ispermit=1,
         holidayevents_addtime=datetime.now()
     )
-    vacation_event.save()
+    charged = leave_type == QUOTA_LEAVE_TYPE
+    with transaction.atomic():
+        # 年假: 先锁住当年额度行，串行化同一用户的并发提交（下面的重叠检查依赖这把锁）。
+        # 用空 UPDATE 而不是 select_for_update: SQLite 忽略后者，读后再写的事务并发时会 "database is locked"
+        if charged and not quota_rows(username, quota_year(vacation_event)).update(
+                holidaytimes_reserved=F('holidaytimes_reserved')):
+            raise Http404('No HolidayTimes matches the given query.')
+        # 同一天不能重复请假；所在小组当天休假人数已满时不能再请
+        overlap = overlapping_dates(username, leave_dates)
+        if overlap:
+            transaction.set_rollback(True)
+            return json_response({'error': 'Leave overlaps an existing pending or approved request',
+                                  'dates': [d.isoformat() for d in overlap]}, status=STATUS_BAD_REQUEST)
+        overstaffed = overstaffed_dates(username, leave_dates)
+        if overstaffed:
+            transaction.set_rollback(True)
+            return json_response({'error': 'Too many team members are already on leave',
+                                  'teams': {team: [d.isoformat() for d in days] for team, days in overstaffed.items()}},
+                                 status=STATUS_BAD_REQUEST)
+        vacation_event.save()
+        # 占用额度记在这条申请上；额度不足时整个事务回滚，不写入任何数据
+        if charged and not reserve(username, quota_year(vacation_event), used_days,
+                                   event_id=vacation_event.holidayevents_id):
+            transaction.set_rollback(True)
+            return json_response({'error': 'User has already used all their annual leave for the year'}, status=STATUS_BAD_REQUEST)
+        log_keys(ChangeLog.TABLE_EVENT, [vacation_event.holidayevents_id])
+        publish_pending(pending_added(vacation_event))
+        LeaveDay.objects.bulk_create(LeaveDay.for_event(vacation_event, leave_dates))
+        record_usage(vacation_event, pending=1)
+        # 建单请求写入 outbox，由后台线程发送，提交接口不等待审批系统
+        enqueue_workflow(
+            vacation_event,
+            ystid=username,
+            vacation_id=vacation_event.holidayevents_id,
+            title=f'{username}的{leave_type}申请',
+            htype=leave_type,
+            events_day=leave_day,
+            used_days=used_days,
+            remark=reason,
+        )
+        transaction.on_commit(start_or_notify_outbox_worker)
+        data_changed(event_tables(vacation_event), username)
 
     # 提交成功后启动或通知审批查询
     start_or_notify_approval_check()
@@ -152,45 +344,72 @@ def submit_vacation(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def revoke_vacation(request):
-    data = json.loads(request.body)
+    data = codec.loads(request.body)
     id = data.get('vacation_id')
     if not id:
         return json_response({'error': 'Missing required field: vacation_id'}, status=STATUS_BAD_REQUEST)
 
     vacation_event = get_object_or_404(HolidayEvent, holidayevents_id=id)
-    if vacation_event.holidayevents_ispermit != 1:
-        return json_response({'error': 'Only pending vacation events can be revoked'}, status=STATUS_BAD_REQUEST)
-
-    vacation_event.holidayevents_ispermit = 4  # 4: revoked
-    vacation_event.save()
+    with transaction.atomic():
+        # Conditional update: loses cleanly against a concurrent approval
+        revoked = HolidayEvent.objects.filter(holidayevents_id=id, holidayevents_ispermit=1).update(
+            holidayevents_ispermit=4)  # 4: revoked
+        if not revoked:
+            return json_response({'error': 'Only pending vacation events can be revoked'}, status=STATUS_BAD_REQUEST)
+        log_keys(ChangeLog.TABLE_EVENT, [id])
+        publish_pending(pending_removed(vacation_event.holidayevents_id, 4))
+        if vacation_event.holidayevents_htype == QUOTA_LEAVE_TYPE:
+            release(vacation_event.holidayevents_hname, quota_year(vacation_event),
+                    vacation_event.holidayevents_usedDay, event_id=vacation_event.holidayevents_id)
+        record_usage(vacation_event, pending=-1)
+        data_changed(event_tables(vacation_event), vacation_event.holidayevents_hname)
     return json_response({'message': 'Vacation event revoked successfully'}, status=STATUS_OK)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def delete_vacation(request):
-    data = json.loads(request.body)
+    data = codec.loads(request.body)
     id = data.get('vacation_id')
     if not id:
         return json_response({'error': 'Missing required field: vacation_id'}, status=STATUS_BAD_REQUEST)
-    vacation_event = get_object_or_404(HolidayEvent, holidayevents_id=id)
-    vacation_event.delete()
+    with transaction.atomic():
+        vacation_event = get_object_or_404(HolidayEvent.objects.select_for_update(), holidayevents_id=id)
+        if vacation_event.holidayevents_ispermit == 1 and vacation_event.holidayevents_htype == QUOTA_LEAVE_TYPE:
+            release(vacation_event.holidayevents_hname, quota_year(vacation_event),
+                    vacation_event.holidayevents_usedDay, event_id=vacation_event.holidayevents_id)
+        if vacation_event.holidayevents_ispermit == 1:
+            record_usage(vacation_event, pending=-1)
+        elif vacation_event.holidayevents_ispermit == 2:
+            record_usage(vacation_event, approved=-1)
+        log_keys(ChangeLog.TABLE_EVENT, [vacation_event.holidayevents_id], ChangeLog.OP_DELETE)
+        if vacation_event.holidayevents_ispermit == 1:
+            publish_pending(pending_removed(vacation_event.holidayevents_id, 0))
+        vacation_event.delete()
+        data_changed(event_tables(vacation_event), vacation_event.holidayevents_hname)
     return json_response({'message': 'Vacation event deleted successfully'}, status=STATUS_OK)
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@conditional('events')
 def get_user_vacation_info(request):
     username = request.GET.get('username')
     if not username:
         return json_response({'error': 'Missing username parameter'}, status=STATUS_BAD_REQUEST)
-    vacation_info = HolidayEvent.objects.filter(holidayevents_hname=username).order_by('-holidayevents_addtime')
-    return json_response({'vacation_info': list(vacation_info.values())})
+    try:
+        vacation_info = event_querysets(request, holidayevents_hname=username)
+        include_archived, year = archive_scope(request)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
+    scope = (':archived' if include_archived else '') + (f':{year}' if year else '')
+    return cached_list_response(request, username, vacation_info, 'vacation_info',
+                                'holidayevents_addtime', 'holidayevents_id', scope)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def approve_vacation(request):
     try:
-        data = json.loads(request.body)
+        data = codec.loads(request.body)
 
         # Check for missing fields
         required_fields = ['id', 'opinion', 'ispermit']
@@ -202,30 +421,114 @@ def approve_vacation(request):
         approver = data.get('approver')
         opinion = data.get('opinion')
         ispermit = data.get('ispermit')  # 1: pending, 2: approved, 3: rejected
+        if ispermit not in (2, 3):
+            return json_response({'error': 'Invalid ispermit value'}, status=STATUS_BAD_REQUEST)
         vacation_event = get_object_or_404(HolidayEvent, holidayevents_id=id)
 
-        update_vacation_status(vacation_event, ispermit, approver, opinion)
+        try:
+            update_vacation_status(vacation_event, ispermit, approver or '', opinion)
+        except QuotaError as e:
+            return json_response({'error': str(e)}, status=STATUS_BAD_REQUEST)
 
         if ispermit == 2:
             return json_response({'message': 'Vacation event approved successfully'}, status=STATUS_OK)
-        elif ispermit == 3:
-            return json_response({'message': 'Vacation event rejected successfully'}, status=STATUS_OK)
         else:
-            return json_response({'error': 'Invalid ispermit value'}, status=STATUS_BAD_REQUEST)
+            return json_response({'message': 'Vacation event rejected successfully'}, status=STATUS_OK)
+    except json.JSONDecodeError:
+        return json_response({'error': 'Invalid JSON'}, status=STATUS_BAD_REQUEST)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_approve_vacation(request):
+    # {"approver": "...", "items": [{"id": 1, "ispermit": 2, "opinion": "..."}, ...]}
+    try:
+        data = codec.loads(request.body)
     except json.JSONDecodeError:
         return json_response({'error': 'Invalid JSON'}, status=STATUS_BAD_REQUEST)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return json_response({'error': 'Missing required field: items'}, status=STATUS_BAD_REQUEST)
+    if len(items) > MAX_BATCH_APPROVE:
+        return json_response({'error': f'At most {MAX_BATCH_APPROVE} items per batch'}, status=STATUS_BAD_REQUEST)
+    approver = data.get('approver') or ''
+
+    results = [{'id': item.get('id') if isinstance(item, dict) else None, 'result': 'invalid'} for item in items]
+    ids = {item['id'] for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)}
+    permittime = timezone.now()
+    with transaction.atomic():
+        events = HolidayEvent.objects.select_for_update().in_bulk(ids)
+        annual = [e for e in events.values() if e.holidayevents_htype == QUOTA_LEAVE_TYPE]
+        # Free balance per (user, quota year), checked as approvals accumulate
+        balances = {(user, year): days for user, year, days in HolidayTimes.objects.select_for_update().filter(
+            holidaytimes_opname__in={e.holidayevents_hname for e in annual},
+            holidaytimes_year__in={quota_year(e) for e in annual},
+        ).values_list('holidaytimes_opname', 'holidaytimes_year', 'holidaytimes_days')} if annual else {}
+
+        decided, consumed, released, usage = [], {}, {}, {}
+        for result, item in zip(results, items):
+            if (not isinstance(item, dict) or not isinstance(item.get('id'), int)
+                    or item.get('ispermit') not in (2, 3) or not item.get('opinion')):
+                continue
+            event = events.get(item['id'])
+            if event is None:
+                result['result'] = 'not_found'
+                continue
+            if event.holidayevents_ispermit != 1:
+                # Includes the same id appearing twice in one batch
+                result['result'] = 'already_decided'
+                continue
+            ispermit = item['ispermit']
+            days = event.holidayevents_usedDay
+            user = event.holidayevents_hname
+            if event.holidayevents_htype == QUOTA_LEAVE_TYPE:
+                # {year: {user: days}}: each request goes back to the row it was reserved in
+                year = quota_year(event)
+                if ispermit == 2:
+                    if balances.get((user, year), 0) < days:
+                        result['result'] = 'quota_error'
+                        continue
+                    balances[(user, year)] -= days
+                    consumed.setdefault(year, {})[user] = consumed.get(year, {}).get(user, 0) + days
+                else:
+                    released.setdefault(year, {})[user] = released.get(year, {}).get(user, 0) + days
+            usage_delta(event, pending=-1, approved=int(ispermit == 2), deltas=usage)
+            event.holidayevents_ispermit = ispermit
+            event.holidayevents_approval_user = approver
+            event.holidayevents_approval_opinion = item['opinion']
+            event.holidayevents_permittime = permittime
+            decided.append(event)
+            result['result'] = 'approved' if ispermit == 2 else 'rejected'
+
+        if decided:
+            updated = HolidayEvent.objects.filter(holidayevents_ispermit=1).bulk_update(decided, [
+                'holidayevents_ispermit', 'holidayevents_approval_user', 'holidayevents_approval_opinion',
+                'holidayevents_permittime'])
+            if updated != len(decided):
+                # Someone decided one of these events after we read it; nothing has been applied
+                transaction.set_rollback(True)
+                return json_response({'error': 'Vacation events changed concurrently, please retry'},
+                                     status=STATUS_CONFLICT)
+            for year in set(consumed) | set(released):
+                apply_batch(year, consumed.get(year, {}), released.get(year, {}))
+            apply_usage(usage)
+            log_keys(ChangeLog.TABLE_EVENT, [event.holidayevents_id for event in decided])
+            publish_pending(*(pending_removed(event.holidayevents_id, event.holidayevents_ispermit) for event in decided))
+            data_changed(event_tables(*decided), *{event.holidayevents_hname for event in decided})
+    return json_response({'results': results}, status=STATUS_OK)
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@conditional('events')
 def get_approve_vacation_list(request):
-    vacation_list = HolidayEvent.objects.filter(holidayevents_ispermit=1).order_by('-holidayevents_addtime')
-    return json_response({'vacation_list': list(vacation_list.values())})
+    # Pending events are never archived
+    vacation_list = HolidayEvent.objects.filter(holidayevents_ispermit=1)
+    return list_response(request, [vacation_list], 'vacation_list', 'holidayevents_addtime', 'holidayevents_id')
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def create_vacation_times(request):
     try:
-        data = json.loads(request.body)
+        data = codec.loads(request.body)
         username = data.get('username')
         year = data.get('year')
         days = data.get('days')
@@ -248,21 +551,50 @@ def create_vacation_times(request):
             holidaytimes_cmbyear=cmb_year,
             holidaytimes_addtime=datetime.now()
         )
-        vacation_times.save()
+        try:
+            with transaction.atomic():
+                vacation_times.save()
+                log_keys(ChangeLog.TABLE_QUOTA, [vacation_times.holidaytimes_id])
+                record_change([], [vacation_times])
+                data_changed(('quotas',), username)
+        except IntegrityError:
+            return json_response({'error': f'Vacation times for {username} in {year} already exist'}, status=STATUS_BAD_REQUEST)
         return json_response({'message': 'Vacation times added successfully'}, status=STATUS_CREATED)
     except json.JSONDecodeError:
         return json_response({'error': 'Invalid JSON'}, status=STATUS_BAD_REQUEST)
 
+def import_format(request, filename=''):
+    fmt = request.GET.get('format')
+    if fmt:
+        return fmt
+    content_type = request.content_type or ''
+    if filename.endswith('.csv') or content_type == 'text/csv':
+        return 'csv'
+    return 'jsonl'
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_vacation_times(request):
+    # 批量导入年假额度: multipart "file" 字段上传，或直接以请求体发送 CSV / JSONL（?format=csv|jsonl）
+    upload = request.FILES.get('file') if request.content_type == 'multipart/form-data' else None
+    fmt = import_format(request, upload.name if upload else '')
+    if fmt not in ('csv', 'jsonl'):
+        return json_response({'error': f'Unsupported format: {fmt}'}, status=STATUS_BAD_REQUEST)
+    # Both an UploadedFile and the request itself iterate line by line without reading everything
+    report = import_quotas(upload if upload else request, fmt)
+    return json_response(report, status=STATUS_OK)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def update_vacation_times(request):
     try:
-        data = json.loads(request.body)
+        data = codec.loads(request.body)
         id = data.get('id')
         if not id:
             return json_response({'error': 'Missing required field: id'}, status=STATUS_BAD_REQUEST)
 
         vacation_times = get_object_or_404(HolidayTimes, holidaytimes_id=id)
+        before = copy(vacation_times)
 
         field_mapping = {
             'year': 'holidaytimes_year',
@@ -282,7 +614,16 @@ def update_vacation_times(request):
         if not updated_fields:
             return json_response({'error': 'No valid fields provided for update'}, status=STATUS_BAD_REQUEST)
 
-        vacation_times.save()
+        try:
+            with transaction.atomic():
+                # update_fields: don't overwrite holidaytimes_reserved, which submits/approvals change concurrently
+                vacation_times.save(update_fields=list(updated_fields))
+                log_keys(ChangeLog.TABLE_QUOTA, [vacation_times.holidaytimes_id])
+                # A year change moves the whole balance to the new year in the ledger
+                record_change([before], [vacation_times])
+                data_changed(('quotas',), vacation_times.holidaytimes_opname)
+        except IntegrityError:
+            return json_response({'error': 'Vacation times for this user and year already exist'}, status=STATUS_BAD_REQUEST)
 
         return json_response({'message': 'Vacation times updated successfully', 'updated_fields': updated_fields}, status=STATUS_OK)
     except json.JSONDecodeError:
@@ -291,78 +632,354 @@ def update_vacation_times(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def delete_vacation_times(request):
-    data = json.loads(request.body)
+    data = codec.loads(request.body)
     id = data.get('id')
     opname = data.get('opname')
     vacation_times = get_object_or_404(HolidayTimes, holidaytimes_id=id)
-    vacation_times.delete()
+    with transaction.atomic():
+        log_keys(ChangeLog.TABLE_QUOTA, [vacation_times.holidaytimes_id], ChangeLog.OP_DELETE)
+        vacation_times.delete()
+        record_change([vacation_times], [])
+        data_changed(('quotas',), vacation_times.holidaytimes_opname)
     return json_response({'message': 'Vacation times deleted successfully'}, status=STATUS_OK)
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@conditional('quotas')
 def get_user_holiday_info(request):
     username = request.GET.get('opname')
     if not username:
         return json_response({'error': 'Missing opname parameter'}, status=STATUS_BAD_REQUEST)
-    holiday_info = HolidayTimes.objects.filter(holidaytimes_opname=username).order_by('-holidaytimes_addtime')
-    return json_response({'holiday_info': list(holiday_info.values())})
+    holiday_info = HolidayTimes.objects.filter(holidaytimes_opname=username)
+    return cached_list_response(request, username, [holiday_info], 'holiday_info',
+                                'holidaytimes_addtime', 'holidaytimes_id')
 
-def update_vacation_status(vacation_event, ispermit, operator, message):
-    if vacation_event.holidayevents_ispermit == 1:  # Check if it's pending
-        vacation_event.holidayevents_ispermit = ispermit
-        vacation_event.holidayevents_approval_user = operator
-        vacation_event.holidayevents_approval_opinion = message
-        vacation_event.holidayevents_permittime = str(int(time.time()))
-        vacation_event.save()
+@csrf_exempt
+@require_http_methods(["GET"])
+@conditional('quotas')
+def quota_balance(request):
+    # 额度流水中的余额（快照 + 之后的流水），应与 HolidayTimes 计数器一致
+    username = request.GET.get('username')
+    year = request.GET.get('year', str(timezone.localdate().year))
+    if not username:
+        return json_response({'error': 'Missing username parameter'}, status=STATUS_BAD_REQUEST)
+    if not year.isdigit():
+        return json_response({'error': f'Invalid year: {year}'}, status=STATUS_BAD_REQUEST)
+    return json_response({'username': username, 'year': int(year), **balance(username, int(year))})
 
-        # Update holiday_times if it's an annual leave and approved
-        if ispermit == 2 and vacation_event.holidayevents_htype == '年假':
-            holiday_times = get_object_or_404(HolidayTimes, holidaytimes_opname=vacation_event.holidayevents_hname, holidaytimes_year=current_year)
-            holiday_times.holidaytimes_days -= vacation_event.holidayevents_usedDay
-            holiday_times.holidaytimes_haddays += vacation_event.holidayevents_usedDay
-            holiday_times.save()
+@csrf_exempt
+@require_http_methods(["GET"])
+def user_cache_stats(request):
+    return json_response(user_cache.stats())
 
-# Function to fetch approval results from an external API
-def fetch_approval_results():
-    start_time = datetime.now()
-    end_time = start_time + timedelta(days=3)  # 3天后结束
+@csrf_exempt
+@require_http_methods(["GET"])
+def metrics(request):
+    # Prometheus 抓取: 各接口耗时 / SQL 次数与耗时 / 响应大小，审批轮询与 outbox 周期，外部 HTTP 调用
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# The two pending-queue views below are async so that an idle client is just a coroutine waiting
+# on its queue, not a thread; run them under main/asgi.py. csrf_exempt and require_http_methods
+# only learn to wrap async views in Django 5.0, hence the inline method check.
+
+def sse_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+async def pending_events(subscription, missed, position):
+    # ready/reset carry the current position; a client that gets reset reloads get_approve_vacation_list
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + stream_setting('MAX_DURATION', 300)
+    heartbeat = stream_setting('HEARTBEAT', 15)
+    try:
+        yield f"retry: {stream_setting('RETRY_MS', 3000)}\n\n"
+        if missed is None:
+            yield sse_event('reset', {}, position)
+        else:
+            yield sse_event('ready', {}, position)
+            for seq, message in missed:
+                yield sse_event(message['op'], message, pending_queue.event_id(seq))
+        # Streams end after MAX_DURATION and EventSource reconnects with Last-Event-ID: under Django
+        # 4.2 a disconnected client is only noticed when a write fails, which may be never
+        while (remaining := deadline - loop.time()) > 0:
+            item = await subscription.get(min(heartbeat, remaining))
+            if subscription.overflowed:
+                yield sse_event('reset', {})
+                return
+            if item is None:
+                yield ': keepalive\n\n'
+                continue
+            seq, message = item
+            yield sse_event(message['op'], message, pending_queue.event_id(seq))
+    finally:
+        pending_queue.unsubscribe(subscription)
+
+async def pending_stream(request):
+    # SSE: GET 后持续推送待审批队列的 added / removed 事件，断线重连时按 Last-Event-ID 补发
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    subscription, missed, position = pending_queue.subscribe(after)
+    response = StreamingHttpResponse(pending_events(subscription, missed, position),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
+
+async def pending_poll(request):
+    # 长轮询: 不带 after 时立即返回当前位置；带 after 时等到有新事件或超时（最多 LONG_POLL_TIMEOUT 秒）
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    max_timeout = stream_setting('LONG_POLL_TIMEOUT', 25)
+    try:
+        timeout = min(float(request.GET.get('timeout') or max_timeout), max_timeout)
+    except ValueError:
+        return json_response({'error': 'timeout must be a number'}, status=STATUS_BAD_REQUEST)
+    after = request.GET.get('after')
+    subscription, missed, position = pending_queue.subscribe(after)
+    try:
+        if missed is None:
+            return json_response({'reset': True, 'events': [], 'last_id': position})
+        if after is not None and not missed:
+            item = await subscription.get(timeout)
+            while item is not None:
+                missed.append(item)
+                item = subscription.get_nowait()
+        events = [dict(message, event_id=pending_queue.event_id(seq)) for seq, message in missed]
+        return json_response({'reset': False, 'events': events,
+                              'last_id': events[-1]['event_id'] if events else position})
+    finally:
+        pending_queue.unsubscribe(subscription)
 
-    while datetime.now() < end_time:
-        try:
-            # Retrieve all pending vacation events
-            pending_vacations = HolidayEvent.objects.filter(holidayevents_ispermit=1)
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_changes(request):
+    # 增量同步: ?since=<seq>&limit=[&consumer=hr-sync]，按 seq 顺序返回 upsert / delete 记录
+    # 带 consumer 时记录该消费方的位置，日志压缩会保留它还没读过的部分
+    try:
+        since = int(request.GET.get('since') or 0)
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError:
+        return json_response({'error': 'since and limit must be non-negative integers'}, status=STATUS_BAD_REQUEST)
+    if since < 0:
+        return json_response({'error': 'since and limit must be non-negative integers'}, status=STATUS_BAD_REQUEST)
+    consumer = request.GET.get('consumer')
+    if consumer:
+        record_consumer(consumer[:64], since)
+    try:
+        feed = changes_since(since, limit)
+    except ChangesCompacted as e:
+        return json_response({'error': str(e)}, status=STATUS_GONE)
+    return json_response(feed)
 
-            if not pending_vacations.exists():
-                # 如果没有待审批的记录，结束进程
-                break
+@csrf_exempt
+@require_http_methods(["GET"])
+@conditional('events')
+def team_calendar(request):
+    # ?start=2024-03-01&end=2024-03-31[&users=张三,李四][&include_pending=0]
+    try:
+        start = date.fromisoformat(request.GET.get('start', ''))
+        end = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        return json_response({'error': 'start and end must be YYYY-MM-DD'}, status=STATUS_BAD_REQUEST)
+    if end < start or (end - start).days > MAX_CALENDAR_DAYS:
+        return json_response({'error': f'Date range must be 0-{MAX_CALENDAR_DAYS} days'}, status=STATUS_BAD_REQUEST)
+
+    statuses = [2] if request.GET.get('include_pending') == '0' else [1, 2]
+    users = [u for u in request.GET.get('users', '').split(',') if u]
+    # Ranges reaching into archived (past) years also read leave_day_archive
+    sources = [LeaveDay, LeaveDayArchive] if start.year < hot_years() else [LeaveDay]
+    parts = []
+    for source in sources:
+        leave_days = source.objects.filter(
+            leaveday_date__range=(start, end),
+            leaveday_event__holidayevents_ispermit__in=statuses,
+        )
+        if users:
+            leave_days = leave_days.filter(leaveday_user__in=users)
+        parts.append(leave_days.order_by('leaveday_date', 'leaveday_user').values_list(
+            'leaveday_date', 'leaveday_user', 'leaveday_event_id',
+            'leaveday_event__holidayevents_htype', 'leaveday_event__holidayevents_ispermit',
+        ))
+
+    calendar = {}
+    for day, user, event_id, htype, ispermit in heapq.merge(*parts, key=lambda row: row[:2]):
+        calendar.setdefault(day.isoformat(), []).append(
+            {'username': user, 'vacation_id': event_id, 'leave_type': htype, 'ispermit': ispermit}
+        )
+    return json_response({'start': start.isoformat(), 'end': end.isoformat(), 'calendar': calendar})
 
-            for vacation_event in pending_vacations:
-                ticket_id = vacation_event.holidayevents_ticket_id  # 假设 ticket_id 存储在这个字段
+USAGE_GROUPS = {'user': 'usage_user', 'month': 'usage_month', 'htype': 'usage_htype', 'team': None}
 
-                # Call the external API with ticket_id
-                response = requests.get(f'http://external.api/approval_results?ticket_id={ticket_id}')
-                response_data = response.json()
+@csrf_exempt
+@require_http_methods(["GET"])
+@conditional('events')
+def leave_usage_report(request):
+    # ?year=2024[&month=4][&htype=年假][&username=张三][&group_by=team,month]，默认按假期类型汇总
+    # 只读 LeaveUsage 汇总表，耗时与历史记录多少无关; team 取自 LEAVE_STAFFING_TEAMS
+    try:
+        year = int(request.GET.get('year', ''))
+        month = int(request.GET['month']) if request.GET.get('month') else None
+    except ValueError:
+        return json_response({'error': 'year and month must be integers'}, status=STATUS_BAD_REQUEST)
+    group_by = [g for g in request.GET.get('group_by', 'htype').split(',') if g]
+    unknown = [g for g in group_by if g not in USAGE_GROUPS]
+    if unknown:
+        return json_response({'error': f'Unsupported group_by: {unknown[0]}'}, status=STATUS_BAD_REQUEST)
+
+    usage = LeaveUsage.objects.filter(usage_year=year)
+    if month is not None:
+        usage = usage.filter(usage_month=month)
+    if request.GET.get('htype'):
+        usage = usage.filter(usage_htype=request.GET['htype'])
+    if request.GET.get('username'):
+        usage = usage.filter(usage_user=request.GET['username'])
+
+    # team is resolved from usage_user after the query
+    fields = [USAGE_GROUPS[g] or 'usage_user' for g in group_by]
+    rows = usage.values(*dict.fromkeys(fields)).annotate(
+        pending_days=Sum('usage_pending_days'), approved_days=Sum('usage_approved_days'))
+    if 'team' in group_by:
+        teams = {}
+        for name, team in getattr(settings, 'LEAVE_STAFFING_TEAMS', {}).items():
+            for member in team.get('members', ()):
+                teams.setdefault(member, []).append(name)
+        totals = {}
+        for row in rows:
+            for team in teams.get(row['usage_user'], [None]):
+                key = tuple(team if g == 'team' else row[USAGE_GROUPS[g]] for g in group_by)
+                total = totals.setdefault(key, [0, 0])
+                total[0] += row['pending_days']
+                total[1] += row['approved_days']
+        rows = [dict(zip(group_by, key), pending_days=pending, approved_days=approved)
+                for key, (pending, approved) in totals.items()]
+    else:
+        rows = [dict({g: row[USAGE_GROUPS[g]] for g in group_by},
+                     pending_days=row['pending_days'], approved_days=row['approved_days']) for row in rows]
+    rows.sort(key=lambda row: tuple((row[g] is None, row[g]) for g in group_by))
+    # People in several teams appear under each of them, so the total is taken separately
+    total = usage.aggregate(pending_days=Sum('usage_pending_days'), approved_days=Sum('usage_approved_days'))
+    return json_response({
+        'year': year,
+        'month': month,
+        'group_by': group_by,
+        'rows': rows,
+        'total': {key: value or 0 for key, value in total.items()},
+    })
 
-                # Process each element in the response data
-                for element in response_data.get('data', []):
-                    if element.get('from_state_name') == '审批':
-                        action_name = element.get('action_name')
-                        message = element.get('message')
-                        operator = element.get('operator')
+@csrf_exempt
+@require_http_methods(["GET"])
+@conditional('calendar')
+def working_days(request):
+    # ?start=2024-10-01&end=2024-10-31 -> 区间内工作日天数; ?day=2024-10-08 -> 是否工作日
+    try:
+        if request.GET.get('day'):
+            day = date.fromisoformat(request.GET['day'])
+            return json_response({'day': day.isoformat(), 'is_working_day': workdays.calendar.is_working_day(day)})
+        start = date.fromisoformat(request.GET.get('start', ''))
+        end = date.fromisoformat(request.GET.get('end', ''))
+    except ValueError:
+        return json_response({'error': 'Dates must be YYYY-MM-DD'}, status=STATUS_BAD_REQUEST)
+    if end < start or (end - start).days > MAX_WORKING_DAYS_RANGE:
+        return json_response({'error': f'Date range must be 0-{MAX_WORKING_DAYS_RANGE} days'},
+                             status=STATUS_BAD_REQUEST)
+    return json_response({'start': start.isoformat(), 'end': end.isoformat(),
+                          'working_days': workdays.calendar.working_days_between(start, end)})
 
-                        # Determine ispermit value based on action_name
-                        ispermit = 2 if action_name == '同意' else 3 if action_name == '拒绝' else None
-                        if ispermit and vacation_event.holidayevents_ispermit != ispermit:
-                            update_vacation_status(vacation_event, ispermit, operator, message)
+def update_vacation_status(vacation_event, ispermit, operator, message):
+    # Returns True if this call decided the event, False if it was no longer pending.
+    # The status change and the quota change commit together; the conditional UPDATE makes
+    # concurrent approve/reject/revoke calls for the same event mutually exclusive.
+    permittime = timezone.now()
+    with transaction.atomic():
+        decided = HolidayEvent.objects.filter(
+            holidayevents_id=vacation_event.holidayevents_id, holidayevents_ispermit=1,
+        ).update(
+            holidayevents_ispermit=ispermit,
+            holidayevents_approval_user=operator,
+            holidayevents_approval_opinion=message,
+            holidayevents_permittime=permittime,
+        )
+        if not decided:
+            return False
+        log_keys(ChangeLog.TABLE_EVENT, [vacation_event.holidayevents_id])
+        publish_pending(pending_removed(vacation_event.holidayevents_id, ispermit))
+
+        # Annual leave: approval turns the reservation into used days, rejection gives it back
+        if vacation_event.holidayevents_htype == QUOTA_LEAVE_TYPE:
+            if ispermit == 2:
+                consume(vacation_event.holidayevents_hname, quota_year(vacation_event),
+                        vacation_event.holidayevents_usedDay, event_id=vacation_event.holidayevents_id)
+            else:
+                release(vacation_event.holidayevents_hname, quota_year(vacation_event),
+                        vacation_event.holidayevents_usedDay, event_id=vacation_event.holidayevents_id)
+        record_usage(vacation_event, pending=-1, approved=int(ispermit == 2))
+        data_changed(event_tables(vacation_event), vacation_event.holidayevents_hname)
+
+    vacation_event.holidayevents_ispermit = ispermit
+    vacation_event.holidayevents_approval_user = operator
+    vacation_event.holidayevents_approval_opinion = message
+    vacation_event.holidayevents_permittime = permittime
+    return True
+
+def verify_callback_signature(request):
+    # X-Approval-Signature: sha256=<hex HMAC of the raw body keyed with APPROVAL_CALLBACK_SECRET>
+    secret = getattr(settings, 'APPROVAL_CALLBACK_SECRET', '')
+    if not secret:
+        return False
+    expected = 'sha256=' + hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, request.headers.get('X-Approval-Signature', ''))
 
-            # Sleep for a specified interval before the next API call
-            time.sleep(60)  # 每60秒查询一次
-        except Exception as e:
-            print(f"Error fetching approval results: {e}")
+@csrf_exempt
+@require_http_methods(["POST"])
+def approval_callback(request):
+    # 审批系统回调: {ticket_id, action_name, operator, message}，或 {"events": [...]} 批量回调
+    if not verify_callback_signature(request):
+        return json_response({'error': 'Invalid signature'}, status=STATUS_UNAUTHORIZED)
+    try:
+        data = codec.loads(request.body)
+    except json.JSONDecodeError:
+        return json_response({'error': 'Invalid JSON'}, status=STATUS_BAD_REQUEST)
+    callbacks = data.get('events') if isinstance(data, dict) and 'events' in data else [data]
+    if not isinstance(callbacks, list) or not all(isinstance(c, dict) for c in callbacks):
+        return json_response({'error': 'Invalid callback payload'}, status=STATUS_BAD_REQUEST)
+
+    tickets = {str(c['ticket_id']) for c in callbacks if c.get('ticket_id')}
+    events = {event.runiuId: event for event in HolidayEvent.objects.filter(runiuId__in=tickets)}
+    results = []
+    with transaction.atomic():
+        for callback in callbacks:
+            ticket_id = str(callback.get('ticket_id') or '')
+            ispermit = APPROVAL_ACTIONS.get(callback.get('action_name'))
+            event = events.get(ticket_id)
+            if event is None:
+                result = 'unknown_ticket'
+            elif ispermit is None:
+                result = 'ignored'
+            elif event.holidayevents_ispermit != 1:
+                # Redelivered or already picked up by the poller
+                result = 'already_decided'
+            else:
+                try:
+                    with transaction.atomic():
+                        applied = update_vacation_status(event, ispermit, callback.get('operator') or '',
+                                                         callback.get('message') or '')
+                    result = 'applied' if applied else 'already_decided'
+                except QuotaError:
+                    result = 'quota_error'
+            results.append({'ticket_id': ticket_id, 'result': result})
+    return json_response({'results': results}, status=STATUS_OK)
 
-    # Start the fetching process in a separate thread
-    threading.Thread(target=fetch_approval_results, daemon=True).start()
-    return json_response({'message': 'Started fetching approval results'}, status=STATUS_OK)
+# Function to fetch approval results from an external API
+def fetch_approval_results():
+    # 轮询直到没有待审批记录为止；也可以用 manage.py poll_approvals 常驻运行
+    try:
+        ApprovalPoller(update_vacation_status, session=get_client().session).run_forever(stop_when_idle=True)
+    finally:
+        connection.close()
 
 def start_or_notify_approval_check():
     global approval_check_thread
@@ -372,3 +989,17 @@ def start_or_notify_approval_check():
         approval_check_thread.start()
 
 
+
+def process_workflow_outbox():
+    # 发送 outbox 中的建单请求，全部发送完成（或进入死信）后退出；也可以用 manage.py process_outbox 常驻运行
+    try:
+        OutboxWorker(create_workflow).run_forever(stop_when_idle=True)
+    finally:
+        connection.close()
+
+def start_or_notify_outbox_worker():
+    global outbox_worker_thread
+
+    if outbox_worker_thread is None or not outbox_worker_thread.is_alive():
+        outbox_worker_thread = threading.Thread(target=process_workflow_outbox, daemon=True)
+        outbox_worker_thread.start()
@@ -0,0 +1,111 @@
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import SpecialHoliday
+from .versions import stamps
+
+
+class YearCalendar:
+    """Working-day bitmap for one year plus running totals, so every lookup is O(1).
+
+    ``workday[i]`` is 1 if day ``i`` of the year (0 = Jan 1) is worked; ``before[i]`` is the
+    number of working days before it. Weekends are off unless listed as 调休上班, weekdays are
+    worked unless listed as 节假日.
+    """
+
+    def __init__(self, year, holidays=(), workdays=()):
+        self.year = year
+        self.first = date(year, 1, 1)
+        # Not date(year + 1, 1, 1): that doesn't exist for year 9999
+        length = (date(year, 12, 31) - self.first).days + 1
+        weekday = self.first.weekday()
+        self.workday = bytearray(1 if (weekday + i) % 7 < 5 else 0 for i in range(length))
+        for day in holidays:
+            self.workday[(day - self.first).days] = 0
+        for day in workdays:
+            self.workday[(day - self.first).days] = 1
+        self.before = array('H', [0]) * (length + 1)
+        for i, worked in enumerate(self.workday):
+            self.before[i + 1] = self.before[i] + worked
+        self.loaded_at = time.monotonic()
+
+    def is_working_day(self, day):
+        return bool(self.workday[(day - self.first).days])
+
+    def count(self, start, end):
+        # Working days in [start, end], both inside this year
+        return self.before[(end - self.first).days + 1] - self.before[(start - self.first).days]
+
+
+class WorkdayCalendar:
+    """Per-process cache of YearCalendar built from SpecialHoliday.
+
+    Saving or deleting a SpecialHoliday drops the affected year here; other processes pick the
+    change up after ``WORKDAY_CALENDAR_TTL`` seconds.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'WORKDAY_CALENDAR_TTL', 300)
+        self.years = {}
+        self.lock = threading.Lock()
+
+    def load(self, year):
+        holidays, workdays = [], []
+        rows = SpecialHoliday.objects.filter(specialholiday_day__year=year).values_list(
+            'specialholiday_day', 'specialholiday_type')
+        for day, kind in rows:
+            if kind == SpecialHoliday.TYPE_HOLIDAY:
+                holidays.append(day)
+            elif kind == SpecialHoliday.TYPE_WORKDAY:
+                workdays.append(day)
+        return YearCalendar(year, holidays, workdays)
+
+    def year(self, year):
+        calendar = self.years.get(year)
+        if calendar is None or time.monotonic() - calendar.loaded_at > self.ttl:
+            with self.lock:
+                calendar = self.years.get(year)
+                if calendar is None or time.monotonic() - calendar.loaded_at > self.ttl:
+                    calendar = self.years[year] = self.load(year)
+        return calendar
+
+    def invalidate(self, year=None):
+        with self.lock:
+            if year is None:
+                self.years.clear()
+            else:
+                self.years.pop(year, None)
+
+    def is_working_day(self, day):
+        return self.year(day.year).is_working_day(day)
+
+    def working_days_between(self, start, end):
+        """Working days from ``start`` to ``end`` inclusive; 0 if end < start."""
+        total = 0
+        while start <= end:
+            last = min(end, date(start.year, 12, 31))
+            total += self.year(start.year).count(start, last)
+            if last == end:
+                break
+            start = last + timedelta(days=1)
+        return total
+
+    def working_days_in(self, days):
+        return sum(1 for day in days if self.is_working_day(day))
+
+
+calendar = WorkdayCalendar()
+
+
+@receiver(post_save, sender=SpecialHoliday)
+@receiver(post_delete, sender=SpecialHoliday)
+def invalidate_workday_calendar(sender, instance, **kwargs):
+    # The row may have moved to another year, so drop everything rather than guess
+    calendar.invalidate()
+    stamps.bump('calendar')
@@ -0,0 +1,120 @@
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_jwt(expires_in):
+    # Unsigned: TokenCache only reads "exp"
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': time.time() + expires_in}).encode()).rstrip(b'=')
+    return f'stub.{payload.decode()}.stub'
+
+
+class WorkflowStub:
+    """Local stand-in for the whole workflow system, for load tests and the test suite.
+
+    Serves the token endpoint, ticket creation and approval lookups (single and ``ticket_ids=``
+    batches). Every request waits ``latency`` seconds; a ticket gets its decision (``同意`` with
+    probability ``approve_rate``, else ``拒绝``) on the ``decide_after``-th lookup, unless
+    ``decisions`` (ticket id -> action_name) fixes it up front. With ``fail`` set, lookups answer 500.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, decide_after=2, approve_rate=0.9, seed=0,
+                 decisions=None, fail=False):
+        self.latency = latency
+        self.decide_after = decide_after
+        self.approve_rate = approve_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.lookups = Counter()
+        self.decisions = dict(decisions or {})
+        self.fail = fail
+        self.requests = Counter()
+        self.tickets = count(1)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/approval_results':
+                    return self.reply(404, {})
+                stub.count('lookup')
+                if stub.fail:
+                    return self.reply(500, {})
+                query = parse_qs(url.query)
+                if 'ticket_ids' in query:
+                    tickets = query['ticket_ids'][0].split(',')
+                    return self.reply(200, {'data': {t: stub.elements(t) for t in tickets}})
+                return self.reply(200, {'data': stub.elements(query.get('ticket_id', [''])[0])})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path == '/api/token/':
+                    stub.count('token')
+                    return self.reply(200, {'access': fake_jwt(3600)})
+                if self.path == '/workflow/create':
+                    stub.count('create')
+                    ticket = next(stub.tickets)
+                    return self.reply(200, {'result': True, 'message': '',
+                                            'data': {'runiu_id': f'STUB{ticket}', 'task_id': f'TASK{ticket}'}})
+                self.reply(404, {})
+
+            def reply(self, status, body):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                payload = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://{host}:{self.server.server_port}'
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def elements(self, ticket_id):
+        with self.lock:
+            self.lookups[ticket_id] += 1
+            if ticket_id not in self.decisions and self.lookups[ticket_id] >= self.decide_after:
+                self.decisions[ticket_id] = '同意' if self.random.random() < self.approve_rate else '拒绝'
+            action = self.decisions.get(ticket_id)
+        if not action:
+            return [{'from_state_name': '提交', 'action_name': '提交'}]
+        return [{'from_state_name': '审批', 'action_name': action, 'operator': 'stub', 'message': 'load test'}]
+
+    def settings(self):
+        """Settings that point the app at this stub (for override_settings or settings.py)."""
+        return {
+            'WORKFLOW_TOKEN_URL': f'{self.base_url}/api/token/',
+            'WORKFLOW_CREATE_URL': f'{self.base_url}/workflow/create',
+            'APPROVAL_RESULTS_URL': f'{self.base_url}/approval_results',
+        }
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()